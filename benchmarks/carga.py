@@ -0,0 +1,283 @@
+"""Teste de carga da aplicação sobre um inventário sintético.
+
+Gera um banco com ``benchmarks/gerador.py`` (ou reaproveita ``--db``) e envia
+requisições para a aplicação real em um de dois modos:
+
+- ``local``: cliente de teste do Flask no mesmo processo, sem rede
+- ``http``: sobe o gunicorn com ``gunicorn.conf.py`` e dispara as requisições
+  de vários processos clientes ao mesmo tempo
+
+Para cada cenário mede requisições por segundo e latência p50/p95/p99. O
+resultado pode ser gravado em JSON (``--json``) e comparado com um resultado
+anterior (``--baseline``): queda de throughput ou aumento de p95 acima da
+``--tolerancia`` é regressão e o script sai com código 1.
+
+Uso:
+    python benchmarks/carga.py --lotes 100000 --json atual.json
+    python benchmarks/carga.py --lotes 100000 --baseline atual.json
+    python benchmarks/carga.py --modo http --processos 8 --cenarios contagem produto
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from benchmarks.gerador import LOTES_POR_PRODUTO, codigo_produto, gerar_inventario, nome_lote
+
+CENARIOS = ['contagem', 'produtos', 'produto', 'resumo', 'excel', 'pdf']
+
+# Nos relatórios o estoque é alterado antes de cada requisição (fora da
+# medição) para que o arquivo seja gerado de novo em vez de vir do cache
+RELATORIOS = {'excel', 'pdf'}
+
+
+def contagem_aleatoria(rnd, produtos):
+    return {
+        'produto_codigo': codigo_produto(rnd.randrange(produtos)),
+        'lote': nome_lote(rnd.randrange(LOTES_POR_PRODUTO)),
+        'validade_mes': rnd.randint(1, 12),
+        'validade_ano': 2030,
+        'quantidade': rnd.randint(1, 10)
+    }
+
+
+def requisicao(cenario, rnd, produtos):
+    """``(método, caminho, corpo JSON)`` da próxima requisição do cenário."""
+    if cenario == 'contagem':
+        return 'POST', '/contagem', contagem_aleatoria(rnd, produtos)
+    if cenario == 'produtos':
+        return 'GET', '/api/produtos?limit=100', None
+    if cenario == 'produto':
+        return 'GET', f'/produtos/{codigo_produto(rnd.randrange(produtos))}', None
+    if cenario == 'resumo':
+        return 'GET', '/relatorio/resumo', None
+    return 'GET', f'/relatorio/{cenario}', None
+
+
+def percentil(valores, p):
+    """Percentil ``p`` (0-100) pelo método do posto mais próximo."""
+    ordenados = sorted(valores)
+    if not ordenados:
+        return None
+    indice = max(0, min(len(ordenados) - 1, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[indice]
+
+
+def resumir(latencias, erros, segundos):
+    return {
+        'requisicoes': len(latencias),
+        'erros': erros,
+        'por_segundo': round(len(latencias) / segundos, 2) if segundos > 0 else None,
+        'p50_ms': round(percentil(latencias, 50) * 1000, 2),
+        'p95_ms': round(percentil(latencias, 95) * 1000, 2),
+        'p99_ms': round(percentil(latencias, 99) * 1000, 2),
+    }
+
+
+# ---------------------------------------------------------------- modo local
+
+def _total(cenario, requisicoes, relatorios):
+    return relatorios if cenario in RELATORIOS else requisicoes
+
+
+def executar_local(db_path, produtos, cenarios, requisicoes, relatorios):
+    os.environ['DATABASE_PATH'] = db_path
+    from src.main import app
+
+    client = app.test_client()
+    resultados = {}
+    for cenario in cenarios:
+        rnd = random.Random(cenario)
+        latencias, erros, medido = [], 0, 0.0
+        for _ in range(_total(cenario, requisicoes, relatorios)):
+            if cenario in RELATORIOS:
+                client.post('/contagem', json=contagem_aleatoria(rnd, produtos))
+            metodo, caminho, corpo = requisicao(cenario, rnd, produtos)
+            inicio = time.perf_counter()
+            resposta = client.open(caminho, method=metodo, json=corpo)
+            resposta.get_data()
+            latencia = time.perf_counter() - inicio
+            medido += latencia
+            latencias.append(latencia)
+            if resposta.status_code >= 300:
+                erros += 1
+        resultados[cenario] = resumir(latencias, erros, medido)
+    return resultados
+
+
+# ----------------------------------------------------------------- modo http
+
+def cliente_http(args):
+    porta, cenario, semente, total, produtos, invalidar, inicio = args
+    rnd = random.Random(semente)
+    conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=600)
+
+    def enviar(metodo, caminho, corpo):
+        dados = json.dumps(corpo).encode() if corpo is not None else None
+        cabecalhos = {'Content-Type': 'application/json'} if dados else {}
+        conexao.request(metodo, caminho, body=dados, headers=cabecalhos)
+        resposta = conexao.getresponse()
+        resposta.read()
+        return resposta.status
+
+    while time.time() < inicio:
+        time.sleep(0.001)
+
+    latencias, erros = [], 0
+    for _ in range(total):
+        if invalidar:
+            enviar('POST', '/contagem', contagem_aleatoria(rnd, produtos))
+        metodo, caminho, corpo = requisicao(cenario, rnd, produtos)
+        t0 = time.perf_counter()
+        status = enviar(metodo, caminho, corpo)
+        latencias.append(time.perf_counter() - t0)
+        if status >= 300:
+            erros += 1
+    conexao.close()
+    return latencias, erros
+
+
+def subir_servidor(db_path, porta, workers):
+    ambiente = dict(os.environ, DATABASE_PATH=db_path, PORT=str(porta), WEB_CONCURRENCY=str(workers))
+    servidor = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'src.main:app'],
+        cwd=RAIZ, env=ambiente, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if servidor.poll() is not None:
+            raise RuntimeError('gunicorn encerrou durante a inicialização')
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{porta}/relatorio/resumo', timeout=1).read()
+            return servidor
+        except OSError:
+            time.sleep(0.2)
+    servidor.terminate()
+    raise RuntimeError('gunicorn não respondeu em 60s')
+
+
+def executar_http(db_path, produtos, cenarios, requisicoes, relatorios, processos, workers, porta):
+    servidor = subir_servidor(db_path, porta, workers)
+    resultados = {}
+    try:
+        with multiprocessing.get_context('spawn').Pool(processos) as pool:
+            for cenario in cenarios:
+                por_cliente = max(1, _total(cenario, requisicoes, relatorios) // processos)
+                inicio = time.time() + 0.5
+                tarefas = [
+                    (porta, cenario, f'{cenario}-{i}', por_cliente, produtos, cenario in RELATORIOS, inicio)
+                    for i in range(processos)
+                ]
+                t0 = time.time()
+                respostas = pool.map(cliente_http, tarefas)
+                segundos = time.time() - max(t0, inicio)
+                latencias = [lat for lats, _ in respostas for lat in lats]
+                resultados[cenario] = resumir(latencias, sum(e for _, e in respostas), segundos)
+    finally:
+        servidor.terminate()
+        servidor.wait(30)
+    return resultados
+
+
+# ---------------------------------------------------------------- comparação
+
+def comparar(atual, baseline, tolerancia):
+    """Lista de regressões de ``atual`` em relação a ``baseline``."""
+    regressoes = []
+    for cenario, r in atual['cenarios'].items():
+        base = baseline.get('cenarios', {}).get(cenario)
+        if not base:
+            continue
+        if base['por_segundo'] and r['por_segundo'] < base['por_segundo'] * (1 - tolerancia):
+            regressoes.append(f"{cenario}: {r['por_segundo']}/s contra {base['por_segundo']}/s")
+        if base['p95_ms'] and r['p95_ms'] > base['p95_ms'] * (1 + tolerancia):
+            regressoes.append(f"{cenario}: p95 {r['p95_ms']}ms contra {base['p95_ms']}ms")
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lotes', type=int, default=10000, help='tamanho do inventário sintético (1k a 1M)')
+    parser.add_argument('--db', help='banco gerado anteriormente (padrão: gera um temporário)')
+    parser.add_argument('--modo', choices=['local', 'http'], default='local')
+    parser.add_argument('--cenarios', nargs='+', choices=CENARIOS, default=CENARIOS)
+    parser.add_argument('--requisicoes', type=int, default=2000, help='requisições por cenário da API')
+    parser.add_argument('--relatorios', type=int, default=3, help='requisições por cenário de relatório (excel, pdf)')
+    parser.add_argument('--processos', type=int, default=4, help='processos clientes no modo http')
+    parser.add_argument('--workers', type=int, default=2, help='workers do gunicorn no modo http')
+    parser.add_argument('--porta', type=int, default=18080)
+    parser.add_argument('--json', help='grava o resultado neste arquivo')
+    parser.add_argument('--baseline', help='resultado anterior para comparação')
+    parser.add_argument('--tolerancia', type=float, default=0.2, help='variação aceita antes de acusar regressão')
+    args = parser.parse_args()
+
+    if args.db and os.path.exists(args.db):
+        db_path = args.db
+        with sqlite3.connect(db_path) as conexao:
+            produtos = conexao.execute('SELECT COUNT(*) FROM produtos').fetchone()[0]
+            lotes = conexao.execute('SELECT COUNT(*) FROM lotes').fetchone()[0]
+        print(f'banco existente: {db_path} ({produtos} produtos, {lotes} lotes)')
+    else:
+        db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='estoque_carga_'), 'carga.db')
+        gerado = gerar_inventario(db_path, args.lotes)
+        produtos, lotes = gerado['produtos'], gerado['lotes']
+        print(f"banco gerado: {db_path} ({produtos} produtos, {lotes} lotes em {gerado['segundos']}s)")
+
+    if args.modo == 'local':
+        cenarios = executar_local(db_path, produtos, args.cenarios, args.requisicoes, args.relatorios)
+    else:
+        cenarios = executar_http(db_path, produtos, args.cenarios, args.requisicoes,
+                                 args.relatorios, args.processos, args.workers, args.porta)
+
+    resultado = {
+        'meta': {
+            'data': datetime.now().isoformat(timespec='seconds'),
+            'modo': args.modo,
+            'processos': args.processos if args.modo == 'http' else 1,
+            'produtos': produtos,
+            'lotes': lotes,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+        },
+        'cenarios': cenarios
+    }
+
+    print(f"{'cenário':<10} {'req':>6} {'erros':>6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for nome, r in cenarios.items():
+        print(f"{nome:<10} {r['requisicoes']:>6} {r['erros']:>6} {r['por_segundo']:>9} "
+              f"{r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        meta = baseline.get('meta', {})
+        if (meta.get('modo'), meta.get('lotes')) != (args.modo, lotes):
+            print(f"aviso: baseline com modo {meta.get('modo')} e {meta.get('lotes')} lotes")
+        regressoes = comparar(resultado, baseline, args.tolerancia)
+        if regressoes:
+            print('regressões:')
+            for regressao in regressoes:
+                print(f'  {regressao}')
+            sys.exit(1)
+        print('sem regressões em relação ao baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Teste de estresse de contagens simultâneas em um SQLite local.
+
+Vários processos, cada um com sua própria aplicação Flask e conexão, enviam
+contagens para ``POST /contagem`` (ou ``/contagem/batch``) nos mesmos lotes ao
+mesmo tempo. No final, a quantidade de cada lote no banco precisa ser igual à
+soma das quantidades enviadas; qualquer diferença é uma atualização perdida.
+
+Uso:
+    python benchmarks/contagem_concorrente.py --processos 8 --contagens 500 --lotes 20
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import select
+
+from src.models.user import db
+from src.models.produto import Produto
+from src.models.lote import Lote
+from src.models.esquema import preparar_esquema
+from src.routes.contagem import contagem_bp
+
+PRODUTOS = ['BENCH-1', 'BENCH-2']
+
+
+def criar_app(db_path, timeout):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': timeout}}
+    db.init_app(app)
+    app.register_blueprint(contagem_bp)
+    return app
+
+
+def gerar_contagens(semente, quantidade, lotes):
+    """Sequência determinística de contagens de um processo."""
+    rnd = random.Random(semente)
+    for _ in range(quantidade):
+        yield {
+            'produto_codigo': rnd.choice(PRODUTOS),
+            'lote': f'L{rnd.randrange(lotes)}',
+            'validade_mes': 12,
+            'validade_ano': 2030,
+            'quantidade': rnd.randint(1, 10)
+        }
+
+
+def trabalhador(args):
+    db_path, semente, quantidade, lotes, batch, timeout, inicio = args
+    app = criar_app(db_path, timeout)
+    client = app.test_client()
+    contagens = list(gerar_contagens(semente, quantidade, lotes))
+    falhas = 0
+
+    # Todos os processos começam juntos para maximizar a disputa
+    while time.time() < inicio:
+        time.sleep(0.001)
+
+    t0 = time.perf_counter()
+    if batch:
+        for i in range(0, len(contagens), batch):
+            resposta = client.post('/contagem/batch', json=contagens[i:i + batch])
+            if resposta.status_code != 200:
+                falhas += len(contagens[i:i + batch])
+            else:
+                falhas += resposta.get_json()['erros']
+    else:
+        for contagem in contagens:
+            resposta = client.post('/contagem', json=contagem)
+            if resposta.status_code not in (200, 201):
+                falhas += 1
+    return time.perf_counter() - t0, falhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processos', type=int, default=8)
+    parser.add_argument('--contagens', type=int, default=300, help='contagens por processo')
+    parser.add_argument('--lotes', type=int, default=10, help='lotes distintos por produto (menos lotes = mais disputa)')
+    parser.add_argument('--batch', type=int, default=0, help='usar /contagem/batch com N itens por requisição')
+    parser.add_argument('--timeout', type=float, default=5.0, help='timeout do sqlite3 (busy timeout) em segundos')
+    parser.add_argument('--db', help='arquivo SQLite (padrão: arquivo temporário)')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='estoque_bench_'), 'bench.db')
+    app = criar_app(db_path, args.timeout)
+    with app.app_context():
+        db.create_all()
+        preparar_esquema()
+        for codigo in PRODUTOS:
+            if not db.session.get(Produto, codigo):
+                db.session.add(Produto(codigo=codigo, nome=f'Produto {codigo}'))
+        db.session.query(Lote).filter(Lote.produto_codigo.in_(PRODUTOS)).delete()
+        db.session.commit()
+
+    esperado = Counter()
+    for semente in range(args.processos):
+        for contagem in gerar_contagens(semente, args.contagens, args.lotes):
+            esperado[(contagem['produto_codigo'], contagem['lote'])] += contagem['quantidade']
+
+    inicio = time.time() + 1.0
+    tarefas = [
+        (db_path, semente, args.contagens, args.lotes, args.batch, args.timeout, inicio)
+        for semente in range(args.processos)
+    ]
+    with multiprocessing.get_context('spawn').Pool(args.processos) as pool:
+        resultados = pool.map(trabalhador, tarefas)
+
+    with app.app_context():
+        obtido = Counter({
+            (codigo, lote): quantidade
+            for codigo, lote, quantidade in db.session.execute(
+                select(Lote.produto_codigo, Lote.lote, Lote.quantidade)
+                .where(Lote.produto_codigo.in_(PRODUTOS))
+            )
+        })
+
+    total = args.processos * args.contagens
+    duracao = max(tempo for tempo, _ in resultados)
+    falhas = sum(f for _, f in resultados)
+    divergentes = {chave for chave in esperado.keys() | obtido.keys() if esperado[chave] != obtido[chave]}
+
+    print(f'banco: {db_path}')
+    print(f'contagens: {total} em {duracao:.2f}s ({total / duracao:.0f}/s), falhas HTTP: {falhas}')
+    print(f'quantidade esperada: {sum(esperado.values())}, no banco: {sum(obtido.values())}')
+    if divergentes or falhas:
+        for chave in sorted(divergentes):
+            print(f'  {chave}: esperado {esperado[chave]}, no banco {obtido[chave]}')
+        print('FALHOU')
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Gera um inventário sintético (produtos e lotes) em um banco SQLite novo.
+
+Os dados são determinísticos para a mesma semente: produto ``i`` tem código
+``P{i:07d}`` e os lotes ``L0``..``L{n-1}``, o que permite aos benchmarks
+escolher produtos e lotes existentes sem consultar o banco.
+
+Uso:
+    python benchmarks/gerador.py /tmp/estoque.db --lotes 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+
+from src.models.user import db
+from src.models.produto import Produto
+from src.models.lote import Lote
+from src.models.versao import EstoqueVersao  # noqa: F401 (registra a tabela no metadata)
+from src.models.estoque_resumo import EstoqueProduto, EstoqueTotais  # noqa: F401
+from src.models.esquema import preparar_esquema
+
+LOTES_POR_PRODUTO = 5
+TAMANHO_BLOCO = 50000
+
+PALAVRAS = [
+    'Parafuso', 'Porca', 'Arruela', 'Válvula', 'Conexão', 'Mangueira', 'Registro', 'Cotovelo',
+    'Luva', 'Tê', 'Bucha', 'Adaptador', 'Abraçadeira', 'Fita', 'Cola', 'Solda', 'Tubo', 'Joelho',
+]
+ACABAMENTOS = ['inox', 'galvanizado', 'PVC', 'latão', 'cromado', 'nylon', 'aço carbono']
+
+
+def codigo_produto(indice):
+    return f'P{indice:07d}'
+
+
+def nome_lote(indice):
+    return f'L{indice}'
+
+
+def _produtos(total, rnd):
+    for i in range(total):
+        yield {
+            'codigo': codigo_produto(i),
+            'nome': f'{rnd.choice(PALAVRAS)} {rnd.choice(ACABAMENTOS)} {rnd.randint(1, 200)}mm'
+        }
+
+
+def _lotes(produtos, lotes_por_produto, rnd):
+    for i in range(produtos):
+        for j in range(lotes_por_produto):
+            yield {
+                'produto_codigo': codigo_produto(i),
+                'lote': nome_lote(j),
+                'validade_mes': rnd.randint(1, 12),
+                'validade_ano': rnd.randint(2025, 2030),
+                'quantidade': rnd.randint(0, 500)
+            }
+
+
+def _em_blocos(linhas, tamanho):
+    bloco = []
+    for linha in linhas:
+        bloco.append(linha)
+        if len(bloco) == tamanho:
+            yield bloco
+            bloco = []
+    if bloco:
+        yield bloco
+
+
+def gerar_inventario(db_path, lotes, lotes_por_produto=LOTES_POR_PRODUTO, semente=0):
+    """Cria ``db_path`` com ``lotes`` lotes distribuídos em ``lotes / lotes_por_produto`` produtos.
+
+    As linhas são inseridas antes dos triggers existirem; ``preparar_esquema``
+    calcula depois os totais e o índice de busca de uma vez. Retorna o número
+    de produtos e lotes gerados e o tempo gasto.
+    """
+    if os.path.exists(db_path):
+        raise FileExistsError(f'{db_path} já existe')
+    inicio = time.perf_counter()
+    rnd = random.Random(semente)
+    produtos = max(1, lotes // lotes_por_produto)
+
+    engine = create_engine(f'sqlite:///{db_path}')
+    db.metadata.create_all(engine)
+    with engine.begin() as conexao:
+        for bloco in _em_blocos(_produtos(produtos, rnd), TAMANHO_BLOCO):
+            conexao.execute(insert(Produto), bloco)
+        for bloco in _em_blocos(_lotes(produtos, lotes_por_produto, rnd), TAMANHO_BLOCO):
+            conexao.execute(insert(Lote), bloco)
+    preparar_esquema(engine)
+    engine.dispose()
+
+    return {
+        'produtos': produtos,
+        'lotes': produtos * lotes_por_produto,
+        'lotes_por_produto': lotes_por_produto,
+        'segundos': round(time.perf_counter() - inicio, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('db', help='arquivo SQLite a criar')
+    parser.add_argument('--lotes', type=int, default=10000)
+    parser.add_argument('--lotes-por-produto', type=int, default=LOTES_POR_PRODUTO)
+    parser.add_argument('--semente', type=int, default=0)
+    args = parser.parse_args()
+
+    r = gerar_inventario(args.db, args.lotes, args.lotes_por_produto, args.semente)
+    print(f"{r['produtos']} produtos e {r['lotes']} lotes gerados em {r['segundos']}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Mede o relatório PDF de estoque de 1 mil a 200 mil lotes.
+
+Para cada tamanho gera um inventário sintético (``gerador.py``) e, em um
+processo novo, lê os produtos do banco com ``iter_produtos_estoque`` e grava o
+PDF com ``escrever_pdf(..., paginado=True)``: o escritor paginado, que o
+relatório usa acima de ``LIMITE_TABELA_PDF`` linhas. Reporta o tempo, o custo
+por linha, o número de páginas e a memória residente máxima antes e depois de
+gerar o relatório: o tempo por linha deve ficar estável e a memória não deve
+crescer com o estoque.
+
+Uso:
+    python benchmarks/relatorio_pdf.py
+    python benchmarks/relatorio_pdf.py --tamanhos 1000 20000 --json pdf.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TAMANHOS = [1000, 5000, 20000, 50000, 100000, 200000]
+
+# Executado no processo filho: gera o PDF a partir do banco e devolve as medidas em JSON
+SCRIPT_MEDICAO = """
+import json, os, resource, sys, time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from src.services.relatorio_dados import iter_produtos_estoque
+from src.services.relatorio_pdf import escrever_pdf
+db_path, destino = sys.argv[1:3]
+engine = create_engine('sqlite:///' + db_path)
+rss_inicial = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+inicio = time.perf_counter()
+with Session(engine) as sessao:
+    paginas = escrever_pdf(iter_produtos_estoque(sessao), destino, paginado=True)
+segundos = time.perf_counter() - inicio
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'segundos': segundos, 'paginas': paginas, 'bytes': os.path.getsize(destino),
+                  'rss_inicial_mb': rss_inicial / 1024, 'rss_mb': rss_kb / 1024}))
+"""
+
+
+def medir(lotes, diretorio):
+    db_path = os.path.join(diretorio, f'estoque_{lotes}.db')
+    destino = os.path.join(diretorio, f'relatorio_{lotes}.pdf')
+    # O gerador roda em outro processo: o ru_maxrss do filho herda o pico do
+    # pai no fork, e gerar o inventário aqui inflaria a medida
+    subprocess.run([sys.executable, os.path.join(RAIZ, 'benchmarks', 'gerador.py'), db_path, '--lotes', str(lotes)],
+                   cwd=RAIZ, capture_output=True, check=True)
+    saida = subprocess.run(
+        [sys.executable, '-c', SCRIPT_MEDICAO, db_path, destino],
+        cwd=RAIZ, capture_output=True, text=True, check=True
+    )
+    resultado = json.loads(saida.stdout.strip().splitlines()[-1])
+    resultado['lotes'] = lotes
+    resultado['us_por_lote'] = resultado['segundos'] / lotes * 1e6
+    os.remove(db_path)
+    os.remove(destino)
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=TAMANHOS, help='quantidades de lotes')
+    parser.add_argument('--json', help='grava os resultados neste arquivo')
+    args = parser.parse_args()
+
+    resultados = []
+    print(f"{'lotes':>8} {'páginas':>8} {'segundos':>9} {'µs/lote':>8} {'MB pdf':>7} {'RSS ini':>8} {'RSS máx':>8}")
+    with tempfile.TemporaryDirectory(prefix='estoque_pdf_') as diretorio:
+        for lotes in args.tamanhos:
+            r = medir(lotes, diretorio)
+            resultados.append(r)
+            print(f"{r['lotes']:>8} {r['paginas']:>8} {r['segundos']:>9.2f} {r['us_por_lote']:>8.1f} "
+                  f"{r['bytes'] / 2**20:>7.1f} {r['rss_inicial_mb']:>8.1f} {r['rss_mb']:>8.1f}")
+
+    if len(resultados) > 1:
+        menor, maior = resultados[0], resultados[-1]
+        print(f"{maior['lotes'] / menor['lotes']:.0f}x mais lotes: "
+              f"{maior['segundos'] / menor['segundos']:.1f}x o tempo, "
+              f"RSS máximo {menor['rss_mb']:.1f} -> {maior['rss_mb']:.1f} MB")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""Compara o throughput de leitura e escrita dos perfis SQLite.
+
+Para cada perfil de ``src/models/perfil_sqlite.py`` cria um banco temporário
+com um catálogo sintético e mede:
+
+- escrita: contagens com commit individual (upsert de ``registrar_contagem``)
+- leitura: buscas de produto por código seguidas dos seus lotes
+- varredura: leitura completa do estoque usada pelos relatórios
+- concorrente: processos escritores e leitores simultâneos por alguns segundos
+
+Uso:
+    python benchmarks/sqlite_perfis.py --produtos 5000 --escritas 2000
+    python benchmarks/sqlite_perfis.py --perfis legado padrao --json resultado.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from src.models.user import db
+from src.models.produto import Produto
+from src.models.lote import Lote
+from src.models.esquema import preparar_esquema
+from src.models.perfil_sqlite import PERFIS, carregar_perfil, configurar_sqlite
+from src.services.contagem import upsert_lote
+from src.services.relatorio_dados import iter_linhas_estoque
+
+
+def abrir_engine(db_path, perfil):
+    return configurar_sqlite(create_engine(f'sqlite:///{db_path}'), perfil)
+
+
+def popular(engine, produtos, lotes_por_produto):
+    db.metadata.create_all(engine)
+    preparar_esquema(engine)
+    with engine.begin() as conexao:
+        conexao.execute(insert(Produto), [
+            {'codigo': f'P{i:07d}', 'nome': f'Produto sintético {i}'} for i in range(produtos)
+        ])
+        conexao.execute(insert(Lote), [
+            {
+                'produto_codigo': f'P{i:07d}', 'lote': f'L{j}', 'validade_mes': 1 + j % 12,
+                'validade_ano': 2030, 'quantidade': j
+            }
+            for i in range(produtos) for j in range(lotes_por_produto)
+        ])
+
+
+def medir_escrita(engine, produtos, total):
+    rnd = random.Random(1)
+    inicio = time.perf_counter()
+    with Session(engine) as sessao:
+        for _ in range(total):
+            upsert_lote(sessao, f'P{rnd.randrange(produtos):07d}', f'L{rnd.randrange(5)}', 1, 2030, 1)
+            sessao.commit()
+    return total / (time.perf_counter() - inicio)
+
+
+def medir_leitura(engine, produtos, total):
+    rnd = random.Random(2)
+    inicio = time.perf_counter()
+    with Session(engine) as sessao:
+        for _ in range(total):
+            codigo = f'P{rnd.randrange(produtos):07d}'
+            sessao.get(Produto, codigo)
+            sessao.execute(select(Lote).where(Lote.produto_codigo == codigo)).all()
+            sessao.expunge_all()
+    return total / (time.perf_counter() - inicio)
+
+
+def medir_varredura(engine):
+    inicio = time.perf_counter()
+    with Session(engine) as sessao:
+        linhas = sum(1 for _ in iter_linhas_estoque(sessao))
+    return linhas / (time.perf_counter() - inicio)
+
+
+def trabalhador_concorrente(args):
+    db_path, perfil, produtos, escritor, duracao, semente = args
+    engine = abrir_engine(db_path, perfil)
+    rnd = random.Random(semente)
+    operacoes = erros = 0
+    fim = time.monotonic() + duracao
+    with Session(engine) as sessao:
+        while time.monotonic() < fim:
+            codigo = f'P{rnd.randrange(produtos):07d}'
+            try:
+                if escritor:
+                    upsert_lote(sessao, codigo, f'L{rnd.randrange(5)}', 1, 2030, 1)
+                    sessao.commit()
+                else:
+                    sessao.execute(select(Lote).where(Lote.produto_codigo == codigo)).all()
+                    sessao.rollback()
+                operacoes += 1
+            except Exception:
+                sessao.rollback()
+                erros += 1
+    engine.dispose()
+    return escritor, operacoes, erros
+
+
+def medir_concorrente(db_path, perfil, produtos, processos, duracao):
+    tarefas = [
+        (db_path, perfil, produtos, i % 2 == 0, duracao, i) for i in range(processos)
+    ]
+    with multiprocessing.get_context('spawn').Pool(processos) as pool:
+        resultados = pool.map(trabalhador_concorrente, tarefas)
+    escritas = sum(ops for escritor, ops, _ in resultados if escritor)
+    leituras = sum(ops for escritor, ops, _ in resultados if not escritor)
+    return {
+        'escritas_por_s': escritas / duracao,
+        'leituras_por_s': leituras / duracao,
+        'erros': sum(erros for _, _, erros in resultados)
+    }
+
+
+def executar_perfil(nome, args):
+    perfil = carregar_perfil(nome, ambiente={})
+    diretorio = tempfile.mkdtemp(prefix=f'estoque_{nome}_')
+    db_path = os.path.join(diretorio, 'bench.db')
+    engine = abrir_engine(db_path, perfil)
+    popular(engine, args.produtos, args.lotes)
+
+    resultado = {
+        'perfil': nome,
+        'pragmas': perfil,
+        'escritas_por_s': medir_escrita(engine, args.produtos, args.escritas),
+        'leituras_por_s': medir_leitura(engine, args.produtos, args.leituras),
+        'linhas_varridas_por_s': medir_varredura(engine),
+    }
+    engine.dispose()
+    resultado['concorrente'] = medir_concorrente(db_path, perfil, args.produtos, args.processos, args.duracao)
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--perfis', nargs='+', default=list(PERFIS), choices=list(PERFIS))
+    parser.add_argument('--produtos', type=int, default=5000)
+    parser.add_argument('--lotes', type=int, default=3, help='lotes por produto')
+    parser.add_argument('--escritas', type=int, default=1000)
+    parser.add_argument('--leituras', type=int, default=5000)
+    parser.add_argument('--processos', type=int, default=4, help='processos no teste concorrente')
+    parser.add_argument('--duracao', type=float, default=3.0, help='segundos do teste concorrente')
+    parser.add_argument('--json', help='grava os resultados neste arquivo')
+    args = parser.parse_args()
+
+    resultados = []
+    print(f"{'perfil':<8} {'escritas/s':>11} {'leituras/s':>11} {'varredura/s':>12} "
+          f"{'conc. esc/s':>12} {'conc. leit/s':>13} {'erros':>6}")
+    for nome in args.perfis:
+        r = executar_perfil(nome, args)
+        resultados.append(r)
+        c = r['concorrente']
+        print(f"{nome:<8} {r['escritas_por_s']:>11.0f} {r['leituras_por_s']:>11.0f} "
+              f"{r['linhas_varridas_por_s']:>12.0f} {c['escritas_por_s']:>12.0f} "
+              f"{c['leituras_por_s']:>13.0f} {c['erros']:>6}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
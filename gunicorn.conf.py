@@ -0,0 +1,32 @@
+import os
+
+# Carrega a aplicação uma vez no processo mestre; os workers são criados por
+# fork e compartilham essas páginas de memória (copy-on-write)
+preload_app = True
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '10000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# Com mais de uma thread por worker (gthread) as contagens write-behind de
+# requisições simultâneas entram no mesmo group commit
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+
+# Com GUNICORN_PRELOAD_RELATORIOS=1 as bibliotecas de relatório também são
+# carregadas no mestre: a importação acontece uma vez e a memória é
+# compartilhada, ao custo de um processo mestre maior
+if os.environ.get('GUNICORN_PRELOAD_RELATORIOS') == '1':
+    def on_starting(server):
+        import pandas  # noqa: F401
+        import openpyxl  # noqa: F401
+        import reportlab.platypus  # noqa: F401
+
+
+def post_fork(server, worker):
+    # Conexões SQLite abertas pelo mestre (create_all, preparar_esquema e, nos
+    # depósitos, configurar_depositos/preparar_depositos, com o ATTACH do
+    # catálogo) não podem ser usadas pelos filhos: cada worker descarta o pool
+    # de todos os engines, o principal e os dos depósitos, e abre os seus
+    from src.main import app, db
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
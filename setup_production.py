@@ -1,12 +1,11 @@
 import os
 import sys
-import pandas as pd
 
 # Adiciona a pasta src ao path para importar o main.py
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
 from main import app, db
-from src.models.produto import Produto
+from src.services.importacao import importar_catalogo
 
 
 # Caminho do arquivo Excel
@@ -15,19 +14,11 @@ EXCEL_PATH = os.path.join(os.path.dirname(__file__), 'produtos.xlsx')
 with app.app_context():
     db.create_all()
 
-    # Lê o arquivo Excel (sem cabeçalho)
-    df = pd.read_excel(EXCEL_PATH, header=None)
+    # Lê o arquivo Excel (sem cabeçalho) e grava só produtos novos ou alterados
+    resultado = importar_catalogo(EXCEL_PATH, cabecalho=None)
 
-    for _, row in df.iterrows():
-        codigo = str(row[0]).strip()
-        nome = str(row[1]).strip()
-
-        if not Produto.query.filter_by(codigo=codigo).first():
-            db.session.add(Produto(
-                codigo=codigo,
-                nome=nome
-            ))
-
-    db.session.commit()
-
-print("✅ Importação concluída com sucesso!")
+print(
+    f"✅ Importação concluída em {resultado['segundos']}s: "
+    f"{resultado['inseridos']} inseridos, {resultado['atualizados']} atualizados, "
+    f"{resultado['inalterados']} inalterados, {resultado['descartados']} linhas descartadas"
+)
@@ -1,4 +1,3 @@
-import pandas as pd
 import sys
 import os
 
@@ -6,8 +5,7 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from src.main import app
-from src.models.produto import Produto
-from src.models.user import db
+from src.services.importacao import importar_catalogo
 
 def init_produtos():
     """Inicializa a base de dados com os produtos do arquivo Excel"""
@@ -16,28 +14,15 @@ def init_produtos():
     excel_file = '/home/ubuntu/upload/produtos(1).xlsx'
     
     try:
-        # Ler o arquivo Excel
-        df = pd.read_excel(excel_file)
-        
         with app.app_context():
-            # Limpar produtos existentes (opcional)
-            Produto.query.delete()
-            
-            # Inserir produtos do Excel
-            for _, row in df.iterrows():
-                # As colunas são a primeira e segunda do DataFrame
-                codigo = str(row.iloc[0])  # Primeira coluna
-                nome = str(row.iloc[1])    # Segunda coluna
-                
-                produto = Produto(
-                    codigo=codigo,
-                    nome=nome
-                )
-                db.session.add(produto)
-            
-            # Salvar mudanças
-            db.session.commit()
-            print(f"Produtos inicializados com sucesso! Total: {len(df)} produtos.")
+            # Substitui o catálogo pelo da planilha (primeira linha é cabeçalho;
+            # código e nome são a primeira e a segunda coluna)
+            resultado = importar_catalogo(excel_file, cabecalho=0, substituir=True)
+            print(
+                f"Produtos inicializados com sucesso em {resultado['segundos']}s! "
+                f"Inseridos: {resultado['inseridos']}, atualizados: {resultado['atualizados']}, "
+                f"inalterados: {resultado['inalterados']}, removidos: {resultado['removidos']}."
+            )
             
     except Exception as e:
         print(f"Erro ao inicializar produtos: {str(e)}")
@@ -3,17 +3,37 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+from flask import Flask
 from flask_cors import CORS
 from src.models.user import db
 from src.models.produto import Produto
 from src.models.lote import Lote
+from src.models.versao import EstoqueVersao
+from src.models.confirmacao import ConfirmacaoContagem
+from src.models.sincronizacao import RemocaoSync
+from src.models.snapshot import Snapshot, SnapshotLote
+from src.models.esquema import preparar_esquema
+from src.models.perfil_sqlite import carregar_perfil, configurar_sqlite
 from src.routes.user import user_bp
 from src.routes.produto import produto_bp
 from src.routes.contagem import contagem_bp
 from src.routes.relatorio import relatorio_bp
+from src.routes.importacao import importacao_bp
+from src.routes.metricas import metricas_bp
+from src.routes.sincronizacao import sync_bp
+from src.routes.snapshot import snapshot_bp
+from src.routes.conciliacao import conciliacao_bp
+from src.services.depositos import (
+    binds_depositos, configurar_depositos, fechar_sessoes, ler_depositos, preparar_depositos
+)
+from src.services.estaticos import ArquivosEstaticos
+from src.services.metricas import instrumentar
+from src.services.relatorio_jobs import DIRETORIO_PADRAO
 
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+# Os arquivos do frontend são servidos pelo manifesto em memória (ver
+# services/estaticos.py), não pela rota /static padrão do Flask
+app = Flask(__name__, static_folder=None)
+estaticos = ArquivosEstaticos(os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
 
 # Habilitar CORS para permitir acesso do frontend
@@ -23,37 +43,92 @@ app.register_blueprint(user_bp)
 app.register_blueprint(produto_bp)
 app.register_blueprint(contagem_bp)
 app.register_blueprint(relatorio_bp)
+app.register_blueprint(importacao_bp)
+app.register_blueprint(metricas_bp)
+app.register_blueprint(sync_bp)
+app.register_blueprint(snapshot_bp)
+app.register_blueprint(conciliacao_bp)
 
-import os
-
-db_dir = "/opt/render/project/src/database"
+# Caminho do banco configurável pelo ambiente (padrão: disco persistente do Render)
+db_path = os.path.abspath(os.environ.get('DATABASE_PATH', '/opt/render/project/src/database/app.db'))
+db_dir = os.path.dirname(db_path)
 os.makedirs(db_dir, exist_ok=True)  # cria a pasta se não existir
 
-db_path = os.path.join(db_dir, 'app.db')
 app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+# Depósitos: o banco principal tem o catálogo e os lotes de DEPOSITO_PADRAO;
+# cada depósito de DEPOSITOS (separados por vírgula) guarda os seus lotes em
+# DEPOSITOS_DIR/deposito_<nome>.db (ver services/depositos.py)
+app.config['DEPOSITO_PADRAO'] = os.environ.get('DEPOSITO_PADRAO', 'principal').strip().lower()
+app.config['DEPOSITOS'] = ler_depositos(os.environ.get('DEPOSITOS', ''), app.config['DEPOSITO_PADRAO'])
+depositos_dir = os.environ.get('DEPOSITOS_DIR', db_dir)
+os.makedirs(depositos_dir, exist_ok=True)
+app.config['SQLALCHEMY_BINDS'] = binds_depositos(app.config['DEPOSITOS'], depositos_dir)
+# Perfil de PRAGMAs do SQLite (SQLITE_PERFIL=padrao|seguro|legado, ver perfil_sqlite.py)
+app.config['SQLITE_PERFIL'] = carregar_perfil()
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# Fila de relatórios em segundo plano (PDF/Excel)
+app.config['RELATORIO_JOBS_DIR'] = os.environ.get('RELATORIO_JOBS_DIR', DIRETORIO_PADRAO)
+app.config['RELATORIO_WORKERS'] = int(os.environ.get('RELATORIO_WORKERS', 2))
+app.config['RELATORIO_JOB_TTL'] = int(os.environ.get('RELATORIO_JOB_TTL', 900))
+# Espera do GET /relatorio/<formato> (e de cada redirect para o download do
+# job) pelo arquivo. Fica bem abaixo do timeout do worker do gunicorn, que
+# mataria a requisição antes
+app.config['RELATORIO_TIMEOUT_ESPERA'] = min(
+    int(os.environ.get('RELATORIO_TIMEOUT_ESPERA', 5)),
+    int(os.environ.get('GUNICORN_TIMEOUT', 120)) // 2
+)
+app.config['RELATORIO_CACHE_MAX_BYTES'] = int(os.environ.get('RELATORIO_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# Contagens write-behind: POST /contagem enfileira e grava em group commits
+# (no máximo CONTAGEM_GRUPO_MAX itens ou CONTAGEM_GRUPO_MS ms por commit).
+# Com CONTAGEM_DURAVEL a resposta espera o commit (por requisição: ?aguardar=1)
+app.config['CONTAGEM_WRITE_BEHIND'] = os.environ.get('CONTAGEM_WRITE_BEHIND') == '1'
+app.config['CONTAGEM_DURAVEL'] = os.environ.get('CONTAGEM_DURAVEL') == '1'
+app.config['CONTAGEM_TIMEOUT_ESPERA'] = int(os.environ.get('CONTAGEM_TIMEOUT_ESPERA', 30))
+app.config['CONTAGEM_GRUPO_MAX'] = int(os.environ.get('CONTAGEM_GRUPO_MAX', 500))
+app.config['CONTAGEM_GRUPO_MS'] = int(os.environ.get('CONTAGEM_GRUPO_MS', 2))
+app.config['CONTAGEM_FILA_MAX'] = int(os.environ.get('CONTAGEM_FILA_MAX', 10000))
+app.config['CONTAGEM_ACK_TTL'] = int(os.environ.get('CONTAGEM_ACK_TTL', 3600))
+# Segundos em que um ack ainda não gravado é dado como pendente por qualquer
+# worker (antes do commit ele só existe na fila do worker que o recebeu)
+app.config['CONTAGEM_ACK_PENDENTE'] = int(os.environ.get('CONTAGEM_ACK_PENDENTE', 60))
+# Cache LRU dos produtos consultados pelo código (0 desliga); TTL em segundos
+app.config['PRODUTO_CACHE_MAX'] = int(os.environ.get('PRODUTO_CACHE_MAX', 10000))
+app.config['PRODUTO_CACHE_TTL'] = int(os.environ.get('PRODUTO_CACHE_TTL', 300))
+# Deltas seguidos antes de um snapshot voltar a ser gravado completo
+app.config['SNAPSHOT_CHECKPOINT'] = int(os.environ.get('SNAPSHOT_CHECKPOINT', 10))
+# Requisições acima deste tempo (ms) vão para o log com as consultas SQL (0 desliga)
+app.config['METRICAS_LENTO_MS'] = float(os.environ.get('METRICAS_LENTO_MS', 0))
 db.init_app(app)
+app.teardown_appcontext(fechar_sessoes)
 
 with app.app_context():
+    configurar_sqlite(db.engine, app.config['SQLITE_PERFIL'])
+    instrumentar(app, db.engine, db.Model)
+    configurar_depositos(app)
     db.create_all()
+    preparar_esquema()
+    preparar_depositos(app)
+
+
+@app.route('/static/<path:path>')
+def serve_static(path):
+    resposta = estaticos.resposta(path)
+    if resposta is None:
+        return "Not found", 404
+    return resposta
 
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-            return "Static folder not configured", 404
-
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
-        else:
-            return "index.html not found", 404
-
+    # Arquivo da raiz do build (favicon etc.) ou, para as rotas do SPA, o index.html
+    resposta = estaticos.resposta(path) if path else None
+    if resposta is None:
+        resposta = estaticos.resposta('index.html')
+    if resposta is None:
+        return "index.html not found", 404
+    return resposta
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
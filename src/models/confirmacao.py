@@ -0,0 +1,21 @@
+from src.models.user import db
+from datetime import datetime
+
+class ConfirmacaoContagem(db.Model):
+    """Resultado de uma contagem gravada pela fila write-behind, consultado pelo ack"""
+    __tablename__ = 'contagem_confirmacoes'
+    
+    ack = db.Column(db.String(40), primary_key=True)
+    status = db.Column(db.String(20), nullable=False)
+    erro = db.Column(db.String(200))
+    lote_id = db.Column(db.Integer)
+    gravado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    
+    def to_dict(self):
+        return {
+            'ack': self.ack,
+            'status': self.status,
+            'error': self.erro,
+            'lote_id': self.lote_id,
+            'gravado_em': self.gravado_em.strftime('%d/%m/%Y %H:%M:%S')
+        }
@@ -0,0 +1,316 @@
+import re
+
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError
+
+from src.models.user import db
+from src.models.lote import EXPRESSAO_VALIDADE_CHAVE
+from src.models.versao import EstoqueVersao
+from src.models.estoque_resumo import EstoqueProduto, EstoqueTotais
+from src.models.sincronizacao import RemocaoSync
+
+# Triggers que incrementam a versão do estoque em toda escrita. Ficam no banco
+# para valer também para escritas fora do ORM (upserts em lote, importações).
+# A nova versão é gravada no ``seq`` da linha e, nas remoções, em uma lápide
+# de ``sync_remocoes``: o /sync devolve tudo com ``seq`` maior que o do cliente.
+# Os UPDATEs só disparam pelas colunas de dados, então a gravação do próprio
+# ``seq`` não dispara nenhum trigger.
+_PROXIMA_VERSAO = 'UPDATE estoque_versao SET versao = versao + 1 WHERE id = 1;'
+_VERSAO_ATUAL = '(SELECT versao FROM estoque_versao WHERE id = 1)'
+
+# tabela -> (coluna usada como chave da lápide, colunas de dados)
+COLUNAS_SYNC = {
+    'produtos': ('codigo', ['codigo', 'nome']),
+    'lotes': ('id', ['produto_codigo', 'lote', 'validade_mes', 'validade_ano', 'quantidade', 'data_cadastro']),
+}
+
+
+def _triggers_versao(tabela, chave, colunas):
+    marcar_seq = f'UPDATE {tabela} SET seq = {_VERSAO_ATUAL} WHERE rowid = new.rowid;'
+    return [
+        (f'{tabela}_insert_versao', f"""
+            CREATE TRIGGER {tabela}_insert_versao AFTER INSERT ON {tabela}
+            BEGIN
+                {_PROXIMA_VERSAO}
+                {marcar_seq}
+                DELETE FROM sync_remocoes WHERE tabela = '{tabela}' AND chave = CAST(new.{chave} AS TEXT);
+            END
+        """),
+        (f'{tabela}_update_versao', f"""
+            CREATE TRIGGER {tabela}_update_versao AFTER UPDATE OF {', '.join(colunas)} ON {tabela}
+            BEGIN
+                {_PROXIMA_VERSAO}
+                {marcar_seq}
+                INSERT OR REPLACE INTO sync_remocoes (tabela, chave, seq)
+                SELECT '{tabela}', CAST(old.{chave} AS TEXT), {_VERSAO_ATUAL} WHERE old.{chave} IS NOT new.{chave};
+            END
+        """),
+        (f'{tabela}_delete_versao', f"""
+            CREATE TRIGGER {tabela}_delete_versao AFTER DELETE ON {tabela}
+            BEGIN
+                {_PROXIMA_VERSAO}
+                INSERT OR REPLACE INTO sync_remocoes (tabela, chave, seq)
+                VALUES ('{tabela}', CAST(old.{chave} AS TEXT), {_VERSAO_ATUAL});
+            END
+        """),
+    ]
+
+
+TRIGGERS_VERSAO = [
+    trigger
+    for tabela, (chave, colunas) in COLUNAS_SYNC.items()
+    for trigger in _triggers_versao(tabela, chave, colunas)
+]
+
+
+# Triggers que mantêm os totais materializados do estoque na mesma transação
+# da escrita: ``lotes`` alimenta ``estoque_produtos`` e este alimenta a linha
+# única de ``estoque_totais``.
+_SOMAR_PRODUTO = """
+    INSERT INTO estoque_produtos (produto_codigo, quantidade_total, total_lotes)
+    VALUES (new.produto_codigo, new.quantidade, 1)
+    ON CONFLICT (produto_codigo) DO UPDATE SET
+        quantidade_total = quantidade_total + excluded.quantidade_total,
+        total_lotes = total_lotes + 1;
+"""
+_SUBTRAIR_PRODUTO = """
+    UPDATE estoque_produtos
+    SET quantidade_total = quantidade_total - old.quantidade, total_lotes = total_lotes - 1
+    WHERE produto_codigo = old.produto_codigo;
+"""
+
+TRIGGERS_RESUMO = [
+    ('lotes_insert_resumo', f"""
+        CREATE TRIGGER lotes_insert_resumo AFTER INSERT ON lotes
+        BEGIN {_SOMAR_PRODUTO} END
+    """),
+    ('lotes_delete_resumo', f"""
+        CREATE TRIGGER lotes_delete_resumo AFTER DELETE ON lotes
+        BEGIN {_SUBTRAIR_PRODUTO} END
+    """),
+    ('lotes_update_resumo', f"""
+        CREATE TRIGGER lotes_update_resumo AFTER UPDATE OF quantidade, produto_codigo ON lotes
+        BEGIN {_SUBTRAIR_PRODUTO} {_SOMAR_PRODUTO} END
+    """),
+    ('estoque_produtos_insert_totais', """
+        CREATE TRIGGER estoque_produtos_insert_totais AFTER INSERT ON estoque_produtos
+        BEGIN
+            UPDATE estoque_totais SET
+                quantidade_total = quantidade_total + new.quantidade_total,
+                total_lotes = total_lotes + new.total_lotes,
+                produtos_com_estoque = produtos_com_estoque + (new.quantidade_total > 0)
+            WHERE id = 1;
+        END
+    """),
+    ('estoque_produtos_update_totais', """
+        CREATE TRIGGER estoque_produtos_update_totais AFTER UPDATE ON estoque_produtos
+        BEGIN
+            UPDATE estoque_totais SET
+                quantidade_total = quantidade_total + new.quantidade_total - old.quantidade_total,
+                total_lotes = total_lotes + new.total_lotes - old.total_lotes,
+                produtos_com_estoque = produtos_com_estoque
+                    + (new.quantidade_total > 0) - (old.quantidade_total > 0)
+            WHERE id = 1;
+        END
+    """),
+    ('estoque_produtos_delete_totais', """
+        CREATE TRIGGER estoque_produtos_delete_totais AFTER DELETE ON estoque_produtos
+        BEGIN
+            UPDATE estoque_totais SET
+                quantidade_total = quantidade_total - old.quantidade_total,
+                total_lotes = total_lotes - old.total_lotes,
+                produtos_com_estoque = produtos_com_estoque - (old.quantidade_total > 0)
+            WHERE id = 1;
+        END
+    """),
+    ('produtos_insert_totais', """
+        CREATE TRIGGER produtos_insert_totais AFTER INSERT ON produtos
+        BEGIN
+            UPDATE estoque_totais SET total_produtos = total_produtos + 1 WHERE id = 1;
+        END
+    """),
+    ('produtos_delete_totais', """
+        CREATE TRIGGER produtos_delete_totais AFTER DELETE ON produtos
+        BEGIN
+            UPDATE estoque_totais SET total_produtos = total_produtos - 1 WHERE id = 1;
+        END
+    """),
+]
+
+# Índice FTS5 de busca por código e nome. ``remove_diacritics 2`` faz a busca
+# ignorar acentos e ``prefix`` acelera as buscas por prefixo curto.
+DDL_BUSCA = """
+    CREATE VIRTUAL TABLE produtos_fts USING fts5(
+        codigo, nome,
+        content='produtos', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+"""
+
+TRIGGERS_BUSCA = [
+    ('produtos_insert_busca', """
+        CREATE TRIGGER produtos_insert_busca AFTER INSERT ON produtos
+        BEGIN
+            INSERT INTO produtos_fts (rowid, codigo, nome) VALUES (new.rowid, new.codigo, new.nome);
+        END
+    """),
+    ('produtos_delete_busca', """
+        CREATE TRIGGER produtos_delete_busca AFTER DELETE ON produtos
+        BEGIN
+            INSERT INTO produtos_fts (produtos_fts, rowid, codigo, nome) VALUES ('delete', old.rowid, old.codigo, old.nome);
+        END
+    """),
+    ('produtos_update_busca', """
+        CREATE TRIGGER produtos_update_busca AFTER UPDATE OF codigo, nome ON produtos
+        BEGIN
+            INSERT INTO produtos_fts (produtos_fts, rowid, codigo, nome) VALUES ('delete', old.rowid, old.codigo, old.nome);
+            INSERT INTO produtos_fts (rowid, codigo, nome) VALUES (new.rowid, new.codigo, new.nome);
+        END
+    """),
+]
+
+
+# Colunas criadas depois da primeira versão das tabelas. O ``create_all`` não
+# altera tabelas existentes, então bancos antigos recebem a coluna (e o índice)
+# por ALTER TABLE; colunas virtuais são calculadas para as linhas existentes.
+COLUNAS_MIGRADAS = [
+    ('lotes', 'validade_chave', f'INTEGER GENERATED ALWAYS AS ({EXPRESSAO_VALIDADE_CHAVE}) VIRTUAL'),
+    ('produtos', 'seq', "INTEGER NOT NULL DEFAULT '0'"),
+    ('lotes', 'seq', "INTEGER NOT NULL DEFAULT '0'"),
+]
+
+INDICES = [
+    'CREATE INDEX IF NOT EXISTS ix_lotes_validade_chave ON lotes (validade_chave)',
+    'CREATE INDEX IF NOT EXISTS ix_produtos_seq ON produtos (seq)',
+    'CREATE INDEX IF NOT EXISTS ix_lotes_seq ON lotes (seq)',
+]
+
+
+# Tabelas que só existem no banco principal. Os bancos de depósito (ver
+# ``src.services.depositos``) enxergam o catálogo pelo ATTACH e não recebem
+# os triggers, colunas e índices dessas tabelas
+TABELAS_CATALOGO = ('produtos',)
+
+
+def _tabela_alvo(ddl):
+    """Tabela a que um trigger ou índice se aplica (o nome depois de ``ON``)."""
+    return re.search(r'\bON (\w+)', ddl).group(1)
+
+
+def _do_deposito(triggers):
+    return [(nome, ddl) for nome, ddl in triggers if _tabela_alvo(ddl) not in TABELAS_CATALOGO]
+
+
+def _existe_tabela(conexao, nome):
+    return conexao.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :nome"), {'nome': nome}
+    ).first() is not None
+
+
+def _existe_coluna(conexao, tabela, coluna):
+    # table_xinfo (e não table_info) para enxergar também as colunas geradas
+    return any(linha[1] == coluna for linha in conexao.execute(text(f'PRAGMA table_xinfo({tabela})')))
+
+
+def _migrar_colunas(conexao, catalogo=True):
+    for tabela, coluna, definicao in COLUNAS_MIGRADAS:
+        if not catalogo and tabela in TABELAS_CATALOGO:
+            continue
+        if not _existe_coluna(conexao, tabela, coluna):
+            conexao.execute(text(f'ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao}'))
+    for ddl in INDICES:
+        if catalogo or _tabela_alvo(ddl) not in TABELAS_CATALOGO:
+            conexao.execute(text(ddl))
+
+
+def _recriar_triggers(conexao, triggers):
+    for nome, ddl in triggers:
+        # ``main.``: sem o prefixo, em um depósito o DROP acharia o trigger do catálogo anexado
+        conexao.execute(text(f'DROP TRIGGER IF EXISTS main.{nome}'))
+        conexao.execute(text(ddl))
+
+
+def preparar_esquema(engine=None, catalogo=True):
+    """Cria os objetos do banco que o ``create_all`` não cobre (colunas novas, linhas fixas e triggers).
+
+    Com ``catalogo=False`` prepara o banco de um depósito: só os objetos de
+    ``lotes`` e dos totais, sem os de ``produtos`` nem o índice de busca.
+    """
+    engine = engine or db.engine
+    filtrar = (lambda triggers: triggers) if catalogo else _do_deposito
+    with engine.begin() as conexao:
+        _migrar_colunas(conexao, catalogo)
+        conexao.execute(text('INSERT OR IGNORE INTO estoque_versao (id, versao) VALUES (1, 0)'))
+        _recriar_triggers(conexao, filtrar(TRIGGERS_VERSAO))
+        _recriar_triggers(conexao, filtrar(TRIGGERS_RESUMO))
+        totais_novos = conexao.execute(text(
+            'INSERT OR IGNORE INTO estoque_totais '
+            '(id, total_produtos, produtos_com_estoque, quantidade_total, total_lotes) VALUES (1, 0, 0, 0, 0)'
+        )).rowcount
+    if totais_novos:
+        # Banco existente sem os totais materializados: calcula a partir dos lotes
+        from src.services.resumo_estoque import reconstruir_resumo
+        reconstruir_resumo(engine)
+    if catalogo:
+        preparar_busca(engine)
+    numerar_sem_seq(engine, catalogo)
+
+
+def numerar_sem_seq(engine=None, catalogo=True):
+    """Dá um ``seq`` único às linhas que ainda não têm (``seq = 0``).
+
+    Acontece com bancos anteriores à coluna e com cargas feitas antes dos
+    triggers existirem. Cada tabela recebe uma faixa acima da versão atual
+    (versão + rowid) e a versão avança até o fim da faixa, mantendo os ``seq``
+    únicos entre tabelas, o que a paginação do /sync exige.
+    """
+    engine = engine or db.engine
+    with engine.begin() as conexao:
+        for tabela in COLUNAS_SYNC:
+            if not catalogo and tabela in TABELAS_CATALOGO:
+                continue
+            if conexao.execute(text(f'SELECT 1 FROM {tabela} WHERE seq = 0 LIMIT 1')).first() is None:
+                continue
+            base = conexao.execute(text('SELECT versao FROM estoque_versao WHERE id = 1')).scalar()
+            conexao.execute(text(f'UPDATE {tabela} SET seq = :base + rowid WHERE seq = 0'), {'base': base})
+            conexao.execute(text(
+                f'UPDATE estoque_versao SET versao = :base + (SELECT MAX(rowid) FROM {tabela}) WHERE id = 1'
+            ), {'base': base})
+
+
+def preparar_busca(engine=None):
+    """Cria o índice de busca e os triggers que o mantêm sincronizado.
+
+    Se o SQLite não tiver FTS5 o índice não é criado e a busca de produtos usa
+    ``LIKE`` (ver ``src.services.busca``). Retorna se o índice está disponível.
+    """
+    engine = engine or db.engine
+    try:
+        with engine.begin() as conexao:
+            if not _existe_tabela(conexao, 'produtos_fts'):
+                conexao.execute(text(DDL_BUSCA))
+                # Indexa os produtos que já existiam
+                conexao.execute(text("INSERT INTO produtos_fts (produtos_fts) VALUES ('rebuild')"))
+            _recriar_triggers(conexao, TRIGGERS_BUSCA)
+        return True
+    except OperationalError as e:
+        if 'fts5' not in str(e.orig):
+            raise
+        return False
+
+
+def reconstruir_busca(engine=None):
+    """Reindexa todos os produtos no índice de busca; retorna False se o índice não existe."""
+    engine = engine or db.engine
+    with engine.begin() as conexao:
+        if not _existe_tabela(conexao, 'produtos_fts'):
+            return False
+        conexao.execute(text("INSERT INTO produtos_fts (produtos_fts) VALUES ('rebuild')"))
+    return True
+
+
+def obter_versao(sessao=None):
+    """Versão atual do estoque (muda a cada escrita em produtos ou lotes)."""
+    sessao = sessao or db.session
+    return sessao.execute(select(EstoqueVersao.versao).where(EstoqueVersao.id == 1)).scalar() or 0
@@ -0,0 +1,35 @@
+from src.models.user import db
+
+class EstoqueProduto(db.Model):
+    """Totais de estoque por produto, mantidos por triggers em ``lotes``"""
+    __tablename__ = 'estoque_produtos'
+    
+    produto_codigo = db.Column(db.String(20), primary_key=True)
+    quantidade_total = db.Column(db.Integer, nullable=False, default=0)
+    total_lotes = db.Column(db.Integer, nullable=False, default=0)
+    
+    def to_dict(self):
+        return {
+            'produto_codigo': self.produto_codigo,
+            'quantidade_total': self.quantidade_total,
+            'total_lotes': self.total_lotes
+        }
+
+class EstoqueTotais(db.Model):
+    """Linha única com os contadores globais do resumo de estoque"""
+    __tablename__ = 'estoque_totais'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    total_produtos = db.Column(db.Integer, nullable=False, default=0)
+    produtos_com_estoque = db.Column(db.Integer, nullable=False, default=0)
+    quantidade_total = db.Column(db.Integer, nullable=False, default=0)
+    total_lotes = db.Column(db.Integer, nullable=False, default=0)
+    
+    def to_dict(self):
+        return {
+            'total_produtos': self.total_produtos,
+            'produtos_com_estoque': self.produtos_com_estoque,
+            'produtos_sem_estoque': self.total_produtos - self.produtos_com_estoque,
+            'quantidade_total': self.quantidade_total,
+            'total_lotes': self.total_lotes
+        }
@@ -1,6 +1,9 @@
 from src.models.user import db
 from datetime import datetime
 
+# Validade como AAAAMM (ex.: 203012), ordenável e comparável por faixa
+EXPRESSAO_VALIDADE_CHAVE = 'validade_ano * 100 + validade_mes'
+
 class Lote(db.Model):
     __tablename__ = 'lotes'
     
@@ -11,9 +14,16 @@ class Lote(db.Model):
     validade_ano = db.Column(db.Integer, nullable=False)
     quantidade = db.Column(db.Integer, nullable=False, default=0)
     data_cadastro = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Calculada pelo SQLite (coluna virtual) e indexada para consultas de vencimento
+    validade_chave = db.Column(db.Integer, db.Computed(EXPRESSAO_VALIDADE_CHAVE, persisted=False))
+    # Versão do estoque na última escrita da linha (preenchida por trigger, ver /sync)
+    seq = db.Column(db.Integer, nullable=False, server_default='0', index=True)
     
     # Índice único para evitar duplicação de lotes por produto
-    __table_args__ = (db.UniqueConstraint('produto_codigo', 'lote', name='unique_produto_lote'),)
+    __table_args__ = (
+        db.UniqueConstraint('produto_codigo', 'lote', name='unique_produto_lote'),
+        db.Index('ix_lotes_validade_chave', 'validade_chave'),
+    )
     
     def to_dict(self):
         return {
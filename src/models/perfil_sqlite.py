@@ -0,0 +1,84 @@
+import os
+
+from sqlalchemy import event
+
+# Perfis de armazenamento do SQLite. Os valores viram PRAGMAs aplicados em
+# toda conexão nova (ver ``configurar_sqlite``).
+PERFIS = {
+    # Comportamento antigo do pysqlite: rollback journal e sync completo
+    'legado': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'busy_timeout': 5000,
+        'mmap_size': 0,
+        'cache_size': -2000,
+        'foreign_keys': 'OFF',
+    },
+    # WAL sem abrir mão de fsync a cada commit, com as chaves estrangeiras
+    # verificadas: excluir um produto que ainda tem lotes falha com IntegrityError
+    'seguro': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'busy_timeout': 10000,
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -65536,
+        'foreign_keys': 'ON',
+    },
+    # WAL com synchronous=NORMAL: commits não fazem fsync; uma queda de energia
+    # pode perder as últimas transações, mas nunca corrompe o banco. As chaves
+    # estrangeiras ficam desligadas, como sempre estiveram no pysqlite
+    'padrao': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 10000,
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -65536,
+        'foreign_keys': 'OFF',
+    },
+}
+
+# Variáveis de ambiente que sobrescrevem PRAGMAs individuais do perfil
+VARIAVEIS_AMBIENTE = {
+    'journal_mode': 'SQLITE_JOURNAL_MODE',
+    'synchronous': 'SQLITE_SYNCHRONOUS',
+    'busy_timeout': 'SQLITE_BUSY_TIMEOUT',
+    'mmap_size': 'SQLITE_MMAP_SIZE',
+    'cache_size': 'SQLITE_CACHE_SIZE',
+    'foreign_keys': 'SQLITE_FOREIGN_KEYS',
+}
+
+# Ordem de aplicação: journal_mode primeiro porque muda o modo do arquivo
+ORDEM_PRAGMAS = ['journal_mode', 'busy_timeout', 'synchronous', 'mmap_size', 'cache_size', 'foreign_keys']
+
+
+def carregar_perfil(nome=None, ambiente=None):
+    """Monta o perfil ``nome`` (ou ``SQLITE_PERFIL``) com os ajustes do ambiente."""
+    ambiente = os.environ if ambiente is None else ambiente
+    nome = nome or ambiente.get('SQLITE_PERFIL', 'padrao')
+    if nome not in PERFIS:
+        raise ValueError(f"Perfil SQLite inválido: {nome} (opções: {', '.join(PERFIS)})")
+
+    perfil = dict(PERFIS[nome])
+    for pragma, variavel in VARIAVEIS_AMBIENTE.items():
+        if ambiente.get(variavel):
+            perfil[pragma] = ambiente[variavel]
+    return perfil
+
+
+def aplicar_pragmas(dbapi_connection, perfil):
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in ORDEM_PRAGMAS:
+            if pragma in perfil:
+                cursor.execute(f'PRAGMA {pragma} = {perfil[pragma]}')
+    finally:
+        cursor.close()
+
+
+def configurar_sqlite(engine, perfil):
+    """Registra um hook que aplica os PRAGMAs do perfil em cada conexão do engine."""
+    @event.listens_for(engine, 'connect')
+    def _ao_conectar(dbapi_connection, connection_record):
+        aplicar_pragmas(dbapi_connection, perfil)
+
+    return engine
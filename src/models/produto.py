@@ -6,6 +6,8 @@ class Produto(db.Model):
     
     codigo = db.Column(db.String(20), primary_key=True)
     nome = db.Column(db.String(200), nullable=False)
+    # Versão do estoque na última escrita da linha (preenchida por trigger, ver /sync)
+    seq = db.Column(db.Integer, nullable=False, server_default='0', index=True)
     
     def to_dict(self):
         return {
@@ -0,0 +1,9 @@
+from src.models.user import db
+
+class RemocaoSync(db.Model):
+    """Lápide de uma linha removida de ``produtos`` ou ``lotes``, para o /sync"""
+    __tablename__ = 'sync_remocoes'
+    
+    tabela = db.Column(db.String(20), primary_key=True)
+    chave = db.Column(db.String(50), primary_key=True)
+    seq = db.Column(db.Integer, nullable=False, index=True)
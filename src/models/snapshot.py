@@ -0,0 +1,60 @@
+from src.models.user import db
+from datetime import datetime
+
+class Snapshot(db.Model):
+    """Foto do estado de ``lotes`` com um rótulo; os totais são os do momento da criação"""
+    __tablename__ = 'snapshots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    rotulo = db.Column(db.String(100), unique=True, nullable=False)
+    criado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    versao = db.Column(db.Integer, nullable=False)
+    # Completo guarda todos os lotes; delta só o que mudou desde o snapshot anterior.
+    # checkpoint_id é o completo em que a cadeia de deltas começa (ele mesmo, se completo)
+    completo = db.Column(db.Boolean, nullable=False)
+    checkpoint_id = db.Column(db.Integer, db.ForeignKey('snapshots.id'))
+    linhas = db.Column(db.Integer, nullable=False, default=0)
+    total_produtos = db.Column(db.Integer, nullable=False, default=0)
+    produtos_com_estoque = db.Column(db.Integer, nullable=False, default=0)
+    quantidade_total = db.Column(db.Integer, nullable=False, default=0)
+    total_lotes = db.Column(db.Integer, nullable=False, default=0)
+
+    def resumo(self):
+        """Mesmo formato do /relatorio/resumo"""
+        return {
+            'total_produtos': self.total_produtos,
+            'produtos_com_estoque': self.produtos_com_estoque,
+            'produtos_sem_estoque': self.total_produtos - self.produtos_com_estoque,
+            'quantidade_total': self.quantidade_total,
+            'total_lotes': self.total_lotes
+        }
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'rotulo': self.rotulo,
+            'criado_em': self.criado_em.strftime('%d/%m/%Y %H:%M:%S'),
+            'versao': self.versao,
+            'tipo': 'completo' if self.completo else 'delta',
+            'checkpoint_id': self.checkpoint_id,
+            'linhas': self.linhas,
+            'resumo': self.resumo()
+        }
+
+class SnapshotLote(db.Model):
+    """Um lote gravado em um snapshot (ou, em um delta, a remoção dele)"""
+    __tablename__ = 'snapshot_lotes'
+
+    snapshot_id = db.Column(db.Integer, db.ForeignKey('snapshots.id'), primary_key=True)
+    produto_codigo = db.Column(db.String(20), primary_key=True)
+    lote = db.Column(db.String(50), primary_key=True)
+    validade_mes = db.Column(db.Integer)
+    validade_ano = db.Column(db.Integer)
+    quantidade = db.Column(db.Integer)
+    data_cadastro = db.Column(db.DateTime)
+    removido = db.Column(db.Boolean, nullable=False, default=False)
+
+    # Reconstrução: quais lotes do checkpoint foram sobrescritos por um delta da cadeia
+    __table_args__ = (
+        db.Index('ix_snapshot_lotes_chave', 'produto_codigo', 'lote', 'snapshot_id'),
+    )
@@ -0,0 +1,9 @@
+from src.models.user import db
+
+class EstoqueVersao(db.Model):
+    """Contador único incrementado a cada escrita em produtos ou lotes"""
+    __tablename__ = 'estoque_versao'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    versao = db.Column(db.Integer, nullable=False, default=0)
+
@@ -0,0 +1,62 @@
+from flask import Blueprint, jsonify, request, send_file
+from src.services.conciliacao import (
+    COLUNAS_PLANILHA, LIMITE_MAXIMO, LIMITE_PADRAO, ErroConciliacao, conciliar_arquivo, linhas_planilha, registros
+)
+from src.services.snapshots import buscar_snapshot
+
+from datetime import datetime
+import tempfile
+
+conciliacao_bp = Blueprint('conciliacao', __name__)
+
+EXTENSOES = ('.csv', '.xlsx')
+
+@conciliacao_bp.route('/api/conciliacao', methods=['POST'])
+def conciliar_estoque():
+    """Concilia o estoque contado com o estoque esperado de um .csv/.xlsx do ERP"""
+    arquivo = request.files.get('arquivo')
+    if not arquivo or not arquivo.filename:
+        return jsonify({'error': 'Envie o arquivo no campo "arquivo"'}), 400
+    if not arquivo.filename.lower().endswith(EXTENSOES):
+        return jsonify({'error': f"Formato não suportado (use {', '.join(EXTENSOES)})"}), 400
+    
+    formato = request.args.get('format', 'json')
+    if formato not in ('json', 'xlsx'):
+        return jsonify({'error': 'format deve ser json ou xlsx'}), 400
+    limite = request.args.get('limit', LIMITE_PADRAO, type=int)
+    if limite is None or limite < 0:
+        return jsonify({'error': 'limit deve ser um número não negativo'}), 400
+    
+    snapshot = None
+    if request.args.get('snapshot'):
+        snapshot = buscar_snapshot(request.args['snapshot'])
+        if snapshot is None:
+            return jsonify({'error': 'Snapshot não encontrado'}), 404
+    
+    try:
+        discrepancias, totais = conciliar_arquivo(arquivo.stream, arquivo.filename, snapshot)
+    except ErroConciliacao as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Erro ao conciliar estoque: {str(e)}'}), 500
+    
+    if formato == 'xlsx':
+        try:
+            from src.services.relatorio_excel import MIMETYPE_XLSX, escrever_excel
+            
+            # Em disco acima de 8 MB: a planilha pode ter uma linha por discrepância
+            destino = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+            escrever_excel(linhas_planilha(discrepancias), destino, COLUNAS_PLANILHA, 'Conciliação')
+            destino.seek(0)
+        except Exception as e:
+            return jsonify({'error': f'Erro ao gerar planilha da conciliação: {str(e)}'}), 500
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        return send_file(destino, mimetype=MIMETYPE_XLSX, as_attachment=True,
+                         download_name=f'conciliacao_{timestamp}.xlsx')
+    
+    limite = min(limite, LIMITE_MAXIMO)
+    return jsonify({
+        'totais': totais,
+        'discrepancias': registros(discrepancias, limite),
+        'truncado': len(discrepancias) > limite
+    })
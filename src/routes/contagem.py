@@ -1,79 +1,184 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request, url_for
+from sqlalchemy import select
 from src.models.produto import Produto
 from src.models.lote import Lote
-from src.models.user import db
-from sqlalchemy.exc import IntegrityError
+from src.services.contagem import (
+    ATUALIZADO, ERRO, MAX_ITENS_BATCH, PRODUTO_NAO_ENCONTRADO, com_retentativas, registrar_contagens,
+    validar_contagem
+)
+from src.services.cache_produtos import codigos_contados, get_cache_produtos
+from src.services.depositos import DepositoInexistente, resolver_deposito, sessao_deposito
+from src.services.fila_contagem import FilaCheia, get_fila_contagens
+from src.services.listagem import LISTAGEM_LOTES, ErroListagem, paginacao_solicitada, resposta_listagem
 
 contagem_bp = Blueprint('contagem', __name__)
 
+def _deposito_contagem():
+    """Depósito das contagens (``?deposito=``; None é o padrão). Contagens não aceitam ``todos``"""
+    depositos = resolver_deposito(current_app, request.args.get('deposito'))
+    if depositos is not None and len(depositos) > 1:
+        raise ValueError('Informe um único depósito para registrar contagens')
+    return depositos[0] if depositos else None
+
 @contagem_bp.route('/contagem', methods=['POST'])
 def registrar_contagem():
-    """Registra uma nova contagem de lote ou atualiza uma existente"""
-    data = request.get_json()
+    """Registra uma nova contagem de lote ou atualiza uma existente (no depósito ``?deposito=``)"""
+    data = request.get_json(silent=True)
     
     if not data:
         return jsonify({'error': 'Dados não fornecidos'}), 400
     
-    produto_codigo = data.get('produto_codigo')
-    lote_nome = data.get('lote')
-    validade_mes = data.get('validade_mes')
-    validade_ano = data.get('validade_ano')
-    quantidade = data.get('quantidade')
-    
     # Validação dos dados
-    if not all([produto_codigo, lote_nome, validade_mes, validade_ano]):
-        return jsonify({'error': 'Campos obrigatórios: produto_codigo, lote, validade_mes, validade_ano'}), 400
+    erro = validar_contagem(data)
+    if erro:
+        return jsonify({'error': erro}), 400
     
-    if quantidade is None or quantidade < 0:
-        return jsonify({'error': 'Quantidade deve ser um número não negativo'}), 400
+    try:
+        deposito = _deposito_contagem()
+    except DepositoInexistente as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Verificar se o produto existe
-    produto = Produto.query.get(produto_codigo)
-    if not produto:
-        return jsonify({'error': 'Produto não encontrado'}), 404
+    # A fila write-behind grava no banco principal; os outros depósitos têm
+    # arquivo próprio, sem disputa com ele, e gravam direto
+    if deposito is None and current_app.config.get('CONTAGEM_WRITE_BEHIND'):
+        return _registrar_write_behind(data)
+    
+    sessao = sessao_deposito(deposito)
+    try:
+        # Upsert atômico: duas contagens simultâneas do mesmo lote somam as duas
+        # quantidades, inclusive quando o lote ainda não existe
+        resultado = com_retentativas(lambda: registrar_contagens([data], sessao)[0], sessao)
+    except Exception as e:
+        sessao.rollback()
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+    
+    # O cache de produtos guarda os lotes do depósito padrão
+    if deposito is None:
+        get_cache_produtos(current_app).invalidar(*codigos_contados([resultado]))
+    return _resposta_contagem(resultado)
+
+def _resposta_contagem(resultado):
+    if resultado['status'] == ERRO:
+        # Fora o produto inexistente, o erro de uma contagem já validada é falha interna
+        codigo = 404 if resultado['error'] == PRODUTO_NAO_ENCONTRADO else 500
+        return jsonify({'error': resultado['error']}), codigo
+    
+    if resultado['status'] == ATUALIZADO:
+        return jsonify({
+            'message': 'Quantidade adicionada ao lote existente',
+            'lote': resultado['lote']
+        })
+    return jsonify({
+        'message': 'Novo lote registrado com sucesso',
+        'lote': resultado['lote']
+    }), 201
+
+def _aguardar_commit():
+    """Se a resposta deve esperar o commit (``?aguardar=0|1``, padrão CONTAGEM_DURAVEL)"""
+    padrao = '1' if current_app.config.get('CONTAGEM_DURAVEL') else '0'
+    return request.args.get('aguardar', padrao) not in ('0', 'false')
+
+def _registrar_write_behind(data):
+    """Enfileira a contagem para o próximo group commit"""
+    try:
+        confirmacao = get_fila_contagens(current_app).submeter(data)
+    except FilaCheia as e:
+        return jsonify({'error': str(e)}), 503
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if _aguardar_commit():
+        resultado = confirmacao.aguardar(current_app.config.get('CONTAGEM_TIMEOUT_ESPERA', 30))
+        if resultado is not None:
+            return _resposta_contagem(resultado)
+    
+    # Sem espera (ou commit ainda não terminou): o cliente acompanha pelo ack
+    return jsonify({
+        'ack': confirmacao.ack,
+        'status': 'pendente',
+        'status_url': url_for('contagem.status_confirmacao', ack=confirmacao.ack)
+    }), 202
+
+@contagem_bp.route('/contagem/confirmacoes/<ack>', methods=['GET'])
+def status_confirmacao(ack):
+    """Situação de uma contagem enfileirada (``?aguardar=1`` espera o commit neste worker)"""
+    fila = get_fila_contagens(current_app)
+    confirmacao = fila.pendente(ack)
+    if confirmacao is not None and request.args.get('aguardar') in ('1', 'true'):
+        confirmacao.aguardar(current_app.config.get('CONTAGEM_TIMEOUT_ESPERA', 30))
+    
+    status = fila.status(ack)
+    if status is None:
+        return jsonify({'error': 'Confirmação não encontrada'}), 404
+    return jsonify(status)
+
+@contagem_bp.route('/contagem/batch', methods=['POST'])
+def registrar_contagem_batch():
+    """Registra várias contagens em uma única transação (no depósito ``?deposito=``)"""
+    data = request.get_json(silent=True)
+    itens = data.get('contagens') if isinstance(data, dict) else data
+    
+    if not isinstance(itens, list) or not itens:
+        return jsonify({'error': 'Envie uma lista de contagens'}), 400
+    
+    if len(itens) > MAX_ITENS_BATCH:
+        return jsonify({'error': f'Máximo de {MAX_ITENS_BATCH} contagens por requisição'}), 400
     
     try:
-        # Verificar se o lote já existe para este produto
-        lote_existente = Lote.query.filter_by(produto_codigo=produto_codigo, lote=lote_nome).first()
-        
-        if lote_existente:
-            # Se existe, somar a quantidade
-            lote_existente.quantidade += quantidade
-            db.session.commit()
-            return jsonify({
-                'message': 'Quantidade adicionada ao lote existente',
-                'lote': lote_existente.to_dict()
-            })
-        else:
-            # Se não existe, criar novo lote
-            novo_lote = Lote(
-                produto_codigo=produto_codigo,
-                lote=lote_nome,
-                validade_mes=validade_mes,
-                validade_ano=validade_ano,
-                quantidade=quantidade
-            )
-            db.session.add(novo_lote)
-            db.session.commit()
-            return jsonify({
-                'message': 'Novo lote registrado com sucesso',
-                'lote': novo_lote.to_dict()
-            }), 201
-            
-    except IntegrityError:
-        db.session.rollback()
-        return jsonify({'error': 'Erro ao registrar lote'}), 500
+        deposito = _deposito_contagem()
+    except DepositoInexistente as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    sessao = sessao_deposito(deposito)
+    try:
+        resultados = com_retentativas(lambda: registrar_contagens(itens, sessao), sessao)
     except Exception as e:
-        db.session.rollback()
+        sessao.rollback()
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+    
+    if deposito is None:
+        get_cache_produtos(current_app).invalidar(*codigos_contados(resultados))
+    erros = sum(1 for resultado in resultados if resultado['status'] == ERRO)
+    return jsonify({
+        'total': len(resultados),
+        'sucesso': len(resultados) - erros,
+        'erros': erros,
+        'resultados': resultados
+    })
 
 @contagem_bp.route('/contagem/lotes/<produto_codigo>', methods=['GET'])
 def get_lotes_produto(produto_codigo):
-    """Retorna todos os lotes de um produto específico"""
+    """Retorna todos os lotes de um produto (aceita limit, cursor, fields, format e deposito)"""
     produto = Produto.query.get(produto_codigo)
     if not produto:
         return jsonify({'error': 'Produto não encontrado'}), 404
     
-    lotes = Lote.query.filter_by(produto_codigo=produto_codigo).all()
-    return jsonify([lote.to_dict() for lote in lotes])
+    try:
+        depositos = resolver_deposito(current_app, request.args.get('deposito'))
+    except DepositoInexistente as e:
+        return jsonify({'error': str(e)}), 404
+    
+    consulta = select(Lote).where(Lote.produto_codigo == produto_codigo)
+    if depositos is not None and len(depositos) > 1:
+        # Todos os depósitos: cada lote vem com o nome do depósito, sem paginação
+        if paginacao_solicitada(request.args):
+            return jsonify({'error': 'A paginação é por depósito: informe um depósito'}), 400
+        return jsonify([
+            dict(lote.to_dict(), deposito=nome)
+            for nome in depositos
+            for lote in sessao_deposito(nome).scalars(consulta)
+        ])
+    
+    sessao = sessao_deposito(depositos[0] if depositos else None)
+    if paginacao_solicitada(request.args):
+        try:
+            return resposta_listagem(LISTAGEM_LOTES, request.args, [Lote.produto_codigo == produto_codigo], sessao)
+        except ErroListagem as e:
+            return jsonify({'error': str(e)}), 400
+    
+    return jsonify([lote.to_dict() for lote in sessao.scalars(consulta)])
 
@@ -0,0 +1,47 @@
+from flask import Blueprint, jsonify, request
+from src.models.user import db
+from src.services.importacao import TAMANHO_CHUNK_UPLOAD, importar_contagens_csv, importar_produtos_xlsx
+
+importacao_bp = Blueprint('importacao', __name__)
+
+def _arquivo_enviado(extensoes):
+    """Retorna o arquivo do campo ``arquivo`` ou uma resposta de erro"""
+    arquivo = request.files.get('arquivo')
+    if not arquivo or not arquivo.filename:
+        return None, (jsonify({'error': 'Envie o arquivo no campo "arquivo"'}), 400)
+    if not arquivo.filename.lower().endswith(extensoes):
+        return None, (jsonify({'error': f"Formato não suportado (use {', '.join(extensoes)})"}), 400)
+    return arquivo, None
+
+def _tamanho_chunk():
+    return max(1, min(request.args.get('chunk', TAMANHO_CHUNK_UPLOAD, type=int), 10000))
+
+@importacao_bp.route('/api/importacao/produtos', methods=['POST'])
+def importar_produtos():
+    """Importa produtos de uma planilha .xlsx (código, nome) em blocos"""
+    arquivo, erro = _arquivo_enviado(('.xlsx',))
+    if erro:
+        return erro
+    
+    cabecalho = request.args.get('cabecalho', '').lower() in ('1', 'true', 'sim')
+    try:
+        return jsonify(importar_produtos_xlsx(arquivo.stream, cabecalho, _tamanho_chunk()))
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Erro ao importar produtos: {str(e)}'}), 500
+
+@importacao_bp.route('/api/importacao/contagens', methods=['POST'])
+def importar_contagens():
+    """Importa contagens de um CSV (produto_codigo, lote, validade_mes, validade_ano, quantidade)"""
+    arquivo, erro = _arquivo_enviado(('.csv',))
+    if erro:
+        return erro
+    
+    try:
+        return jsonify(importar_contagens_csv(arquivo.stream, _tamanho_chunk()))
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Erro ao importar contagens: {str(e)}'}), 500
@@ -0,0 +1,19 @@
+from flask import Blueprint, current_app
+
+from src.services.cache_produtos import get_cache_produtos
+from src.services.cache_relatorio import get_cache
+from src.services.metricas import exportar_cache
+
+metricas_bp = Blueprint('metricas', __name__)
+
+@metricas_bp.route('/metrics', methods=['GET'])
+def exportar_metricas():
+    """Métricas das requisições e dos caches no formato de texto do Prometheus"""
+    return current_app.response_class(
+        current_app.extensions['metricas'].exportar()
+        + exportar_cache('estoque_cache_produtos', 'Cache de produtos',
+                         get_cache_produtos(current_app).estatisticas())
+        + exportar_cache('estoque_cache_relatorios', 'Cache de relatórios',
+                         get_cache(current_app).estatisticas()),
+        mimetype='text/plain; version=0.0.4'
+    )
@@ -1,25 +1,57 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
+from sqlalchemy import func, select, text, update
 from src.models.produto import Produto
 from src.models.lote import Lote
 from src.models.user import db
+from src.services.depositos import PADRAO, nomes_depositos, sessao_deposito
+from src.services.busca import LIMITE_PADRAO, buscar_produtos
+from src.services.cache_produtos import get_cache_produtos
+from src.services.listagem import LISTAGEM_PRODUTOS, ErroListagem, paginacao_solicitada, resposta_listagem
 
 produto_bp = Blueprint('produto', __name__)
 
+def _lotes_por_deposito(codigo):
+    """``{deposito: quantidade de lotes}`` de ``codigo``, só dos depósitos que têm lotes dele"""
+    contagens = {}
+    for nome in nomes_depositos(current_app):
+        total = sessao_deposito(nome).scalar(select(func.count()).where(Lote.produto_codigo == codigo))
+        if total:
+            contagens[nome] = total
+    return contagens
+
 @produto_bp.route('/api/produtos', methods=['GET'])
 def listar_produtos():
+    if paginacao_solicitada(request.args):
+        try:
+            return resposta_listagem(LISTAGEM_PRODUTOS, request.args)
+        except ErroListagem as e:
+            return jsonify({'error': str(e)}), 400
+    
     produtos = Produto.query.all()
     return jsonify([{
-        'id': p.id,
         'codigo': p.codigo,
         'nome': p.nome
     } for p in produtos])
 
+@produto_bp.route('/api/produtos/busca', methods=['GET'])
+def buscar_produtos_texto():
+    """Busca produtos por código ou nome (prefixo, sem diferenciar acentos)"""
+    termo = request.args.get('q', '')
+    limite = request.args.get('limite', LIMITE_PADRAO, type=int)
+    
+    if not termo.strip():
+        return jsonify({'error': 'Informe o termo de busca (q)'}), 400
+    
+    try:
+        return jsonify(buscar_produtos(termo, limite))
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
 @produto_bp.route('/api/produtos/<codigo>', methods=['GET'])
 def buscar_produto(codigo):
     produto = Produto.query.filter_by(codigo=codigo).first()
     if produto:
         return jsonify({
-            'id': produto.id,
             'codigo': produto.codigo,
             'nome': produto.nome
         })
@@ -48,9 +80,9 @@ def adicionar_produto():
         novo_produto = Produto(codigo=codigo, nome=nome)
         db.session.add(novo_produto)
         db.session.commit()
+        get_cache_produtos(current_app).invalidar(codigo)
         
         return jsonify({
-            'id': novo_produto.id,
             'codigo': novo_produto.codigo,
             'nome': novo_produto.nome,
             'message': 'Produto adicionado com sucesso'
@@ -84,17 +116,34 @@ def editar_produto(codigo):
             if not novo_codigo:
                 return jsonify({'error': 'Código não pode estar vazio'}), 400
             
-            # Verificar se o novo código já existe (exceto para o produto atual)
-            produto_existente = Produto.query.filter_by(codigo=novo_codigo).first()
-            if produto_existente and produto_existente.id != produto.id:
-                return jsonify({'error': 'Já existe um produto com este código'}), 409
-            
-            produto.codigo = novo_codigo
+            if novo_codigo != codigo:
+                # Verificar se o novo código já existe
+                if db.session.get(Produto, novo_codigo) is not None:
+                    return jsonify({'error': 'Já existe um produto com este código'}), 409
+                
+                # Os lotes dos outros depósitos ficam em outros arquivos e não
+                # mudariam na mesma transação
+                padrao = current_app.config.get('DEPOSITO_PADRAO', PADRAO)
+                externos = [nome for nome in _lotes_por_deposito(codigo) if nome != padrao]
+                if externos:
+                    return jsonify({
+                        'error': f"Não é possível alterar o código: o produto tem lotes nos depósitos {', '.join(externos)}"
+                    }), 409
+                
+                # Os lotes do banco principal acompanham o código na mesma
+                # transação; sem ON UPDATE CASCADE, a verificação da chave
+                # estrangeira (perfil seguro) fica para o commit
+                db.session.execute(text('PRAGMA defer_foreign_keys = ON'))
+                produto.codigo = novo_codigo
+                db.session.flush()
+                db.session.execute(
+                    update(Lote).where(Lote.produto_codigo == codigo).values(produto_codigo=novo_codigo)
+                )
         
         db.session.commit()
+        get_cache_produtos(current_app).invalidar(codigo, produto.codigo)
         
         return jsonify({
-            'id': produto.id,
             'codigo': produto.codigo,
             'nome': produto.nome,
             'message': 'Produto atualizado com sucesso'
@@ -111,8 +160,8 @@ def excluir_produto(codigo):
         if not produto:
             return jsonify({'error': 'Produto não encontrado'}), 404
         
-        # Verificar se existem lotes associados ao produto
-        lotes_associados = Lote.query.filter_by(produto_id=produto.id).count()
+        # Verificar se existem lotes associados ao produto (em qualquer depósito)
+        lotes_associados = sum(_lotes_por_deposito(codigo).values())
         if lotes_associados > 0:
             return jsonify({
                 'error': f'Não é possível excluir o produto. Existem {lotes_associados} lote(s) associado(s) a este produto.'
@@ -121,6 +170,7 @@ def excluir_produto(codigo):
         # Excluir produto
         db.session.delete(produto)
         db.session.commit()
+        get_cache_produtos(current_app).invalidar(codigo)
         
         return jsonify({
             'message': f'Produto {codigo} - {produto.nome} excluído com sucesso'
@@ -133,23 +183,23 @@ def excluir_produto(codigo):
 # Manter compatibilidade com rotas antigas
 @produto_bp.route('/produtos', methods=['GET'])
 def get_produtos():
-    """Retorna todos os produtos cadastrados"""
+    """Retorna todos os produtos cadastrados (aceita limit, cursor, fields e format)"""
+    if paginacao_solicitada(request.args):
+        try:
+            return resposta_listagem(LISTAGEM_PRODUTOS, request.args)
+        except ErroListagem as e:
+            return jsonify({'error': str(e)}), 400
+    
     produtos = Produto.query.all()
     return jsonify([produto.to_dict() for produto in produtos])
 
 @produto_bp.route('/produtos/<codigo>', methods=['GET'])
 def get_produto(codigo):
-    """Retorna um produto específico pelo código"""
-    produto = Produto.query.filter_by(codigo=codigo).first()
-    if not produto:
+    """Retorna um produto específico pelo código (com lotes e total, via cache de produtos)"""
+    produto_dict = get_cache_produtos(current_app).obter(codigo)
+    if produto_dict is None:
         return jsonify({'error': 'Produto não encontrado'}), 404
     
-    # Buscar lotes do produto
-    lotes = Lote.query.filter_by(produto_id=produto.id).all()
-    produto_dict = produto.to_dict()
-    produto_dict['lotes'] = [lote.to_dict() for lote in lotes]
-    produto_dict['quantidade_total'] = sum(lote.quantidade for lote in lotes)
-    
     return jsonify(produto_dict)
 
 @produto_bp.route('/produtos/buscar/<codigo>', methods=['GET'])
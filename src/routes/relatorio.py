@@ -1,61 +1,133 @@
-from flask import Blueprint, jsonify, request, send_file
-from src.models.produto import Produto
-from src.models.lote import Lote
+from flask import Blueprint, current_app, jsonify, redirect, request, send_file, url_for
+from src.models.esquema import obter_versao
 from src.models.user import db
-from datetime import datetime
-import pandas as pd
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-from reportlab.lib.units import inch
+from src.services.cache_relatorio import EntradaCache, get_cache
+from src.services.depositos import (
+    DepositoInexistente, resolver_deposito, resumo_consolidado, resumo_deposito, sessao_deposito,
+    uris_depositos, versao_depositos
+)
+from src.services.resumo_estoque import ler_resumo
+from src.services.snapshots import buscar_snapshot
+from src.services.relatorio_jobs import ATIVOS, CONCLUIDO, ERRO, FORMATOS, get_fila
+from src.services.vencimento import MESES_MAXIMO, MESES_PADRAO, consultar_vencimento
+
+import io
 import os
 
 relatorio_bp = Blueprint('relatorio', __name__)
 
+def _enviar_artefato(estado):
+    return send_file(
+        get_fila(current_app).caminho_artefato(estado),
+        as_attachment=True,
+        download_name=estado['arquivo'],
+        mimetype=FORMATOS[estado['formato']]['mimetype']
+    )
+
+def _job_publico(estado):
+    """Campos do job expostos pela API"""
+    return {
+        'id': estado['id'],
+        'formato': estado['formato'],
+        'status': estado['status'],
+        'erro': estado['erro'],
+        'status_url': url_for('relatorio.status_job', job_id=estado['id']),
+        'download_url': url_for('relatorio.download_job', job_id=estado['id'])
+    }
+
+def _redirecionar_download(job_id):
+    return redirect(url_for('relatorio.download_job', job_id=job_id, aguardar=1))
+
+def _versionar(response, etag):
+    """Marca a resposta com o ETag da versão do estoque"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def _nao_modificado(etag):
+    return _versionar(current_app.response_class(status=304), etag)
+
+def _enviar_cache(entrada, etag):
+    response = send_file(
+        io.BytesIO(entrada.conteudo),
+        mimetype=entrada.mimetype,
+        as_attachment=entrada.download_name is not None,
+        download_name=entrada.download_name,
+        etag=False
+    )
+    return _versionar(response, etag)
+
+def _depositos(valor):
+    """Depósitos de ``?deposito=`` (ver ``resolver_deposito``); levanta ``DepositoInexistente``"""
+    return resolver_deposito(current_app, valor)
+
+def _origem_relatorio(rotulo, depositos=None):
+    """``(chave, parametros do job)`` do estoque atual, do snapshot ``rotulo`` ou de ``depositos``; None se o snapshot não existe"""
+    if depositos is not None:
+        if rotulo:
+            raise ValueError('Snapshots existem só no depósito padrão')
+        chave = f"deposito-{'+'.join(depositos)}-{versao_depositos(depositos)}"
+        return chave, {'depositos': uris_depositos(depositos)}
+    if not rotulo:
+        versao = obter_versao()
+        return versao, {'versao': versao}
+    snapshot = buscar_snapshot(rotulo)
+    if snapshot is None:
+        return None
+    # Snapshots não mudam: a chave de cache é o próprio id
+    return f'snapshot-{snapshot.id}', {'snapshot': snapshot.id}
+
+def _gerar_relatorio(formato):
+    """Serve o relatório da versão atual do estoque (ou de ``?snapshot=``/``?deposito=``): 304, cache ou job em segundo plano
+
+    Sempre termina em um arquivo: se o job não fica pronto na espera, a
+    resposta redireciona para o download dele, que continua esperando.
+    """
+    try:
+        origem = _origem_relatorio(request.args.get('snapshot'), _depositos(request.args.get('deposito')))
+    except DepositoInexistente as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if origem is None:
+        return jsonify({'error': 'Snapshot não encontrado'}), 404
+    chave, parametros = origem
+    etag = f'{formato}-{chave}'
+    if request.if_none_match.contains(etag):
+        return _nao_modificado(etag)
+    
+    cache = get_cache(current_app)
+    entrada = cache.get((formato, chave))
+    if entrada is not None:
+        return _enviar_cache(entrada, etag)
+    
+    fila = get_fila(current_app)
+    estado = fila.submeter(formato, _database_uri(), parametros)
+    estado = fila.aguardar(estado['id'], current_app.config.get('RELATORIO_TIMEOUT_ESPERA', 5))
+    
+    if estado is None:
+        return jsonify({'error': 'Relatório expirou antes de ser enviado'}), 500
+    if estado['status'] == ERRO:
+        return jsonify({'error': estado['erro']}), 500
+    if estado['status'] != CONCLUIDO:
+        # Ainda gerando: um link de download não sabe o que fazer com o job,
+        # então segue para o download dele, que espera o restante
+        return _redirecionar_download(estado['id'])
+    
+    caminho = fila.caminho_artefato(estado)
+    if os.path.getsize(caminho) <= cache.max_item_bytes:
+        with open(caminho, 'rb') as f:
+            cache.put((formato, chave), f.read(), FORMATOS[formato]['mimetype'], estado['arquivo'])
+    return _versionar(_enviar_artefato(estado), etag)
+
+def _database_uri():
+    return db.engine.url.render_as_string(hide_password=False)
+
 @relatorio_bp.route('/relatorio/excel', methods=['GET'])
 def gerar_relatorio_excel():
     """Gera relatório de estoque em formato Excel"""
     try:
-        # Buscar todos os produtos e seus lotes
-        produtos = Produto.query.all()
-        dados_relatorio = []
-        
-        for produto in produtos:
-            lotes = Lote.query.filter_by(produto_codigo=produto.codigo).all()
-            
-            if lotes:
-                # Produto com lotes
-                for lote in lotes:
-                    dados_relatorio.append({
-                        'Código': produto.codigo,
-                        'Nome do Produto': produto.nome,
-                        'Lote': lote.lote,
-                        'Validade': f"{lote.validade_mes:02d}/{lote.validade_ano}",
-                        'Quantidade': lote.quantidade,
-                        'Data Cadastro': lote.data_cadastro.strftime('%d/%m/%Y')
-                    })
-            else:
-                # Produto sem lotes (quantidade zero)
-                dados_relatorio.append({
-                    'Código': produto.codigo,
-                    'Nome do Produto': produto.nome,
-                    'Lote': '-',
-                    'Validade': '-',
-                    'Quantidade': 0,
-                    'Data Cadastro': '-'
-                })
-        
-        # Criar DataFrame e salvar como Excel
-        df = pd.DataFrame(dados_relatorio)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'relatorio_estoque_{timestamp}.xlsx'
-        filepath = os.path.join('/tmp', filename)
-        
-        df.to_excel(filepath, index=False, sheet_name='Relatório de Estoque')
-        
-        return send_file(filepath, as_attachment=True, download_name=filename)
-        
+        return _gerar_relatorio('excel')
     except Exception as e:
         return jsonify({'error': f'Erro ao gerar relatório Excel: {str(e)}'}), 500
 
@@ -63,116 +135,112 @@ def gerar_relatorio_excel():
 def gerar_relatorio_pdf():
     """Gera relatório de estoque em formato PDF"""
     try:
-        # Buscar todos os produtos e seus lotes
-        produtos = Produto.query.all()
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'relatorio_estoque_{timestamp}.pdf'
-        filepath = os.path.join('/tmp', filename)
-        
-        # Criar documento PDF
-        doc = SimpleDocTemplate(filepath, pagesize=letter)
-        elements = []
-        
-        # Estilos
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=16,
-            spaceAfter=30,
-            alignment=1  # Center
-        )
-        
-        # Título
-        title = Paragraph("Relatório de Estoque", title_style)
-        elements.append(title)
-        
-        # Data de geração
-        data_geracao = Paragraph(f"Gerado em: {datetime.now().strftime('%d/%m/%Y %H:%M')}", styles['Normal'])
-        elements.append(data_geracao)
-        elements.append(Spacer(1, 20))
-        
-        # Dados da tabela
-        data = [['Código', 'Nome do Produto', 'Lote', 'Validade', 'Qtd', 'Cadastro']]
-        total_geral = 0
-        
-        for produto in produtos:
-            lotes = Lote.query.filter_by(produto_codigo=produto.codigo).all()
-            
-            if lotes:
-                subtotal = 0
-                for lote in lotes:
-                    data.append([
-                        produto.codigo,
-                        produto.nome,
-                        lote.lote,
-                        f"{lote.validade_mes:02d}/{lote.validade_ano}",
-                        str(lote.quantidade),
-                        lote.data_cadastro.strftime('%d/%m/%Y')
-                    ])
-                    subtotal += lote.quantidade
-                
-                # Adicionar subtotal
-                data.append(['', '', '', '', f'Subtotal {produto.codigo}: {subtotal}', ''])
-                total_geral += subtotal
-            else:
-                # Produto sem lotes
-                data.append([produto.codigo, produto.nome, '-', '-', '0', '-'])
-        
-        # Total geral
-        data.append(['', '', '', '', f'TOTAL GERAL: {total_geral}', ''])
-        
-        # Criar tabela
-        table = Table(data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
-        elements.append(table)
-        
-        # Construir PDF
-        doc.build(elements)
-        
-        return send_file(filepath, as_attachment=True, download_name=filename)
-        
+        return _gerar_relatorio('pdf')
     except Exception as e:
         return jsonify({'error': f'Erro ao gerar relatório PDF: {str(e)}'}), 500
 
+@relatorio_bp.route('/relatorio/jobs', methods=['POST'])
+def criar_job():
+    """Cria um job de geração de relatório (PDF ou Excel) em segundo plano"""
+    data = request.get_json(silent=True) or {}
+    formato = data.get('formato')
+    
+    if formato not in FORMATOS:
+        return jsonify({'error': f"Formato deve ser um de: {', '.join(FORMATOS)}"}), 400
+    
+    try:
+        origem = _origem_relatorio(data.get('snapshot'), _depositos(data.get('deposito')))
+        if origem is None:
+            return jsonify({'error': 'Snapshot não encontrado'}), 404
+        estado = get_fila(current_app).submeter(formato, _database_uri(), origem[1])
+        return jsonify(_job_publico(estado)), 202
+    except DepositoInexistente as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Erro ao criar job: {str(e)}'}), 500
+
+@relatorio_bp.route('/relatorio/jobs/<job_id>', methods=['GET'])
+def status_job(job_id):
+    """Retorna o status de um job de relatório"""
+    estado = get_fila(current_app).status(job_id)
+    if not estado:
+        return jsonify({'error': 'Job não encontrado'}), 404
+    return jsonify(_job_publico(estado))
+
+@relatorio_bp.route('/relatorio/jobs/<job_id>/download', methods=['GET'])
+def download_job(job_id):
+    """Baixa o relatório gerado por um job concluído (``?aguardar=1`` espera o job terminar)"""
+    fila = get_fila(current_app)
+    estado = fila.status(job_id)
+    if not estado:
+        return jsonify({'error': 'Job não encontrado'}), 404
+    if request.args.get('aguardar') in ('1', 'true'):
+        if estado['status'] in ATIVOS:
+            estado = fila.aguardar(job_id, current_app.config.get('RELATORIO_TIMEOUT_ESPERA', 5))
+            if estado is None:
+                return jsonify({'error': 'Relatório expirou antes de ser enviado'}), 500
+            if estado['status'] in ATIVOS:
+                # Cada espera fica abaixo do timeout do worker; o navegador
+                # segue o redirect e a espera continua na próxima requisição
+                return _redirecionar_download(job_id)
+        if estado['status'] == ERRO:
+            return jsonify({'error': estado['erro']}), 500
+    if estado['status'] != CONCLUIDO:
+        return jsonify(_job_publico(estado)), 409
+    return _enviar_artefato(estado)
+
 @relatorio_bp.route('/relatorio/resumo', methods=['GET'])
 def get_resumo_estoque():
-    """Retorna um resumo do estoque atual"""
+    """Retorna um resumo do estoque atual (ou do snapshot ``?snapshot=``, ou de ``?deposito=``)"""
     try:
-        produtos = Produto.query.all()
-        resumo = {
-            'total_produtos': len(produtos),
-            'produtos_com_estoque': 0,
-            'produtos_sem_estoque': 0,
-            'quantidade_total': 0,
-            'total_lotes': 0
-        }
-        
-        for produto in produtos:
-            lotes = Lote.query.filter_by(produto_codigo=produto.codigo).all()
-            quantidade_produto = sum(lote.quantidade for lote in lotes)
-            
-            if quantidade_produto > 0:
-                resumo['produtos_com_estoque'] += 1
+        rotulo = request.args.get('snapshot')
+        depositos = _depositos(request.args.get('deposito'))
+        origem = _origem_relatorio(rotulo, depositos)
+        if origem is None:
+            return jsonify({'error': 'Snapshot não encontrado'}), 404
+        chave = origem[0]
+        etag = f'resumo-{chave}'
+        if request.if_none_match.contains(etag):
+            return _nao_modificado(etag)
+        
+        cache = get_cache(current_app)
+        entrada = cache.get(('resumo', chave))
+        if entrada is None:
+            if depositos is not None:
+                resumo = resumo_deposito(depositos[0]) if len(depositos) == 1 else resumo_consolidado(depositos)
             else:
-                resumo['produtos_sem_estoque'] += 1
-            
-            resumo['quantidade_total'] += quantidade_produto
-            resumo['total_lotes'] += len(lotes)
+                resumo = buscar_snapshot(rotulo).resumo() if rotulo else ler_resumo()
+            entrada = EntradaCache(jsonify(resumo).get_data(), 'application/json', None)
+            cache.put(('resumo', chave), entrada.conteudo, entrada.mimetype)
         
-        return jsonify(resumo)
+        return _versionar(current_app.response_class(entrada.conteudo, mimetype=entrada.mimetype), etag)
         
+    except DepositoInexistente as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Erro ao gerar resumo: {str(e)}'}), 500
 
+@relatorio_bp.route('/relatorio/vencimento', methods=['GET'])
+def get_vencimento():
+    """Lotes vencidos ou que vencem nos próximos ``meses`` meses, por produto"""
+    meses = request.args.get('meses', MESES_PADRAO, type=int)
+    if meses is None or not 0 <= meses <= MESES_MAXIMO:
+        return jsonify({'error': f'meses deve ser um número entre 0 e {MESES_MAXIMO}'}), 400
+    incluir_vencidos = request.args.get('vencidos', '1') not in ('0', 'false')
+    
+    try:
+        depositos = _depositos(request.args.get('deposito'))
+    except DepositoInexistente as e:
+        return jsonify({'error': str(e)}), 404
+    if depositos is not None and len(depositos) > 1:
+        return jsonify({'error': 'Vencimento é por depósito: informe um depósito'}), 400
+    
+    try:
+        sessao = sessao_deposito(depositos[0] if depositos else None)
+        return jsonify(consultar_vencimento(meses, incluir_vencidos, sessao=sessao))
+    except Exception as e:
+        return jsonify({'error': f'Erro ao consultar vencimentos: {str(e)}'}), 500
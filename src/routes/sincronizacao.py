@@ -0,0 +1,17 @@
+from flask import Blueprint, jsonify, request
+from src.services.sincronizacao import LIMITE_MAXIMO, LIMITE_PADRAO, alteracoes_desde
+
+sync_bp = Blueprint('sync', __name__)
+
+@sync_bp.route('/sync', methods=['GET'])
+def sincronizar():
+    """Alterações em produtos e lotes desde ``since`` (seq devolvido na chamada anterior; 0 = tudo)"""
+    since = request.args.get('since', 0, type=int)
+    limite = request.args.get('limit', LIMITE_PADRAO, type=int)
+    if since < 0 or limite < 1:
+        return jsonify({'error': 'since deve ser >= 0 e limit maior que zero'}), 400
+    
+    try:
+        return jsonify(alteracoes_desde(since, min(limite, LIMITE_MAXIMO)))
+    except Exception as e:
+        return jsonify({'error': f'Erro ao sincronizar: {str(e)}'}), 500
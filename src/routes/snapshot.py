@@ -0,0 +1,61 @@
+from flask import Blueprint, current_app, jsonify, request
+from src.models.user import db
+from src.services.contagem import com_retentativas
+from src.services.snapshots import (
+    ATUAL, ErroSnapshot, RotuloDuplicado, buscar_snapshot, comparar_snapshots, criar_snapshot,
+    estado_snapshot, listar_snapshots
+)
+
+snapshot_bp = Blueprint('snapshot', __name__)
+
+@snapshot_bp.route('/snapshots', methods=['POST'])
+def criar():
+    """Congela o estado atual dos lotes sob um rótulo"""
+    data = request.get_json(silent=True) or {}
+    checkpoint = current_app.config.get('SNAPSHOT_CHECKPOINT', 10)
+    
+    try:
+        snapshot = com_retentativas(lambda: criar_snapshot(data.get('rotulo'), checkpoint))
+    except RotuloDuplicado as e:
+        return jsonify({'error': str(e)}), 409
+    except ErroSnapshot as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Erro ao criar snapshot: {str(e)}'}), 500
+    
+    return jsonify(snapshot.to_dict()), 201
+
+@snapshot_bp.route('/snapshots', methods=['GET'])
+def listar():
+    """Snapshots existentes, do mais antigo para o mais novo"""
+    return jsonify(listar_snapshots())
+
+@snapshot_bp.route('/snapshots/<rotulo>', methods=['GET'])
+def obter(rotulo):
+    """Lotes como estavam no snapshot (``?produto=`` filtra um produto)"""
+    snapshot = buscar_snapshot(rotulo)
+    if snapshot is None:
+        return jsonify({'error': 'Snapshot não encontrado'}), 404
+    
+    try:
+        resposta = snapshot.to_dict()
+        resposta['lotes'] = estado_snapshot(snapshot, request.args.get('produto'))
+        return jsonify(resposta)
+    except Exception as e:
+        return jsonify({'error': f'Erro ao reconstruir snapshot: {str(e)}'}), 500
+
+@snapshot_bp.route('/snapshots/<de>/diff/<para>', methods=['GET'])
+def comparar(de, para):
+    """Diferenças por produto e lote entre dois snapshots (``atual`` = estoque atual)"""
+    snapshots = []
+    for rotulo in (de, para):
+        snapshot = None if rotulo == ATUAL else buscar_snapshot(rotulo)
+        if rotulo != ATUAL and snapshot is None:
+            return jsonify({'error': f"Snapshot '{rotulo}' não encontrado"}), 404
+        snapshots.append(snapshot)
+    
+    try:
+        return jsonify(comparar_snapshots(*snapshots))
+    except Exception as e:
+        return jsonify({'error': f'Erro ao comparar snapshots: {str(e)}'}), 500
@@ -0,0 +1,66 @@
+import re
+
+from sqlalchemy import or_, select, text
+from sqlalchemy.exc import OperationalError
+
+from src.models.user import db
+from src.models.produto import Produto
+
+LIMITE_PADRAO = 20
+LIMITE_MAXIMO = 100
+
+# Pesos do bm25 por coluna do índice (codigo, nome): código pesa mais
+_CONSULTA_FTS = text("""
+    SELECT p.codigo, p.nome
+    FROM produtos_fts
+    JOIN produtos p ON p.rowid = produtos_fts.rowid
+    WHERE produtos_fts MATCH :consulta
+    ORDER BY (p.codigo = :termo) DESC, bm25(produtos_fts, 10.0, 1.0)
+    LIMIT :limite
+""")
+
+
+def termos_busca(termo):
+    """Quebra o texto digitado nos termos indexáveis (letras e dígitos)."""
+    return re.findall(r'\w+', termo or '')
+
+
+def consulta_fts(termos):
+    """Expressão MATCH em que todos os termos precisam aparecer, como prefixo."""
+    return ' '.join(f'"{t}"*' for t in termos)
+
+
+def _buscar_like(termos, termo, limite, sessao):
+    # Sem FTS5: cada termo precisa aparecer no código ou no nome (sem ranking)
+    filtros = [
+        or_(Produto.codigo.like(f'{t}%'), Produto.nome.like(f'%{t}%')) for t in termos
+    ]
+    rows = sessao.execute(
+        select(Produto.codigo, Produto.nome)
+        .where(*filtros)
+        .order_by((Produto.codigo == termo).desc(), Produto.codigo)
+        .limit(limite)
+    )
+    return [{'codigo': codigo, 'nome': nome} for codigo, nome in rows]
+
+
+def buscar_produtos(termo, limite=LIMITE_PADRAO, sessao=None):
+    """Busca produtos por prefixo de código ou de palavras do nome, ignorando acentos.
+
+    Os resultados vêm ordenados por relevância, com o código exato primeiro.
+    """
+    sessao = sessao or db.session
+    termo = (termo or '').strip()
+    termos = termos_busca(termo)
+    if not termos:
+        return []
+
+    limite = max(1, min(limite, LIMITE_MAXIMO))
+    try:
+        rows = sessao.execute(_CONSULTA_FTS, {'consulta': consulta_fts(termos), 'termo': termo, 'limite': limite})
+        return [{'codigo': codigo, 'nome': nome} for codigo, nome in rows]
+    except OperationalError as e:
+        if 'no such table: produtos_fts' not in str(e.orig):
+            raise
+        sessao.rollback()
+        return _buscar_like(termos, termo, limite, sessao)
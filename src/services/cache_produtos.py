@@ -0,0 +1,162 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select
+
+from src.models.user import db
+from src.models.produto import Produto
+from src.models.lote import Lote
+from src.models.sincronizacao import RemocaoSync
+from src.models.esquema import obter_versao
+from src.services.resumo_estoque import totais_produto
+
+# Marca no cache um código consultado que não existe (leitura de código não cadastrado)
+AUSENTE = object()
+
+
+def carregar_produto(codigo, sessao=None):
+    """Produto com os seus lotes e a quantidade total, ou None se não existe."""
+    sessao = sessao or db.session
+    produto = sessao.get(Produto, codigo)
+    if produto is None:
+        return None
+    dados = produto.to_dict()
+    dados['lotes'] = [lote.to_dict() for lote in sessao.scalars(select(Lote).where(Lote.produto_codigo == codigo))]
+    dados['quantidade_total'], _ = totais_produto(codigo, sessao)
+    return dados
+
+
+def codigos_contados(resultados):
+    """Produtos alterados por uma lista de resultados de ``registrar_contagens``."""
+    return {resultado['lote']['produto_codigo'] for resultado in resultados if 'lote' in resultado}
+
+
+class CacheProdutos:
+    """Cache LRU com TTL dos produtos consultados pelo código (com lotes e total).
+
+    Antes de cada consulta a versão do estoque é lida do banco; se mudou
+    desde a última verificação, os códigos escritos nesse intervalo (por
+    qualquer worker) saem do cache pelas colunas ``seq`` e pelas remoções de
+    ``sync_remocoes``. As rotas que escrevem ainda invalidam os seus códigos
+    logo após o commit, e o TTL limita a idade de qualquer entrada.
+
+    Uma entrada só é guardada se foi lida na mesma versão em que o cache
+    está: uma leitura de um snapshot mais antigo é servida mas não guardada.
+    """
+
+    def __init__(self, max_entradas=10000, ttl=300):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expiradas = 0
+        self.invalidacoes = 0
+        self._versao = None
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _alterados(self, desde, sessao):
+        """Códigos escritos depois de ``desde``; None quando é mais simples esvaziar o cache."""
+        remocoes = sessao.execute(
+            select(RemocaoSync.tabela, RemocaoSync.chave).where(RemocaoSync.seq > desde)
+        ).all()
+        # A remoção de um lote guarda só o id: não dá para saber o produto
+        if any(tabela == 'lotes' for tabela, _ in remocoes):
+            return None
+        codigos = {chave for _, chave in remocoes}
+        for stmt in (
+            select(Produto.codigo).where(Produto.seq > desde),
+            select(Lote.produto_codigo).where(Lote.seq > desde).distinct()
+        ):
+            codigos.update(sessao.scalars(stmt.limit(self.max_entradas + 1)))
+            if len(codigos) > self.max_entradas:
+                return None
+        return codigos
+
+    def sincronizar(self, sessao=None):
+        """Descarta as entradas escritas desde a última verificação; retorna a versão lida."""
+        sessao = sessao or db.session
+        versao = obter_versao(sessao)
+        with self._lock:
+            anterior = self._versao
+        if anterior is not None and versao <= anterior:
+            return versao
+
+        codigos = self._alterados(anterior, sessao) if anterior is not None else None
+        with self._lock:
+            if codigos is None:
+                self.invalidacoes += len(self._entradas)
+                self._entradas.clear()
+            else:
+                self._invalidar(codigos)
+            self._versao = versao if self._versao is None else max(self._versao, versao)
+        return versao
+
+    def obter(self, codigo, carregar=carregar_produto, sessao=None):
+        """Dados de ``codigo`` do cache ou de ``carregar(codigo, sessao)``."""
+        sessao = sessao or db.session
+        if self.max_entradas <= 0:
+            return carregar(codigo, sessao)
+
+        versao = self.sincronizar(sessao)
+        agora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(codigo)
+            if entrada is not None:
+                expira_em, dados = entrada
+                if expira_em > agora:
+                    self._entradas.move_to_end(codigo)
+                    self.hits += 1
+                    return None if dados is AUSENTE else dados
+                del self._entradas[codigo]
+                self.expiradas += 1
+            self.misses += 1
+
+        dados = carregar(codigo, sessao)
+        with self._lock:
+            if versao == self._versao:
+                self._entradas[codigo] = (agora + self.ttl, AUSENTE if dados is None else dados)
+                self._entradas.move_to_end(codigo)
+                while len(self._entradas) > self.max_entradas:
+                    self._entradas.popitem(last=False)
+        return dados
+
+    def _invalidar(self, codigos):
+        for codigo in codigos:
+            if self._entradas.pop(codigo, None) is not None:
+                self.invalidacoes += 1
+
+    def invalidar(self, *codigos):
+        """Remove ``codigos`` do cache (chamado pelas rotas depois do commit)."""
+        with self._lock:
+            self._invalidar(codigos)
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                'entradas': len(self._entradas),
+                'max_entradas': self.max_entradas,
+                'ttl': self.ttl,
+                'versao': self._versao,
+                'hits': self.hits,
+                'misses': self.misses,
+                'taxa_acerto': round(self.hits / consultas, 4) if consultas else None,
+                'expiradas': self.expiradas,
+                'invalidacoes': self.invalidacoes
+            }
+
+
+_cache = None
+
+
+def get_cache_produtos(app):
+    """Cache de produtos do processo atual, configurado a partir de ``app.config``."""
+    global _cache
+    if _cache is None:
+        _cache = CacheProdutos(
+            app.config.get('PRODUTO_CACHE_MAX', 10000),
+            app.config.get('PRODUTO_CACHE_TTL', 300)
+        )
+    return _cache
@@ -0,0 +1,67 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+EntradaCache = namedtuple('EntradaCache', ['conteudo', 'mimetype', 'download_name'])
+
+
+class CacheRelatorios:
+    """Cache LRU em memória limitado pelo total de bytes armazenados.
+
+    As chaves incluem a versão do estoque, então entradas antigas nunca são
+    servidas depois de uma escrita; elas apenas saem pelo LRU.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_item_bytes=None):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes or max_bytes // 4
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.hits += 1
+            return entrada
+
+    def put(self, chave, conteudo, mimetype, download_name=None):
+        """Guarda ``conteudo`` (bytes); itens grandes demais são ignorados."""
+        if len(conteudo) > self.max_item_bytes:
+            return False
+        with self._lock:
+            antiga = self._entradas.pop(chave, None)
+            if antiga is not None:
+                self.total_bytes -= len(antiga.conteudo)
+            self._entradas[chave] = EntradaCache(conteudo, mimetype, download_name)
+            self.total_bytes += len(conteudo)
+            while self.total_bytes > self.max_bytes:
+                _, removida = self._entradas.popitem(last=False)
+                self.total_bytes -= len(removida.conteudo)
+        return True
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+_cache = None
+
+
+def get_cache(app):
+    """Cache de relatórios do processo atual, configurado a partir de ``app.config``."""
+    global _cache
+    if _cache is None:
+        _cache = CacheRelatorios(app.config.get('RELATORIO_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    return _cache
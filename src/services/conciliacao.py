@@ -0,0 +1,229 @@
+import importlib.util
+import io
+import time
+
+from sqlalchemy import select
+
+from src.models.user import db
+from src.models.produto import Produto
+from src.models.lote import Lote
+from src.services.snapshots import consulta_estado
+
+# pandas e numpy são importados dentro das funções, como em ``importacao``
+
+FALTANDO = 'faltando'
+SOBRA = 'sobra'
+DIVERGENTE = 'divergente'
+DESCONHECIDO = 'desconhecido'
+TIPOS = (DESCONHECIDO, FALTANDO, SOBRA, DIVERGENTE)
+
+# Nomes aceitos no cabeçalho do arquivo (sem diferenciar maiúsculas; espaços viram _)
+ALIASES = {
+    'produto_codigo': 'codigo', 'codigo': 'codigo', 'código': 'codigo', 'produto': 'codigo',
+    'lote': 'lote',
+    'quantidade': 'esperada', 'quantidade_esperada': 'esperada', 'saldo': 'esperada', 'estoque': 'esperada',
+}
+
+# Discrepâncias listadas na resposta JSON (as demais só entram nos totais)
+LIMITE_PADRAO = 10000
+LIMITE_MAXIMO = 1000000
+
+# Leitor de .xlsx: calamine (Rust, python-calamine no requirements.txt), bem
+# mais rápido que o openpyxl; o openpyxl fica como reserva se ele faltar
+MOTOR_EXCEL = 'calamine' if importlib.util.find_spec('python_calamine') else 'openpyxl'
+
+COLUNAS_PLANILHA = ['Tipo', 'Código', 'Lote', 'Quantidade Esperada', 'Quantidade Contada', 'Diferença']
+
+
+class ErroConciliacao(ValueError):
+    """Arquivo sem as colunas necessárias ou em formato não suportado (vira HTTP 400)."""
+
+
+def _coluna(nome):
+    return ALIASES.get(str(nome).strip().lower().replace(' ', '_'))
+
+
+def ler_esperado(arquivo, nome_arquivo):
+    """Lê o arquivo de estoque esperado (.csv ou .xlsx) para um DataFrame.
+
+    Todas as células são lidas como texto e só as colunas reconhecidas em
+    ``ALIASES`` são mantidas, renomeadas para ``codigo``, ``lote`` (opcional)
+    e ``esperada``. No CSV o separador pode ser ``,`` ou ``;``.
+    """
+    import pandas as pd
+
+    manter = lambda nome: _coluna(nome) is not None  # noqa: E731
+    if nome_arquivo.lower().endswith('.csv'):
+        dados = arquivo.read()
+        primeira = dados[:dados.find(b'\n')].decode('utf-8-sig', errors='replace')
+        separador = ';' if primeira.count(';') > primeira.count(',') else ','
+        # Só as chaves como texto: a quantidade é convertida pelo parser em C do
+        # pandas e cai para texto sozinha quando tem vírgula decimal ou lixo
+        texto = {nome.strip('"'): str for nome in primeira.strip().split(separador)
+                 if _coluna(nome.strip('"')) in ('codigo', 'lote')}
+        df = pd.read_csv(io.BytesIO(dados), sep=separador, dtype=texto, usecols=manter,
+                         encoding='utf-8-sig', keep_default_na=False)
+    elif nome_arquivo.lower().endswith('.xlsx'):
+        df = pd.read_excel(arquivo, dtype=str, engine=MOTOR_EXCEL)
+        df = df[[nome for nome in df.columns if manter(nome)]]
+    else:
+        raise ErroConciliacao('Formato não suportado (use .csv ou .xlsx)')
+
+    df.columns = [_coluna(nome) for nome in df.columns]
+    df = df.loc[:, ~df.columns.duplicated()]
+    if 'codigo' not in df.columns or 'esperada' not in df.columns:
+        raise ErroConciliacao('O arquivo precisa das colunas produto_codigo e quantidade (lote é opcional)')
+    return df
+
+
+def normalizar_esperado(df):
+    """Limpa e agrega o estoque esperado de forma vetorizada.
+
+    Remove espaços, converte a quantidade (vírgula decimal aceita) e descarta
+    linhas sem código ou com quantidade inválida. Linhas repetidas do mesmo
+    produto/lote são somadas. Retorna ``(esperado, invalidas)``.
+    """
+    import pandas as pd
+
+    chaves = ['codigo', 'lote'] if 'lote' in df.columns else ['codigo']
+    limpo = pd.DataFrame({chave: df[chave].fillna('').astype(str).str.strip() for chave in chaves})
+    quantidade = df['esperada']
+    if not pd.api.types.is_numeric_dtype(quantidade):
+        texto = quantidade.fillna('').astype(str).str.strip().str.replace(',', '.', regex=False)
+        quantidade = pd.to_numeric(texto, errors='coerce')
+    limpo['esperada'] = quantidade
+
+    validas = limpo['codigo'].ne('') & limpo['esperada'].notna()
+    limpo = limpo[validas]
+    esperado = limpo.groupby(chaves, sort=False, as_index=False)['esperada'].sum()
+    return esperado, int((~validas).sum())
+
+
+def carregar_estoque(snapshot=None, sessao=None):
+    """Produtos e lotes (do estoque atual ou de ``snapshot``) em uma consulta, como DataFrame.
+
+    Produtos sem lotes vêm uma vez com ``lote`` nulo e quantidade 0. As
+    linhas são lidas direto do cursor do driver: montar um ``Row`` do
+    SQLAlchemy por lote custava mais que a consulta inteira.
+    """
+    import pandas as pd
+
+    sessao = sessao or db.session
+    if snapshot is None:
+        stmt = select(Produto.codigo, Lote.lote, Lote.quantidade).outerjoin(
+            Lote, Lote.produto_codigo == Produto.codigo)
+    else:
+        estado = consulta_estado(snapshot).subquery()
+        stmt = select(Produto.codigo, estado.c.lote, estado.c.quantidade).outerjoin(
+            estado, estado.c.produto_codigo == Produto.codigo)
+
+    compilado = stmt.compile(dialect=sessao.get_bind().dialect)
+    parametros = [compilado.params[nome] for nome in compilado.positiontup or ()]
+    cursor = sessao.connection().connection.cursor()
+    try:
+        cursor.execute(str(compilado), parametros)
+        linhas = cursor.fetchall()
+    finally:
+        cursor.close()
+    atual = pd.DataFrame.from_records(linhas, columns=['codigo', 'lote', 'contada'])
+    atual['contada'] = atual['contada'].fillna(0).astype('int64')
+    return atual
+
+
+def conciliar(esperado, atual):
+    """Compara o estoque esperado com o contado; retorna ``(discrepancias, totais)``.
+
+    Com a coluna ``lote`` no esperado a comparação é por produto e lote;
+    sem ela, pelo total de cada produto. Tudo em ``merge`` e máscaras do
+    pandas, sem laço por linha:
+
+    - ``desconhecido``: código que não existe no cadastro de produtos
+    - ``faltando``: esperado, mas sem quantidade contada
+    - ``sobra``: contado, mas fora do esperado
+    - ``divergente``: nos dois lados com quantidades diferentes
+    """
+    import numpy as np
+    import pandas as pd
+
+    por_lote = 'lote' in esperado.columns
+    catalogo = pd.Index(atual['codigo'].unique())
+    if por_lote:
+        chaves = ['codigo', 'lote']
+        contado = atual[atual['lote'].notna()]
+    else:
+        chaves = ['codigo']
+        contado = atual.groupby('codigo', sort=False, as_index=False)['contada'].sum()
+
+    m = esperado.merge(contado[chaves + ['contada']], on=chaves, how='outer', indicator=True)
+    m['esperada'] = m['esperada'].fillna(0)
+    m['contada'] = m['contada'].fillna(0)
+    m['diferenca'] = m['contada'] - m['esperada']
+
+    desconhecido = ~m['codigo'].isin(catalogo)
+    so_esperado = m['_merge'].eq('left_only') | (m['contada'].eq(0) & m['esperada'].ne(0))
+    tipo = np.select(
+        [desconhecido, so_esperado & m['esperada'].ne(0),
+         m['_merge'].eq('right_only') & m['contada'].ne(0), m['diferenca'].ne(0)],
+        [DESCONHECIDO, FALTANDO, SOBRA, DIVERGENTE],
+        default=''
+    )
+    m['tipo'] = tipo
+
+    discrepancias = m[m['tipo'].ne('')].drop(columns='_merge')
+    discrepancias['tipo'] = pd.Categorical(discrepancias['tipo'], categories=TIPOS, ordered=True)
+    discrepancias = discrepancias.sort_values(['tipo'] + chaves, kind='stable').reset_index(drop=True)
+
+    contagem = discrepancias['tipo'].value_counts()
+    totais = {
+        'modo': 'lote' if por_lote else 'produto',
+        'chaves_esperadas': len(esperado),
+        'chaves_comparadas': len(m),
+        'ok': int(len(m) - len(discrepancias)),
+        **{tipo: int(contagem.get(tipo, 0)) for tipo in TIPOS},
+        'quantidade_esperada': _numero(m['esperada'].sum()),
+        'quantidade_contada': _numero(m['contada'].sum()),
+        'diferenca': _numero(m['diferenca'].sum()),
+    }
+    return discrepancias, totais
+
+
+def _numero(valor):
+    valor = float(valor)
+    return int(valor) if valor.is_integer() else valor
+
+
+def registros(discrepancias, limite=None):
+    """Discrepâncias como lista de dicts para o JSON (no máximo ``limite``)."""
+    df = discrepancias if limite is None else discrepancias.head(limite)
+    lista = []
+    for row in df.itertuples(index=False):
+        item = {'tipo': row.tipo, 'produto_codigo': row.codigo}
+        if 'lote' in df.columns:
+            item['lote'] = row.lote if isinstance(row.lote, str) else None
+        item['quantidade_esperada'] = _numero(row.esperada)
+        item['quantidade_contada'] = _numero(row.contada)
+        item['diferenca'] = _numero(row.diferenca)
+        lista.append(item)
+    return lista
+
+
+def linhas_planilha(discrepancias):
+    """Linhas na ordem de ``COLUNAS_PLANILHA`` para o ``escrever_excel``."""
+    for row in discrepancias.itertuples(index=False):
+        lote = getattr(row, 'lote', None)
+        yield [
+            row.tipo, row.codigo, lote if isinstance(lote, str) else '-',
+            _numero(row.esperada), _numero(row.contada), _numero(row.diferenca)
+        ]
+
+
+def conciliar_arquivo(arquivo, nome_arquivo, snapshot=None, sessao=None):
+    """Lê ``arquivo``, carrega o estoque e concilia; retorna ``(discrepancias, totais)``."""
+    inicio = time.perf_counter()
+    bruto = ler_esperado(arquivo, nome_arquivo)
+    esperado, invalidas = normalizar_esperado(bruto)
+    discrepancias, totais = conciliar(esperado, carregar_estoque(snapshot, sessao))
+    totais['linhas_arquivo'] = len(bruto)
+    totais['linhas_invalidas'] = invalidas
+    totais['segundos'] = round(time.perf_counter() - inicio, 3)
+    return discrepancias, totais
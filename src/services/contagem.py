@@ -0,0 +1,175 @@
+import random
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam, select, text, tuple_
+from sqlalchemy.exc import OperationalError
+
+from src.models.user import db
+from src.models.produto import Produto
+from src.models.lote import Lote
+
+# Limite de itens aceitos em uma única requisição de contagem em lote
+MAX_ITENS_BATCH = 1000
+
+# Retentativas quando outro worker está com o banco travado para escrita
+TENTATIVAS_BLOQUEIO = 8
+ESPERA_BLOQUEIO = 0.05
+
+# Faixa aceita para o ano de validade
+ANO_MINIMO = 2000
+ANO_MAXIMO = 2100
+
+CRIADO = 'criado'
+ATUALIZADO = 'atualizado'
+ERRO = 'erro'
+
+PRODUTO_NAO_ENCONTRADO = 'Produto não encontrado'
+
+
+def validar_contagem(data):
+    """Valida os campos de uma contagem; retorna a mensagem de erro ou ``None``."""
+    if not isinstance(data, dict) or not data:
+        return 'Dados não fornecidos'
+
+    if not all([data.get('produto_codigo'), data.get('lote'), data.get('validade_mes'), data.get('validade_ano')]):
+        return 'Campos obrigatórios: produto_codigo, lote, validade_mes, validade_ano'
+
+    if not isinstance(data['produto_codigo'], (str, int)) or not isinstance(data['lote'], (str, int)):
+        return 'produto_codigo e lote devem ser texto'
+
+    mes, ano = data['validade_mes'], data['validade_ano']
+    if not _inteiro(mes) or not 1 <= mes <= 12:
+        return 'validade_mes deve ser um número de 1 a 12'
+    if not _inteiro(ano) or not ANO_MINIMO <= ano <= ANO_MAXIMO:
+        return f'validade_ano deve ser um número de {ANO_MINIMO} a {ANO_MAXIMO}'
+
+    quantidade = data.get('quantidade')
+    if not _inteiro(quantidade) or quantidade < 0:
+        return 'Quantidade deve ser um número não negativo'
+
+    return None
+
+
+def _inteiro(valor):
+    return isinstance(valor, int) and not isinstance(valor, bool)
+
+
+def lote_dict(row):
+    """Mesmo formato de ``Lote.to_dict`` a partir de uma linha do banco."""
+    return {
+        'id': row.id,
+        'produto_codigo': row.produto_codigo,
+        'lote': row.lote,
+        'validade_mes': row.validade_mes,
+        'validade_ano': row.validade_ano,
+        'quantidade': row.quantidade,
+        'data_cadastro': row.data_cadastro.strftime('%d/%m/%Y')
+    }
+
+
+# Upsert escrito em SQL: o ``insert().on_conflict_do_update()`` do dialeto SQLite
+# não entra no cache de compilação do SQLAlchemy e seria recompilado a cada linha
+# Colunas devolvidas pelo upsert (validade_chave é calculada pelo SQLite)
+_COLUNAS_RETORNO = ['id', 'produto_codigo', 'lote', 'validade_mes', 'validade_ano', 'quantidade', 'data_cadastro']
+
+_UPSERT_LOTE = text(f"""
+    INSERT INTO lotes (produto_codigo, lote, validade_mes, validade_ano, quantidade, data_cadastro)
+    VALUES (:produto_codigo, :lote, :validade_mes, :validade_ano, :quantidade, :data_cadastro)
+    ON CONFLICT (produto_codigo, lote) DO UPDATE SET quantidade = quantidade + excluded.quantidade
+    RETURNING {', '.join(_COLUNAS_RETORNO)}
+""").bindparams(
+    bindparam('data_cadastro', type_=Lote.__table__.c.data_cadastro.type)
+).columns(*[Lote.__table__.c[coluna] for coluna in _COLUNAS_RETORNO])
+
+
+def upsert_lote(sessao, produto_codigo, lote, validade_mes, validade_ano, quantidade):
+    """Cria o lote ou soma ``quantidade`` ao existente em um único comando SQL.
+
+    O incremento acontece dentro do SQLite (``ON CONFLICT ... DO UPDATE``) sobre
+    a constraint ``unique_produto_lote``, sem ler a quantidade antes. A validade
+    de um lote existente é mantida. Retorna a linha resultante.
+    """
+    return sessao.execute(_UPSERT_LOTE, {
+        'produto_codigo': produto_codigo,
+        'lote': lote,
+        'validade_mes': validade_mes,
+        'validade_ano': validade_ano,
+        'quantidade': quantidade,
+        'data_cadastro': datetime.utcnow()
+    }).one()
+
+
+def registrar_contagens(itens, sessao=None):
+    """Aplica uma lista de contagens na transação corrente, sem fazer commit.
+
+    Os códigos de produto e os lotes já existentes são consultados uma única
+    vez para o lote inteiro. Itens inválidos são relatados e ignorados; os
+    demais são gravados com ``upsert_lote``. Retorna um resultado por item, na
+    ordem recebida.
+    """
+    sessao = sessao or db.session
+    resultados = [None] * len(itens)
+    validos = []
+
+    for indice, item in enumerate(itens):
+        erro = validar_contagem(item)
+        if erro:
+            resultados[indice] = {'indice': indice, 'status': ERRO, 'error': erro}
+        else:
+            validos.append((indice, dict(item, produto_codigo=str(item['produto_codigo']), lote=str(item['lote']))))
+
+    codigos = {item['produto_codigo'] for _, item in validos}
+    existentes = set(sessao.execute(
+        select(Produto.codigo).where(Produto.codigo.in_(codigos))
+    ).scalars()) if codigos else set()
+
+    chaves = {(item['produto_codigo'], item['lote']) for _, item in validos}
+    lotes_existentes = set(sessao.execute(
+        select(Lote.produto_codigo, Lote.lote).where(tuple_(Lote.produto_codigo, Lote.lote).in_(chaves))
+    ).tuples()) if chaves else set()
+
+    for indice, item in validos:
+        produto_codigo = item['produto_codigo']
+        if produto_codigo not in existentes:
+            resultados[indice] = {'indice': indice, 'status': ERRO, 'error': PRODUTO_NAO_ENCONTRADO}
+            continue
+
+        chave = (produto_codigo, item['lote'])
+        row = upsert_lote(
+            sessao, produto_codigo, item['lote'],
+            item['validade_mes'], item['validade_ano'], item['quantidade']
+        )
+        resultados[indice] = {
+            'indice': indice,
+            'status': ATUALIZADO if chave in lotes_existentes else CRIADO,
+            'lote': lote_dict(row)
+        }
+        lotes_existentes.add(chave)
+
+    return resultados
+
+
+def _banco_bloqueado(erro):
+    mensagem = str(erro.orig).lower()
+    return 'database is locked' in mensagem or 'database is busy' in mensagem
+
+
+def com_retentativas(operacao, sessao=None, tentativas=TENTATIVAS_BLOQUEIO):
+    """Executa ``operacao()`` e faz commit, repetindo se o banco estiver travado.
+
+    Em ``database is locked`` a transação é desfeita e a operação inteira é
+    repetida com espera exponencial (com jitter), então ``operacao`` não deve
+    ter efeitos fora do banco. Outros erros são propagados.
+    """
+    sessao = sessao or db.session
+    for tentativa in range(tentativas):
+        try:
+            resultado = operacao()
+            sessao.commit()
+            return resultado
+        except OperationalError as e:
+            sessao.rollback()
+            if not _banco_bloqueado(e) or tentativa == tentativas - 1:
+                raise
+            time.sleep(ESPERA_BLOQUEIO * (2 ** tentativa) * random.uniform(0.5, 1.5))
@@ -0,0 +1,271 @@
+import os
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from flask import current_app, g
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from src.models.user import db
+from src.models.lote import Lote
+from src.models.versao import EstoqueVersao
+from src.models.estoque_resumo import EstoqueProduto, EstoqueTotais
+from src.models.sincronizacao import RemocaoSync
+from src.models.esquema import obter_versao, preparar_esquema
+from src.models.perfil_sqlite import configurar_sqlite
+from src.services.metricas import instrumentar_engine
+from src.services.resumo_estoque import ler_resumo
+
+# O banco principal guarda o catálogo de produtos e os lotes do depósito
+# padrão; cada depósito extra tem os seus lotes (e os totais mantidos pelos
+# triggers) em um arquivo SQLite próprio, registrado como bind do SQLAlchemy.
+# Escritas em depósitos diferentes não disputam o mesmo arquivo.
+PADRAO = 'principal'
+
+# ``?deposito=todos``: relatório consolidado de todos os depósitos
+TODOS = 'todos'
+
+# Nome do banco principal no ATTACH feito nas conexões dos depósitos
+ALIAS_CATALOGO = 'catalogo'
+
+TABELAS_DEPOSITO = [
+    Lote.__table__, EstoqueVersao.__table__, EstoqueProduto.__table__,
+    EstoqueTotais.__table__, RemocaoSync.__table__
+]
+
+NOME_VALIDO = re.compile(r'^[a-z0-9_]{1,40}$')
+
+# Leitura paralela: linhas por bloco e blocos que cada thread lê à frente do consumidor
+BLOCO_LEITURA = 1000
+BLOCOS_A_FRENTE = 4
+
+
+class DepositoInexistente(LookupError):
+    """Depósito que não está em ``DEPOSITOS`` (vira HTTP 404)."""
+
+
+def ler_depositos(valor, padrao=PADRAO):
+    """Nomes dos depósitos extras a partir de ``DEPOSITOS`` (separados por vírgula)."""
+    nomes = []
+    for nome in (parte.strip().lower() for parte in (valor or '').split(',')):
+        if not nome or nome == padrao or nome in nomes:
+            continue
+        if nome == TODOS or not NOME_VALIDO.match(nome):
+            raise ValueError(f'Nome de depósito inválido: {nome}')
+        nomes.append(nome)
+    return nomes
+
+
+def chave_bind(nome):
+    return f'deposito_{nome}'
+
+
+def binds_depositos(nomes, diretorio):
+    """``SQLALCHEMY_BINDS`` com um arquivo ``deposito_<nome>.db`` por depósito em ``diretorio``."""
+    return {
+        chave_bind(nome): f"sqlite:///{os.path.abspath(os.path.join(diretorio, f'deposito_{nome}.db'))}"
+        for nome in nomes
+    }
+
+
+def anexar_catalogo(engine, caminho_catalogo):
+    """Registra um hook que anexa o banco principal a cada conexão do depósito.
+
+    O arquivo do depósito não tem ``produtos``: o SQLite procura os nomes sem
+    prefixo primeiro no próprio depósito (``lotes`` e totais) e depois no
+    catálogo anexado, então as consultas com JOIN em produtos valem sem
+    mudança. As escritas usam o BEGIN adiado do pysqlite e só travam o arquivo
+    do depósito (um BEGIN IMMEDIATE travaria também o catálogo).
+    """
+    @event.listens_for(engine, 'connect')
+    def _ao_conectar(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f'ATTACH DATABASE ? AS {ALIAS_CATALOGO}', (caminho_catalogo,))
+        finally:
+            cursor.close()
+
+    return engine
+
+
+def configurar_depositos(app):
+    """Registra PRAGMAs, ATTACH do catálogo e métricas nos engines dos depósitos extras.
+
+    Precisa vir antes do ``db.create_all()``, que já abre uma conexão em cada bind.
+    """
+    # A chave estrangeira de lotes para produtos atravessaria bancos, o que o
+    # SQLite não verifica; registrar_contagens já confere o produto no catálogo
+    perfil = dict(app.config['SQLITE_PERFIL'], foreign_keys='OFF')
+    catalogo = db.engine.url.database
+    for nome in app.config.get('DEPOSITOS', []):
+        engine = db.engines[chave_bind(nome)]
+        configurar_sqlite(engine, perfil)
+        anexar_catalogo(engine, catalogo)
+        instrumentar_engine(engine)
+
+
+def preparar_depositos(app):
+    """Cria as tabelas e os triggers de cada depósito extra (depois do esquema do catálogo)."""
+    for nome in app.config.get('DEPOSITOS', []):
+        engine = db.engines[chave_bind(nome)]
+        db.metadata.create_all(engine, tables=TABELAS_DEPOSITO)
+        preparar_esquema(engine, catalogo=False)
+
+
+def nomes_depositos(app):
+    """Todos os depósitos, o padrão primeiro."""
+    return [app.config.get('DEPOSITO_PADRAO', PADRAO)] + list(app.config.get('DEPOSITOS', []))
+
+
+def resolver_deposito(app, nome):
+    """Depósitos de ``?deposito=``: None para o padrão, ``[nome]`` ou, com ``todos``, a lista inteira."""
+    nome = (nome or '').strip().lower()
+    if not nome or nome == app.config.get('DEPOSITO_PADRAO', PADRAO):
+        return None
+    if nome == TODOS:
+        nomes = nomes_depositos(app)
+        return nomes if len(nomes) > 1 else None
+    if nome not in app.config.get('DEPOSITOS', []):
+        raise DepositoInexistente(f'Depósito não encontrado: {nome}')
+    return [nome]
+
+
+def _padrao(nome):
+    return nome is None or nome == current_app.config.get('DEPOSITO_PADRAO', PADRAO)
+
+
+def engine_deposito(nome=None):
+    return db.engine if _padrao(nome) else db.engines[chave_bind(nome)]
+
+
+def sessao_deposito(nome=None):
+    """Sessão do depósito ``nome``; o padrão usa a própria ``db.session``.
+
+    As sessões dos outros depósitos ficam em ``g`` e são fechadas por
+    ``fechar_sessoes`` no fim do contexto da aplicação.
+    """
+    if _padrao(nome):
+        return db.session
+    sessoes = g.setdefault('sessoes_deposito', {})
+    if nome not in sessoes:
+        sessoes[nome] = Session(engine_deposito(nome))
+    return sessoes[nome]
+
+
+def fechar_sessoes(excecao=None):
+    for sessao in g.pop('sessoes_deposito', {}).values():
+        sessao.close()
+
+
+def versao_depositos(nomes):
+    """Chave de versão do estoque de ``nomes``: muda com qualquer escrita no catálogo ou neles."""
+    partes = [str(obter_versao())]
+    partes.extend(f'{nome}.{obter_versao(sessao_deposito(nome))}' for nome in nomes if not _padrao(nome))
+    return '-'.join(partes)
+
+
+def uris_depositos(nomes):
+    """``[nome, uri]`` de cada depósito, para os jobs de relatório (que rodam fora do app)."""
+    return [[nome, engine_deposito(nome).url.render_as_string(hide_password=False)] for nome in nomes]
+
+
+def resumo_deposito(nome):
+    """Resumo de um depósito; ``total_produtos`` vem do catálogo."""
+    resumo = ler_resumo(sessao_deposito(nome))
+    # Os triggers de produtos ficam no banco principal: o total do depósito não acompanha o catálogo
+    total = ler_resumo()['total_produtos']
+    resumo.update(total_produtos=total, produtos_sem_estoque=total - resumo['produtos_com_estoque'])
+    return resumo
+
+
+def _totais_por_produto(engine):
+    with engine.connect() as conexao:
+        return conexao.execute(
+            select(EstoqueProduto.produto_codigo, EstoqueProduto.quantidade_total, EstoqueProduto.total_lotes)
+        ).all()
+
+
+def resumo_consolidado(nomes):
+    """Resumo somando os depósitos ``nomes``, com os totais por produto lidos em paralelo."""
+    engines = [engine_deposito(nome) for nome in nomes]
+    with ThreadPoolExecutor(len(engines)) as pool:
+        partes = list(pool.map(_totais_por_produto, engines))
+
+    quantidades = {}
+    total_lotes = 0
+    for linhas in partes:
+        for codigo, quantidade, lotes in linhas:
+            quantidades[codigo] = quantidades.get(codigo, 0) + quantidade
+            total_lotes += lotes
+    total_produtos = ler_resumo()['total_produtos']
+    com_estoque = sum(1 for quantidade in quantidades.values() if quantidade > 0)
+    return {
+        'total_produtos': total_produtos,
+        'produtos_com_estoque': com_estoque,
+        'produtos_sem_estoque': total_produtos - com_estoque,
+        'quantidade_total': sum(quantidades.values()),
+        'total_lotes': total_lotes
+    }
+
+
+def _entregar(fila, item, parar):
+    while not parar.is_set():
+        try:
+            fila.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+def _ler(engine, stmt, bloco, fila, parar):
+    try:
+        with engine.connect() as conexao:
+            resultado = conexao.execute(stmt)
+            while not parar.is_set():
+                linhas = resultado.fetchmany(bloco)
+                if not linhas:
+                    break
+                _entregar(fila, linhas, parar)
+        _entregar(fila, None, parar)
+    except Exception as e:
+        _entregar(fila, e, parar)
+
+
+def _consumir(fila):
+    while True:
+        item = fila.get()
+        if item is None:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield from item
+
+
+@contextmanager
+def varrer_em_paralelo(consultas, bloco=BLOCO_LEITURA):
+    """Executa cada ``(engine, stmt)`` de ``consultas`` em uma thread própria.
+
+    Entrega um iterador de linhas por consulta, na mesma ordem. Cada thread
+    fica no máximo ``BLOCOS_A_FRENTE`` blocos de ``bloco`` linhas à frente de
+    quem consome, então a memória não cresce com o estoque; o sqlite3 solta o
+    GIL enquanto o SQLite lê, e as partições são percorridas ao mesmo tempo.
+    Ao sair do ``with`` as leituras que não terminaram são interrompidas.
+    """
+    parar = threading.Event()
+    filas = []
+    threads = []
+    for engine, stmt in consultas:
+        fila = queue.Queue(BLOCOS_A_FRENTE)
+        thread = threading.Thread(target=_ler, args=(engine, stmt, bloco, fila, parar), daemon=True)
+        thread.start()
+        filas.append(fila)
+        threads.append(thread)
+    try:
+        yield [_consumir(fila) for fila in filas]
+    finally:
+        parar.set()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,134 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from collections import namedtuple
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # está no requirements.txt; sem ele só há gzip (ou os .br gerados no build)
+    brotli = None
+
+# Arquivos do build do Vite com hash no nome (assets/index-Hc5FyP6f.js): o
+# conteúdo nunca muda para o mesmo nome, então podem ficar em cache
+# indefinidamente. O hash tem 8 caracteres e quase sempre algum dígito ou
+# maiúscula, o que separa ``logo-original.png``; na dúvida vale o cache curto
+DIRETORIO_HASH = 'assets/'
+PADRAO_HASH = re.compile(r'-(?=[A-Za-z0-9_-]*[A-Z0-9])[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$')
+
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+CACHE_PADRAO = 'public, max-age=3600'
+# index.html aponta para os nomes com hash do build atual: cache curto e
+# revalidação por ETag para que um deploy novo chegue logo aos coletores
+CACHE_INDEX = f"public, max-age={int(os.environ.get('ESTATICOS_MAX_AGE_INDEX', 60))}, must-revalidate"
+
+EXTENSOES_COMPRIMIVEIS = {'.html', '.js', '.mjs', '.css', '.json', '.map', '.svg', '.txt', '.xml', '.ico', '.webmanifest'}
+
+# Ordem de preferência das codificações e extensão dos arquivos pré-comprimidos no build
+CODIFICACOES = [('br', '.br'), ('gzip', '.gz')]
+
+# Uma variante comprimida só é guardada se economizar pelo menos 10%
+GANHO_MINIMO = 0.9
+
+# conteudo: bytes originais; variantes: codificação -> bytes comprimidos
+Arquivo = namedtuple('Arquivo', ['conteudo', 'variantes', 'mimetype', 'etag', 'cache_control'])
+
+
+def _comprimir(conteudo, codificacao):
+    if codificacao == 'gzip':
+        return gzip.compress(conteudo, compresslevel=9, mtime=0)
+    if codificacao == 'br' and brotli is not None:
+        return brotli.compress(conteudo, quality=11)
+    return None
+
+
+def _cache_control(caminho):
+    if caminho == 'index.html':
+        return CACHE_INDEX
+    if caminho.startswith(DIRETORIO_HASH) and PADRAO_HASH.search(os.path.basename(caminho)):
+        return CACHE_IMUTAVEL
+    return CACHE_PADRAO
+
+
+def _carregar_arquivo(diretorio, caminho):
+    completo = os.path.join(diretorio, caminho)
+    with open(completo, 'rb') as f:
+        conteudo = f.read()
+
+    variantes = {}
+    if os.path.splitext(caminho)[1].lower() in EXTENSOES_COMPRIMIVEIS:
+        for codificacao, extensao in CODIFICACOES:
+            # Usa o arquivo pré-comprimido do build se existir, senão comprime agora
+            if os.path.exists(completo + extensao):
+                with open(completo + extensao, 'rb') as f:
+                    comprimido = f.read()
+            else:
+                comprimido = _comprimir(conteudo, codificacao)
+            if comprimido is not None and len(comprimido) < len(conteudo) * GANHO_MINIMO:
+                variantes[codificacao] = comprimido
+
+    return Arquivo(
+        conteudo=conteudo,
+        variantes=variantes,
+        mimetype=mimetypes.guess_type(caminho)[0] or 'application/octet-stream',
+        etag=hashlib.sha1(conteudo).hexdigest()[:20],
+        cache_control=_cache_control(caminho)
+    )
+
+
+class ArquivosEstaticos:
+    """Manifesto em memória de ``diretorio`` (o build do frontend).
+
+    Os arquivos são lidos e comprimidos uma vez, na inicialização: as
+    requisições não tocam o disco. Com ``preload_app`` do gunicorn o manifesto
+    é montado no processo mestre e compartilhado pelos workers.
+    """
+
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+        self.arquivos = {}
+        self.carregar()
+
+    def carregar(self):
+        arquivos = {}
+        if os.path.isdir(self.diretorio):
+            for raiz, _, nomes in os.walk(self.diretorio):
+                for nome in nomes:
+                    if nome.endswith(tuple(extensao for _, extensao in CODIFICACOES)):
+                        continue
+                    caminho = os.path.relpath(os.path.join(raiz, nome), self.diretorio).replace(os.sep, '/')
+                    arquivos[caminho] = _carregar_arquivo(self.diretorio, caminho)
+        self.arquivos = arquivos
+        return len(arquivos)
+
+    def resposta(self, caminho):
+        """Response para ``caminho`` (relativo ao diretório) ou None se não existir.
+
+        Escolhe a variante pelo Accept-Encoding e responde 304 quando o
+        If-None-Match confere com o ETag da variante.
+        """
+        arquivo = self.arquivos.get(caminho)
+        if arquivo is None:
+            return None
+
+        codificacao = next(
+            (c for c, _ in CODIFICACOES if c in arquivo.variantes and request.accept_encodings.quality(c) > 0),
+            None
+        )
+        etag = f'{arquivo.etag}-{codificacao}' if codificacao else arquivo.etag
+
+        if request.if_none_match.contains(etag):
+            resposta = Response(status=304)
+        else:
+            resposta = Response(arquivo.variantes[codificacao] if codificacao else arquivo.conteudo,
+                                mimetype=arquivo.mimetype)
+            if codificacao:
+                resposta.headers['Content-Encoding'] = codificacao
+        resposta.set_etag(etag)
+        resposta.headers['Cache-Control'] = arquivo.cache_control
+        if arquivo.variantes:
+            resposta.vary.add('Accept-Encoding')
+        return resposta
@@ -0,0 +1,260 @@
+import atexit
+import queue
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert
+
+from src.models.user import db
+from src.models.confirmacao import ConfirmacaoContagem
+from src.services.cache_produtos import codigos_contados, get_cache_produtos
+from src.services.contagem import ERRO, com_retentativas, registrar_contagens, validar_contagem
+
+PENDENTE = 'pendente'
+
+# Segundos entre as limpezas das confirmações mais antigas que o ttl
+INTERVALO_LIMPEZA = 60
+
+FORMATO_ACK = re.compile(r'[0-9a-f]{36}')
+
+
+def novo_ack():
+    """Ack com o instante da submissão (ms, em hex) na frente do identificador aleatório."""
+    return f'{int(time.time() * 1000):012x}{uuid.uuid4().hex[:24]}'
+
+
+def idade_ack(ack):
+    """Segundos desde a submissão de ``ack``; None se não tem o formato de ``novo_ack``."""
+    if not FORMATO_ACK.fullmatch(ack):
+        return None
+    return time.time() - int(ack[:12], 16) / 1000
+
+
+class FilaCheia(Exception):
+    """A fila write-behind atingiu o limite de contagens pendentes (vira HTTP 503)."""
+
+
+class Confirmacao:
+    """Uma contagem enfileirada: ``evento`` é sinalizado quando o commit termina."""
+
+    def __init__(self, item):
+        self.ack = novo_ack()
+        self.item = item
+        self.evento = threading.Event()
+        self.resultado = None
+
+    def aguardar(self, timeout=None):
+        """Espera o commit; retorna o resultado de ``registrar_contagens`` ou None no timeout."""
+        return self.resultado if self.evento.wait(timeout) else None
+
+
+class FilaContagens:
+    """Fila write-behind de contagens com group commit.
+
+    As contagens validadas entram em uma fila em memória e uma thread
+    escritora grava em uma única transação tudo o que chegou em até
+    ``intervalo`` segundos (no máximo ``max_itens`` por commit), pagando um
+    fsync por grupo em vez de um por contagem. O resultado de cada contagem é
+    gravado na mesma transação em ``contagem_confirmacoes``, então qualquer
+    worker responde pelo ack depois do commit.
+
+    Antes do commit a contagem só existe na memória do worker que a
+    recebeu; os outros reconhecem o ack pelo instante gravado nele e o dão
+    como pendente por até ``janela_pendente`` segundos.
+
+    Contagens ainda na fila quando o processo morre sem encerrar normalmente
+    são perdidas: quem precisa da garantia deve esperar o commit (``aguardar``).
+    """
+
+    def __init__(self, app, max_itens=500, intervalo=0.002, max_pendentes=10000, ttl=3600, janela_pendente=60):
+        self.app = app
+        self.max_itens = max_itens
+        self.intervalo = intervalo
+        self.ttl = ttl
+        self.janela_pendente = janela_pendente
+        self._fila = queue.Queue(max_pendentes)
+        self._pendentes = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._encerrando = False
+        self._ultima_limpeza = 0.0
+        atexit.register(self.encerrar)
+
+    def _garantir_escritor(self):
+        # Criada sob demanda: com preload_app a fila pode ter sido criada no
+        # processo mestre, e threads não sobrevivem ao fork dos workers
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._escrever, name='fila-contagens', daemon=True)
+                self._thread.start()
+
+    def submeter(self, item):
+        """Enfileira uma contagem e retorna a sua ``Confirmacao``.
+
+        Um item inválido levanta ``ValueError`` aqui: dentro do grupo ele
+        derrubaria o commit das contagens dos outros clientes.
+        """
+        erro = validar_contagem(item)
+        if erro:
+            raise ValueError(erro)
+        self._garantir_escritor()
+        confirmacao = Confirmacao(item)
+        with self._lock:
+            self._pendentes[confirmacao.ack] = confirmacao
+        try:
+            self._fila.put_nowait(confirmacao)
+        except queue.Full:
+            with self._lock:
+                del self._pendentes[confirmacao.ack]
+            raise FilaCheia(f'Fila de contagens cheia ({self._fila.maxsize} pendentes)')
+        return confirmacao
+
+    def pendente(self, ack):
+        with self._lock:
+            return self._pendentes.get(ack)
+
+    def status(self, ack):
+        """Situação de ``ack``: pendente, gravado/erro no banco ou None.
+
+        Um ack que não está no banco nem neste processo pode estar na fila de
+        outro worker: é pendente enquanto for mais novo que ``janela_pendente``.
+        """
+        if self.pendente(ack) is not None:
+            return {'ack': ack, 'status': PENDENTE}
+        confirmacao = db.session.get(ConfirmacaoContagem, ack)
+        if confirmacao is not None:
+            return confirmacao.to_dict()
+        idade = idade_ack(ack)
+        if idade is not None and abs(idade) < self.janela_pendente:
+            return {'ack': ack, 'status': PENDENTE}
+        return None
+
+    def _coletar(self):
+        """Bloqueia até a primeira contagem e junta as que chegarem até o fim do intervalo."""
+        grupo = [self._fila.get()]
+        limite = time.monotonic() + self.intervalo
+        while len(grupo) < self.max_itens:
+            restante = limite - time.monotonic()
+            try:
+                grupo.append(self._fila.get(timeout=restante) if restante > 0 else self._fila.get_nowait())
+            except queue.Empty:
+                break
+        return [confirmacao for confirmacao in grupo if confirmacao is not None]
+
+    def _aplicar(self, grupo):
+        resultados = registrar_contagens([confirmacao.item for confirmacao in grupo])
+        db.session.execute(insert(ConfirmacaoContagem), [
+            {
+                'ack': confirmacao.ack,
+                'status': resultado['status'],
+                'erro': resultado.get('error'),
+                'lote_id': resultado['lote']['id'] if 'lote' in resultado else None,
+                'gravado_em': datetime.utcnow()
+            }
+            for confirmacao, resultado in zip(grupo, resultados)
+        ])
+        return resultados
+
+    def _transacao(self, grupo):
+        """Grava ``grupo`` em uma transação; levanta a exceção se ela falhar."""
+        with self.app.app_context():
+            try:
+                return com_retentativas(lambda: self._aplicar(grupo))
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                db.session.remove()
+
+    def _registrar_erros(self, erros):
+        """Grava o erro das contagens que falharam sozinhas, para o ack responder depois."""
+        with self.app.app_context():
+            try:
+                com_retentativas(lambda: db.session.execute(insert(ConfirmacaoContagem), [
+                    {'ack': ack, 'status': ERRO, 'erro': erro, 'lote_id': None, 'gravado_em': datetime.utcnow()}
+                    for ack, erro in erros
+                ]))
+            except Exception:
+                # Sem o registro o ack expira como não encontrado; quem esperou já tem a resposta
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+    def _gravar(self, grupo):
+        try:
+            resultados = self._transacao(grupo)
+        except Exception:
+            # Um item problemático não pode levar o grupo inteiro: cada contagem
+            # é regravada na sua transação e só as que falham voltam como erro
+            resultados, erros = [], []
+            for confirmacao in grupo:
+                try:
+                    resultados.extend(self._transacao([confirmacao]))
+                except Exception as e:
+                    resultado = {'status': ERRO, 'error': f'Erro interno: {str(e)}'}
+                    resultados.append(resultado)
+                    erros.append((confirmacao.ack, resultado['error']))
+            if erros:
+                self._registrar_erros(erros)
+
+        with self.app.app_context():
+            try:
+                self._limpar_expiradas()
+            finally:
+                db.session.remove()
+        get_cache_produtos(self.app).invalidar(*codigos_contados(resultados))
+
+        with self._lock:
+            for confirmacao, resultado in zip(grupo, resultados):
+                confirmacao.resultado = resultado
+                self._pendentes.pop(confirmacao.ack, None)
+                confirmacao.evento.set()
+
+    def _limpar_expiradas(self):
+        if time.monotonic() - self._ultima_limpeza < INTERVALO_LIMPEZA:
+            return
+        self._ultima_limpeza = time.monotonic()
+        limite = datetime.utcnow() - timedelta(seconds=self.ttl)
+        try:
+            com_retentativas(lambda: db.session.execute(
+                delete(ConfirmacaoContagem).where(ConfirmacaoContagem.gravado_em < limite)
+            ))
+        except Exception:
+            db.session.rollback()
+
+    def _escrever(self):
+        while True:
+            grupo = self._coletar()
+            if grupo:
+                self._gravar(grupo)
+            if self._encerrando and self._fila.empty():
+                return
+
+    def encerrar(self, timeout=10):
+        """Grava o que ainda está na fila e para a thread escritora."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._encerrando = True
+        self._fila.put(None)
+        self._thread.join(timeout)
+
+
+_fila = None
+
+
+def get_fila_contagens(app):
+    """Fila write-behind do processo atual, configurada a partir de ``app.config``."""
+    global _fila
+    if _fila is None:
+        _fila = FilaContagens(
+            getattr(app, '_get_current_object', lambda: app)(),
+            max_itens=app.config.get('CONTAGEM_GRUPO_MAX', 500),
+            intervalo=app.config.get('CONTAGEM_GRUPO_MS', 2) / 1000,
+            max_pendentes=app.config.get('CONTAGEM_FILA_MAX', 10000),
+            ttl=app.config.get('CONTAGEM_ACK_TTL', 3600),
+            janela_pendente=app.config.get('CONTAGEM_ACK_PENDENTE', 60)
+        )
+    return _fila
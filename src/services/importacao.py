@@ -0,0 +1,260 @@
+import csv
+import io
+import time
+from itertools import islice
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from src.models.user import db
+from src.models.produto import Produto
+from src.models.lote import Lote
+from src.services.contagem import ERRO, com_retentativas, registrar_contagens, validar_contagem
+
+# Linhas por executemany ao gravar produtos
+TAMANHO_CHUNK = 5000
+
+# Linhas por commit nas importações enviadas pela API
+TAMANHO_CHUNK_UPLOAD = 1000
+
+# Máximo de erros detalhados no relatório (os demais só entram na contagem)
+MAX_ERROS_RELATORIO = 1000
+
+# pandas e openpyxl são importados dentro das funções: este módulo é carregado
+# com as rotas e não deve pesar na inicialização dos workers
+COLUNAS_CONTAGEM = ['produto_codigo', 'lote', 'validade_mes', 'validade_ano', 'quantidade']
+
+
+def normalizar_catalogo(df):
+    """Normaliza as duas primeiras colunas (código, nome) de forma vetorizada.
+
+    Remove espaços, descarta linhas sem código ou nome e mantém a primeira
+    ocorrência de cada código. Retorna ``(catalogo, descartadas)``.
+    """
+    import pandas as pd
+
+    catalogo = pd.DataFrame({
+        'codigo': df.iloc[:, 0].astype('string').str.strip(),
+        'nome': df.iloc[:, 1].astype('string').str.strip(),
+    })
+    total = len(catalogo)
+    catalogo = catalogo[
+        catalogo['codigo'].fillna('').ne('') & catalogo['nome'].fillna('').ne('')
+    ]
+    catalogo = catalogo.drop_duplicates(subset='codigo', keep='first')
+    return catalogo.reset_index(drop=True), total - len(catalogo)
+
+
+def ler_catalogo(caminho, cabecalho=None):
+    """Lê a planilha de produtos de uma vez, com todas as células como texto."""
+    import pandas as pd
+
+    return pd.read_excel(caminho, header=cabecalho, dtype=str, usecols=[0, 1])
+
+
+def gravar_produtos(conexao, registros, tamanho_chunk=TAMANHO_CHUNK):
+    """Upsert de ``[{'codigo', 'nome'}, ...]`` em blocos de ``executemany``."""
+    stmt = insert(Produto)
+    stmt = stmt.on_conflict_do_update(index_elements=[Produto.codigo], set_={'nome': stmt.excluded.nome})
+    for inicio in range(0, len(registros), tamanho_chunk):
+        conexao.execute(stmt, registros[inicio:inicio + tamanho_chunk])
+
+
+def importar_catalogo(origem, cabecalho=None, substituir=False, engine=None, tamanho_chunk=TAMANHO_CHUNK):
+    """Importa o catálogo de ``origem`` (caminho da planilha ou DataFrame).
+
+    Compara com os produtos existentes em uma única consulta e grava só os
+    novos ou com nome alterado, tudo em uma transação. Com ``substituir``
+    remove os produtos que não estão na planilha. Retorna as contagens de
+    inseridos, atualizados, inalterados, removidos, descartados e o tempo gasto.
+    """
+    import pandas as pd
+
+    inicio = time.perf_counter()
+    engine = engine or db.engine
+    df = origem if isinstance(origem, pd.DataFrame) else ler_catalogo(origem, cabecalho)
+    catalogo, descartadas = normalizar_catalogo(df)
+
+    with engine.begin() as conexao:
+        existentes = pd.DataFrame(
+            conexao.execute(select(Produto.codigo, Produto.nome)).all(),
+            columns=['codigo', 'nome_atual']
+        ).astype('string')
+        catalogo = catalogo.merge(existentes, on='codigo', how='left')
+
+        novos = catalogo['nome_atual'].isna()
+        alterados = ~novos & catalogo['nome'].ne(catalogo['nome_atual'])
+        gravar_produtos(
+            conexao,
+            catalogo.loc[novos | alterados, ['codigo', 'nome']].to_dict('records'),
+            tamanho_chunk
+        )
+
+        removidos = 0
+        if substituir:
+            ausentes = existentes.loc[~existentes['codigo'].isin(catalogo['codigo']), 'codigo'].tolist()
+            for pos in range(0, len(ausentes), tamanho_chunk):
+                removidos += conexao.execute(
+                    Produto.__table__.delete().where(Produto.codigo.in_(ausentes[pos:pos + tamanho_chunk]))
+                ).rowcount
+
+    return {
+        'inseridos': int(novos.sum()),
+        'atualizados': int(alterados.sum()),
+        'inalterados': int((~novos & ~alterados).sum()),
+        'removidos': removidos,
+        'descartados': descartadas,
+        'segundos': round(time.perf_counter() - inicio, 3)
+    }
+
+
+class RelatorioImportacao:
+    """Acumula estatísticas e erros por linha de uma importação em andamento."""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.linhas = 0
+        self.gravadas = 0
+        self.total_erros = 0
+        self.erros = []
+        self.chunks = 0
+
+    def erro(self, linha, mensagem):
+        self.total_erros += 1
+        if len(self.erros) < MAX_ERROS_RELATORIO:
+            self.erros.append({'linha': linha, 'error': mensagem})
+
+    def to_dict(self):
+        segundos = time.perf_counter() - self.inicio
+        return {
+            'linhas': self.linhas,
+            'gravadas': self.gravadas,
+            'total_erros': self.total_erros,
+            'erros': self.erros,
+            'erros_truncados': self.total_erros > len(self.erros),
+            'commits': self.chunks,
+            'segundos': round(segundos, 3),
+            'linhas_por_segundo': round(self.linhas / segundos) if segundos > 0 else None
+        }
+
+
+def _em_chunks(iteravel, tamanho):
+    iterador = iter(iteravel)
+    while True:
+        chunk = list(islice(iterador, tamanho))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(valor).strip()
+
+
+def _validar_produto(codigo, nome):
+    if not codigo or not nome:
+        return 'Código e nome são obrigatórios'
+    if len(codigo) > Produto.codigo.type.length:
+        return f'Código com mais de {Produto.codigo.type.length} caracteres'
+    if len(nome) > Produto.nome.type.length:
+        return f'Nome com mais de {Produto.nome.type.length} caracteres'
+    return None
+
+
+def importar_produtos_xlsx(arquivo, cabecalho=False, tamanho_chunk=TAMANHO_CHUNK_UPLOAD, sessao=None):
+    """Importa produtos de uma planilha no formato de ``produtos.xlsx`` (código, nome).
+
+    A planilha é lida em modo read-only, linha a linha, e gravada com upsert em
+    blocos de ``tamanho_chunk`` linhas, um commit por bloco.
+    """
+    from openpyxl import load_workbook
+
+    sessao = sessao or db.session
+    relatorio = RelatorioImportacao()
+    wb = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        linhas = enumerate(wb.worksheets[0].iter_rows(values_only=True), start=1)
+        if cabecalho:
+            next(linhas, None)
+
+        for chunk in _em_chunks(linhas, tamanho_chunk):
+            registros = {}
+            for numero, valores in chunk:
+                relatorio.linhas += 1
+                valores = tuple(valores or ()) + (None, None)
+                codigo, nome = _texto(valores[0]), _texto(valores[1])
+                erro = _validar_produto(codigo, nome)
+                if erro:
+                    relatorio.erro(numero, erro)
+                else:
+                    registros[codigo] = {'codigo': codigo, 'nome': nome}
+
+            if registros:
+                com_retentativas(lambda: gravar_produtos(sessao, list(registros.values())), sessao)
+                relatorio.gravadas += len(registros)
+                relatorio.chunks += 1
+    finally:
+        wb.close()
+    return relatorio.to_dict()
+
+
+def _ler_csv(arquivo):
+    """DictReader sobre o upload, aceitando ``,`` ou ``;`` como separador."""
+    texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    primeira = texto.readline()
+    delimitador = ';' if primeira.count(';') > primeira.count(',') else ','
+    campos = [campo.strip().lower() for campo in next(csv.reader([primeira], delimiter=delimitador), [])]
+    return csv.DictReader(texto, fieldnames=campos, delimiter=delimitador), campos
+
+
+def _contagem_csv(linha):
+    item = {coluna: (linha.get(coluna) or '').strip() for coluna in COLUNAS_CONTAGEM}
+    for coluna in ('validade_mes', 'validade_ano', 'quantidade'):
+        try:
+            item[coluna] = int(item[coluna]) if item[coluna] else None
+        except ValueError:
+            return None, f'{coluna} deve ser um número inteiro'
+    if len(item['lote']) > Lote.lote.type.length:
+        return None, f'Lote com mais de {Lote.lote.type.length} caracteres'
+    erro = validar_contagem(item)
+    return (None, erro) if erro else (item, None)
+
+
+def importar_contagens_csv(arquivo, tamanho_chunk=TAMANHO_CHUNK_UPLOAD, sessao=None):
+    """Importa contagens de um CSV com cabeçalho ``COLUNAS_CONTAGEM``.
+
+    As linhas são lidas em sequência e aplicadas com ``registrar_contagens``
+    (soma nos lotes existentes), um commit a cada ``tamanho_chunk`` linhas.
+    """
+    sessao = sessao or db.session
+    relatorio = RelatorioImportacao()
+    leitor, campos = _ler_csv(arquivo)
+    faltando = [coluna for coluna in COLUNAS_CONTAGEM if coluna not in campos]
+    if faltando:
+        raise ValueError(f"Colunas obrigatórias ausentes no CSV: {', '.join(faltando)}")
+
+    # Linha 1 é o cabeçalho
+    for chunk in _em_chunks(enumerate(leitor, start=2), tamanho_chunk):
+        itens, numeros = [], []
+        for numero, linha in chunk:
+            relatorio.linhas += 1
+            item, erro = _contagem_csv(linha)
+            if erro:
+                relatorio.erro(numero, erro)
+            else:
+                itens.append(item)
+                numeros.append(numero)
+
+        if itens:
+            resultados = com_retentativas(lambda: registrar_contagens(itens, sessao), sessao)
+            relatorio.chunks += 1
+            for numero, resultado in zip(numeros, resultados):
+                if resultado['status'] == ERRO:
+                    relatorio.erro(numero, resultado['error'])
+                else:
+                    relatorio.gravadas += 1
+    return relatorio.to_dict()
@@ -0,0 +1,234 @@
+import base64
+import binascii
+import json
+from collections import namedtuple
+
+from flask import Response, jsonify, stream_with_context
+from sqlalchemy import DateTime, Integer, cast, func, select
+
+from src.models.user import db
+from src.models.produto import Produto
+from src.models.lote import Lote
+
+LIMITE_PADRAO = 100
+LIMITE_MAXIMO = 1000
+
+# format: objetos (lista de dicts, padrão), columnar (um array por campo) ou
+# ndjson (cabeçalho com os campos e uma linha-array por registro, em streaming)
+FORMATOS = ('objetos', 'columnar', 'ndjson')
+
+# Representação das datas nos formatos compactos, calculada pelo próprio SQLite
+DATAS = {
+    'iso': lambda coluna: func.strftime('%Y-%m-%dT%H:%M:%S', coluna),
+    'epoch': lambda coluna: cast(func.strftime('%s', coluna), Integer),
+}
+
+# Registros por lote lido do cursor no streaming NDJSON
+TAMANHO_LOTE_NDJSON = 1000
+
+
+class ErroListagem(ValueError):
+    """Parâmetro de paginação ou projeção inválido (vira HTTP 400)."""
+
+
+# colunas: campo da resposta -> coluna; chave: campo único usado na ordenação
+# estável e no cursor; formatadores: conversões aplicadas a campos específicos
+Listagem = namedtuple('Listagem', ['colunas', 'chave', 'formatadores'])
+
+LISTAGEM_PRODUTOS = Listagem(
+    colunas={'codigo': Produto.codigo, 'nome': Produto.nome},
+    chave='codigo',
+    formatadores={}
+)
+
+LISTAGEM_LOTES = Listagem(
+    colunas={
+        'id': Lote.id,
+        'produto_codigo': Lote.produto_codigo,
+        'lote': Lote.lote,
+        'validade_mes': Lote.validade_mes,
+        'validade_ano': Lote.validade_ano,
+        'quantidade': Lote.quantidade,
+        'data_cadastro': Lote.data_cadastro,
+    },
+    chave='id',
+    formatadores={'data_cadastro': lambda valor: valor.strftime('%d/%m/%Y')}
+)
+
+
+def codificar_cursor(valor):
+    return base64.urlsafe_b64encode(json.dumps(valor).encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    try:
+        valor = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise ErroListagem('Cursor inválido')
+    # O cursor guarda o valor da chave da última linha: só texto ou número
+    if isinstance(valor, bool) or not isinstance(valor, (str, int, float)):
+        raise ErroListagem('Cursor inválido')
+    return valor
+
+
+def paginacao_solicitada(args):
+    """Se a requisição pediu paginação ou projeção (senão a rota mantém a resposta completa)."""
+    return any(args.get(nome) for nome in ('limit', 'cursor', 'fields', 'format'))
+
+
+def _campos(listagem, fields):
+    if not fields:
+        return list(listagem.colunas)
+    campos = [campo.strip() for campo in fields.split(',') if campo.strip()]
+    invalidos = [campo for campo in campos if campo not in listagem.colunas]
+    if invalidos or not campos:
+        raise ErroListagem(f"Campos inválidos: {', '.join(invalidos)} (disponíveis: {', '.join(listagem.colunas)})")
+    return campos
+
+
+def _limite(args):
+    if not args.get('limit') and not args.get('cursor'):
+        return None
+    try:
+        limite = int(args.get('limit', LIMITE_PADRAO))
+    except ValueError:
+        raise ErroListagem('limit deve ser um número inteiro')
+    if limite < 1:
+        raise ErroListagem('limit deve ser maior que zero')
+    return min(limite, LIMITE_MAXIMO)
+
+
+def _formato(args):
+    formato = args.get('format') or 'objetos'
+    if formato not in FORMATOS:
+        raise ErroListagem(f"format deve ser um de: {', '.join(FORMATOS)}")
+    datas = args.get('datas') or 'iso'
+    if datas not in DATAS:
+        raise ErroListagem(f"datas deve ser um de: {', '.join(DATAS)}")
+    return formato, datas
+
+
+def _consulta(listagem, args, filtros, datas=None):
+    """Monta o SELECT da página: ``(stmt, campos, selecionados, limite)``.
+
+    Com ``datas`` as colunas de data já saem convertidas pelo SQLite (texto
+    ISO ou epoch), sem criar objetos ``datetime`` no Python.
+    """
+    campos = _campos(listagem, args.get('fields'))
+    limite = _limite(args)
+    chave = listagem.colunas[listagem.chave]
+
+    selecionados = campos if listagem.chave in campos else campos + [listagem.chave]
+    colunas = []
+    for campo in selecionados:
+        coluna = listagem.colunas[campo]
+        if datas and isinstance(coluna.type, DateTime):
+            coluna = DATAS[datas](coluna).label(campo)
+        colunas.append(coluna)
+    stmt = select(*colunas).where(*filtros).order_by(chave)
+
+    if args.get('cursor'):
+        stmt = stmt.where(chave > decodificar_cursor(args['cursor']))
+    if limite is not None:
+        stmt = stmt.limit(limite + 1)
+    return stmt, campos, selecionados, limite
+
+
+def listar_colunas(listagem, args, filtros=(), sessao=None):
+    """Mesma seleção de ``listar_pagina`` com um array de valores por campo.
+
+    Retorna ``{'campos': [...], 'colunas': {campo: [...]}, 'total': n}`` (mais
+    ``next_cursor`` quando paginado), montado direto das tuplas do resultado.
+    """
+    sessao = sessao or db.session
+    _, datas = _formato(args)
+    stmt, campos, selecionados, limite = _consulta(listagem, args, filtros, datas)
+
+    rows = sessao.execute(stmt).all()
+    proximo = None
+    if limite is not None and len(rows) > limite:
+        rows = rows[:limite]
+        proximo = codificar_cursor(rows[-1][selecionados.index(listagem.chave)])
+
+    valores = list(zip(*rows)) if rows else [()] * len(selecionados)
+    resultado = {
+        'campos': campos,
+        'colunas': {campo: list(valores[indice]) for indice, campo in enumerate(campos)},
+        'total': len(rows)
+    }
+    if limite is not None:
+        resultado['next_cursor'] = proximo
+    return resultado
+
+
+def gerar_ndjson(listagem, args, filtros=(), sessao=None):
+    """Linhas NDJSON da listagem, lidas do banco em lotes.
+
+    A primeira linha é ``{"campos": [...]}``, cada registro é um array na
+    ordem dos campos e, quando paginado, a última linha é
+    ``{"next_cursor": ...}``. Os parâmetros são validados antes de retornar o
+    gerador, para que erros virem HTTP 400 e não uma resposta truncada.
+    """
+    sessao = sessao or db.session
+    _, datas = _formato(args)
+    stmt, campos, selecionados, limite = _consulta(listagem, args, filtros, datas)
+    posicao_chave = selecionados.index(listagem.chave)
+    largura = len(campos)
+
+    def linhas():
+        yield json.dumps({'campos': campos}) + '\n'
+        ultima = None
+        enviados = 0
+        for row in sessao.execute(stmt.execution_options(yield_per=TAMANHO_LOTE_NDJSON)):
+            if limite is not None and enviados == limite:
+                yield json.dumps({'next_cursor': codificar_cursor(ultima[posicao_chave])}) + '\n'
+                return
+            yield json.dumps(list(row[:largura]), separators=(',', ':')) + '\n'
+            ultima = row
+            enviados += 1
+        if limite is not None:
+            yield json.dumps({'next_cursor': None}) + '\n'
+
+    return linhas()
+
+
+def resposta_listagem(listagem, args, filtros=(), sessao=None):
+    """Resposta HTTP da listagem no ``format`` pedido (ver ``FORMATOS``)."""
+    formato, _ = _formato(args)
+    if formato == 'ndjson':
+        return Response(
+            stream_with_context(gerar_ndjson(listagem, args, filtros, sessao)), mimetype='application/x-ndjson'
+        )
+    if formato == 'columnar':
+        return jsonify(listar_colunas(listagem, args, filtros, sessao))
+    return jsonify(listar_pagina(listagem, args, filtros, sessao))
+
+
+def listar_pagina(listagem, args, filtros=(), sessao=None):
+    """Lista as linhas de ``listagem`` conforme ``limit``, ``cursor`` e ``fields``.
+
+    Seleciona só as colunas pedidas, sem montar entidades do ORM. Com
+    ``limit`` (ou ``cursor``) usa paginação por chave, ordenada pela coluna
+    ``listagem.chave``, e retorna ``{'itens': [...], 'next_cursor': ...}``.
+    Com só ``fields`` retorna a lista completa projetada.
+    """
+    sessao = sessao or db.session
+    stmt, campos, selecionados, limite = _consulta(listagem, args, filtros)
+
+    rows = sessao.execute(stmt).all()
+    proximo = None
+    if limite is not None and len(rows) > limite:
+        rows = rows[:limite]
+        proximo = codificar_cursor(rows[-1][selecionados.index(listagem.chave)])
+
+    formatadores = listagem.formatadores
+    itens = [
+        {
+            campo: formatadores[campo](valor) if campo in formatadores else valor
+            for campo, valor in zip(campos, row)
+        }
+        for row in rows
+    ]
+    if limite is None:
+        return itens
+    return {'itens': itens, 'next_cursor': proximo}
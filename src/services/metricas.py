@@ -0,0 +1,203 @@
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+# Limites dos histogramas (le) no formato do Prometheus
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+BUCKETS_CONSULTAS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+# Consultas guardadas por requisição (e tamanho do SQL) para o log de requisições lentas
+MAX_CONSULTAS_LOG = 50
+MAX_SQL_LOG = 300
+
+
+def _rotulos(labels):
+    return ','.join(f'{nome}="{valor}"' for nome, valor in labels)
+
+
+class Histograma:
+    """Histograma com séries por conjunto de rótulos (contagens cumulativas na exportação)."""
+
+    def __init__(self, nome, ajuda, buckets):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.buckets = buckets
+        self.series = {}
+
+    def observar(self, labels, valor):
+        serie = self.series.get(labels)
+        if serie is None:
+            serie = self.series[labels] = [0] * len(self.buckets) + [0, 0.0]
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                serie[i] += 1
+        serie[-2] += 1
+        serie[-1] += valor
+
+    def exportar(self):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} histogram']
+        for labels, serie in sorted(self.series.items()):
+            rotulos = _rotulos(labels)
+            separador = ',' if rotulos else ''
+            for limite, quantidade in zip(self.buckets, serie):
+                linhas.append(f'{self.nome}_bucket{{{rotulos}{separador}le="{limite}"}} {quantidade}')
+            linhas.append(f'{self.nome}_bucket{{{rotulos}{separador}le="+Inf"}} {serie[-2]}')
+            linhas.append(f'{self.nome}_sum{{{rotulos}}} {serie[-1]}')
+            linhas.append(f'{self.nome}_count{{{rotulos}}} {serie[-2]}')
+        return linhas
+
+
+class Contador:
+    def __init__(self, nome, ajuda):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.series = {}
+
+    def somar(self, labels, valor=1):
+        self.series[labels] = self.series.get(labels, 0) + valor
+
+    def exportar(self):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} counter']
+        for labels, valor in sorted(self.series.items()):
+            linhas.append(f'{self.nome}{{{_rotulos(labels)}}} {valor}')
+        return linhas
+
+
+class Metricas:
+    """Métricas das requisições HTTP deste processo.
+
+    Cada worker do gunicorn mantém as suas: o ``/metrics`` mostra as do
+    worker que atendeu a coleta.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencia = Histograma(
+            'estoque_http_requisicao_segundos', 'Duração das requisições HTTP', BUCKETS_SEGUNDOS)
+        self.tamanho = Histograma(
+            'estoque_http_resposta_bytes', 'Tamanho do corpo das respostas', BUCKETS_BYTES)
+        self.consultas = Histograma(
+            'estoque_sql_consultas_por_requisicao', 'Comandos SQL executados por requisição', BUCKETS_CONSULTAS)
+        self.sql_segundos = Contador('estoque_sql_segundos_total', 'Tempo gasto em comandos SQL')
+        self.linhas = Contador('estoque_orm_linhas_carregadas_total', 'Objetos do ORM carregados do banco')
+        self.lentas = Contador('estoque_http_requisicoes_lentas_total', 'Requisições acima do limite de lentidão')
+
+    def registrar(self, endpoint, metodo, status, segundos, tamanho, estado):
+        rota = (('endpoint', endpoint), ('metodo', metodo))
+        with self._lock:
+            self.latencia.observar(rota + (('status', status),), segundos)
+            self.tamanho.observar(rota, tamanho)
+            self.consultas.observar(rota, estado['total_consultas'])
+            self.sql_segundos.somar(rota, estado['sql_segundos'])
+            self.linhas.somar(rota, estado['linhas'])
+
+    def exportar(self):
+        with self._lock:
+            linhas = []
+            for metrica in (self.latencia, self.tamanho, self.consultas, self.sql_segundos, self.linhas, self.lentas):
+                linhas.extend(metrica.exportar())
+        return '\n'.join(linhas) + '\n'
+
+
+def exportar_cache(nome, ajuda, estatisticas):
+    """Linhas do Prometheus com as ``estatisticas()`` de um cache em memória."""
+    linhas = [f'# HELP {nome}_entradas {ajuda}: entradas guardadas', f'# TYPE {nome}_entradas gauge',
+              f'{nome}_entradas {estatisticas["entradas"]}']
+    for campo in ('hits', 'misses', 'expiradas', 'invalidacoes'):
+        if campo in estatisticas:
+            linhas.extend([f'# HELP {nome}_{campo}_total {ajuda}: {campo}', f'# TYPE {nome}_{campo}_total counter',
+                           f'{nome}_{campo}_total {estatisticas[campo]}'])
+    return '\n'.join(linhas) + '\n'
+
+
+def _estado():
+    """Acumulador da requisição atual (None fora de requisição ou antes do ``before_request``)."""
+    if has_request_context():
+        return g.get('metricas')
+    return None
+
+
+def _antes_sql(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('inicio_sql', []).append(time.perf_counter())
+
+
+def _depois_sql(conn, cursor, statement, parameters, context, executemany):
+    segundos = time.perf_counter() - conn.info['inicio_sql'].pop()
+    estado = _estado()
+    if estado is not None:
+        estado['sql_segundos'] += segundos
+        estado['total_consultas'] += 1
+        if len(estado['consultas']) < MAX_CONSULTAS_LOG:
+            estado['consultas'].append((statement, segundos))
+
+
+def _erro_sql(contexto_excecao):
+    pilha = contexto_excecao.connection.info.get('inicio_sql') if contexto_excecao.connection is not None else None
+    if pilha:
+        pilha.pop()
+
+
+def _ao_carregar(target, context):
+    estado = _estado()
+    if estado is not None:
+        estado['linhas'] += 1
+
+
+def _iniciar():
+    g.metricas = {
+        'inicio': time.perf_counter(), 'total_consultas': 0, 'consultas': [], 'sql_segundos': 0.0, 'linhas': 0
+    }
+
+
+def _finalizar(response):
+    estado = g.pop('metricas', None)
+    if estado is None:
+        return response
+    segundos = time.perf_counter() - estado['inicio']
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'desconhecido'
+    tamanho = response.content_length or 0
+
+    metricas = current_app.extensions['metricas']
+    metricas.registrar(endpoint, request.method, response.status_code, segundos, tamanho, estado)
+
+    limite = current_app.config.get('METRICAS_LENTO_MS')
+    if limite and segundos * 1000 >= limite:
+        with metricas._lock:
+            metricas.lentas.somar((('endpoint', endpoint), ('metodo', request.method)))
+        consultas = '\n'.join(
+            f'  {duracao * 1000:8.2f} ms  {" ".join(sql.split())[:MAX_SQL_LOG]}'
+            for sql, duracao in estado['consultas']
+        )
+        current_app.logger.warning(
+            'Requisição lenta: %s %s -> %s em %.1f ms (%d consultas SQL, %.1f ms em SQL, %d bytes)\n%s',
+            request.method, request.full_path.rstrip('?'), response.status_code, segundos * 1000,
+            estado['total_consultas'], estado['sql_segundos'] * 1000, tamanho, consultas
+        )
+    return response
+
+
+def instrumentar(app, engine, modelo_base):
+    """Liga a coleta de métricas em todas as rotas de ``app``.
+
+    Mede a duração e o tamanho da resposta de cada requisição e, pelos eventos
+    do SQLAlchemy em ``engine``, os comandos SQL executados e os objetos de
+    ``modelo_base`` (e subclasses) carregados. Com ``METRICAS_LENTO_MS`` no
+    config as requisições mais lentas que o limite vão para o log com a lista
+    de consultas.
+    """
+    app.extensions['metricas'] = Metricas()
+    app.before_request(_iniciar)
+    app.after_request(_finalizar)
+    instrumentar_engine(engine)
+    event.listen(modelo_base, 'load', _ao_carregar, propagate=True)
+    return app.extensions['metricas']
+
+
+def instrumentar_engine(engine):
+    """Conta os comandos SQL de ``engine`` nas métricas da requisição (outros bancos além do principal)."""
+    event.listen(engine, 'before_cursor_execute', _antes_sql)
+    event.listen(engine, 'after_cursor_execute', _depois_sql)
+    event.listen(engine, 'handle_error', _erro_sql)
@@ -0,0 +1,144 @@
+import heapq
+from collections import namedtuple
+from itertools import groupby
+from operator import attrgetter
+
+from sqlalchemy import literal_column, select
+
+from src.models.user import db
+from src.models.produto import Produto
+from src.models.lote import Lote
+from src.services.depositos import varrer_em_paralelo
+from src.services.snapshots import consulta_relatorio
+
+# Quantidade de linhas buscadas por vez do cursor ao percorrer o estoque
+TAMANHO_LOTE_LEITURA = 1000
+
+COLUNAS_RELATORIO = ['Código', 'Nome do Produto', 'Lote', 'Validade', 'Quantidade', 'Data Cadastro']
+COLUNAS_CONSOLIDADO = COLUNAS_RELATORIO + ['Depósito']
+
+# ``deposito`` só é preenchido no relatório consolidado de vários depósitos
+LinhaEstoque = namedtuple('LinhaEstoque', [
+    'produto_codigo', 'produto_nome', 'lote', 'validade_mes',
+    'validade_ano', 'quantidade', 'data_cadastro', 'deposito'
+], defaults=(None,))
+
+
+def _consulta_estoque():
+    """Produtos e seus lotes em um único LEFT OUTER JOIN.
+
+    A ordem reproduz a dos relatórios antigos: produtos na ordem de inserção
+    (rowid) e, dentro de cada produto, lotes na ordem do índice
+    ``unique_produto_lote``.
+    """
+    return (
+        select(
+            Produto.codigo, Produto.nome, Lote.lote, Lote.validade_mes,
+            Lote.validade_ano, Lote.quantidade, Lote.data_cadastro
+        )
+        .select_from(Produto)
+        .outerjoin(Lote, Lote.produto_codigo == Produto.codigo)
+        .order_by(literal_column('produtos.rowid'), Lote.lote)
+    )
+
+
+def iter_linhas_estoque(sessao=None, snapshot=None):
+    """Percorre o estoque linha a linha, uma por lote.
+
+    Produtos sem lotes aparecem uma única vez com os campos do lote em ``None``.
+    Com ``snapshot`` as linhas são os lotes congelados nele (só produtos com lotes).
+    """
+    sessao = sessao or db.session
+    consulta = _consulta_estoque() if snapshot is None else consulta_relatorio(snapshot)
+    resultado = sessao.execute(
+        consulta.execution_options(yield_per=TAMANHO_LOTE_LEITURA)
+    )
+    for row in resultado:
+        yield LinhaEstoque(*row)
+
+
+def _consulta_lotes_deposito():
+    """Lotes de um depósito com o rowid do produto no catálogo, na ordem de ``_consulta_estoque``."""
+    return (
+        select(
+            literal_column('produtos.rowid'), Lote.produto_codigo, Lote.lote, Lote.validade_mes,
+            Lote.validade_ano, Lote.quantidade, Lote.data_cadastro
+        )
+        .join(Produto, Produto.codigo == Lote.produto_codigo)
+        .order_by(literal_column('produtos.rowid'), Lote.lote)
+    )
+
+
+def _ordenar(particao, indice):
+    # (rowid do produto, lote, posição do depósito) é único: as linhas nunca são comparadas
+    for row in particao:
+        yield (row[0], row[2], indice), row
+
+
+def iter_linhas_consolidado(catalogo, depositos):
+    """Percorre o estoque de vários depósitos como uma única sequência.
+
+    ``catalogo`` é o engine do banco principal e ``depositos`` uma lista de
+    ``(nome, engine)``. O catálogo e os lotes de cada depósito são lidos ao
+    mesmo tempo (``varrer_em_paralelo``) e intercalados na ordem de
+    ``iter_linhas_estoque``: produto, lote e depósito, com o nome do depósito
+    em ``deposito``. Produtos sem lotes em nenhum depósito aparecem uma vez
+    com os campos do lote em ``None``.
+    """
+    ordem = literal_column('produtos.rowid')
+    consultas = [(catalogo, select(ordem, Produto.codigo, Produto.nome).order_by(ordem))]
+    consultas.extend((engine, _consulta_lotes_deposito()) for _, engine in depositos)
+    with varrer_em_paralelo(consultas) as (produtos, *particoes):
+        lotes = heapq.merge(*[_ordenar(particao, indice) for indice, particao in enumerate(particoes)])
+        proximo = next(lotes, None)
+        for rowid, codigo, nome in produtos:
+            # Lotes de um produto removido do catálogo entre as leituras ficam de fora
+            while proximo is not None and proximo[0][0] < rowid:
+                proximo = next(lotes, None)
+            if proximo is None or proximo[0][0] != rowid:
+                yield LinhaEstoque(codigo, nome, None, None, None, None, None)
+                continue
+            while proximo is not None and proximo[0][0] == rowid:
+                (_, _, indice), row = proximo
+                yield LinhaEstoque(codigo, nome, *row[2:], depositos[indice][0])
+                proximo = next(lotes, None)
+
+
+def agrupar_por_produto(linhas):
+    """Agrupa ``LinhaEstoque`` consecutivas por produto: ``(codigo, nome, lotes)``.
+
+    ``lotes`` é uma lista vazia para produtos sem estoque registrado.
+    """
+    for (codigo, nome), grupo in groupby(linhas, key=attrgetter('produto_codigo', 'produto_nome')):
+        lotes = [linha for linha in grupo if linha.lote is not None]
+        yield codigo, nome, lotes
+
+
+def iter_produtos_estoque(sessao=None, snapshot=None):
+    """Linhas do estoque agrupadas por produto (ver ``agrupar_por_produto``)."""
+    return agrupar_por_produto(iter_linhas_estoque(sessao, snapshot))
+
+
+def formatar_linha(linha):
+    """Converte uma ``LinhaEstoque`` nas colunas exibidas nos relatórios."""
+    if linha.lote is None:
+        return [linha.produto_codigo, linha.produto_nome, '-', '-', 0, '-']
+    return [
+        linha.produto_codigo,
+        linha.produto_nome,
+        linha.lote,
+        f"{linha.validade_mes:02d}/{linha.validade_ano}",
+        linha.quantidade,
+        linha.data_cadastro.strftime('%d/%m/%Y')
+    ]
+
+
+def formatar_linha_consolidada(linha):
+    """``formatar_linha`` mais a coluna do depósito (``COLUNAS_CONSOLIDADO``)."""
+    return formatar_linha(linha) + [linha.deposito or '-']
+
+
+def iter_linhas_relatorio(sessao=None, snapshot=None):
+    """Linhas já formatadas na ordem de ``COLUNAS_RELATORIO``."""
+    for linha in iter_linhas_estoque(sessao, snapshot):
+        yield formatar_linha(linha)
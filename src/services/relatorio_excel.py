@@ -0,0 +1,40 @@
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+
+from src.services.relatorio_dados import COLUNAS_RELATORIO
+
+NOME_PLANILHA = 'Relatório de Estoque'
+MIMETYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+_BORDA_FINA = Side(style='thin')
+
+
+def _cabecalho(ws, colunas):
+    """Cabeçalho no mesmo estilo gerado pelo ``DataFrame.to_excel``."""
+    celulas = []
+    for coluna in colunas:
+        celula = WriteOnlyCell(ws, value=coluna)
+        celula.font = Font(bold=True)
+        celula.border = Border(left=_BORDA_FINA, right=_BORDA_FINA, top=_BORDA_FINA, bottom=_BORDA_FINA)
+        celula.alignment = Alignment(horizontal='center', vertical='top')
+        celulas.append(celula)
+    return celulas
+
+
+def escrever_excel(linhas, destino, colunas=COLUNAS_RELATORIO, nome_planilha=NOME_PLANILHA):
+    """Grava ``linhas`` em ``destino`` (caminho ou arquivo binário) linha a linha.
+
+    Usa um workbook write-only: as linhas vão direto para o XML temporário do
+    openpyxl, então a memória não cresce com o tamanho do relatório.
+    Retorna a quantidade de linhas de dados gravadas.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(nome_planilha)
+    ws.append(_cabecalho(ws, colunas))
+    total = 0
+    for linha in linhas:
+        ws.append(linha)
+        total += 1
+    wb.save(destino)
+    return total
@@ -0,0 +1,323 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturoTimeout
+from datetime import datetime
+
+from sqlalchemy import create_engine, make_url
+from sqlalchemy.orm import Session
+
+FORMATOS = {
+    'pdf': {'extensao': 'pdf', 'mimetype': 'application/pdf'},
+    'excel': {'extensao': 'xlsx', 'mimetype': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'},
+}
+
+PENDENTE = 'pendente'
+EXECUTANDO = 'executando'
+CONCLUIDO = 'concluido'
+ERRO = 'erro'
+
+ATIVOS = (PENDENTE, EXECUTANDO)
+
+DIRETORIO_PADRAO = os.path.join(tempfile.gettempdir(), 'estoque_relatorios')
+
+# Segundos entre os batimentos de um job em execução e sem batimento até ele ser dado como abandonado
+INTERVALO_BATIMENTO = 5
+LIMITE_BATIMENTO = 30
+
+# Segundos entre as varreduras de jobs expirados feitas pelas consultas de status
+INTERVALO_LIMPEZA = 60
+
+
+def _gravar_json(caminho, dados):
+    """Grava o estado do job de forma atômica (outros workers podem estar lendo)."""
+    temporario = f'{caminho}.{os.getpid()}.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(dados, f)
+    os.replace(temporario, caminho)
+
+
+def _ler_json(caminho):
+    try:
+        with open(caminho, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _processo_vivo(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _bater(caminho_estado, parar):
+    """Renova o batimento do job até ``parar`` ser sinalizado."""
+    while not parar.wait(INTERVALO_BATIMENTO):
+        estado = _ler_json(caminho_estado)
+        if estado is None or estado['status'] != EXECUTANDO:
+            return
+        estado['batimento'] = time.time()
+        _gravar_json(caminho_estado, estado)
+
+
+def _engines_depositos(database_uri, depositos):
+    """``(nome, engine)`` de cada ``[nome, uri]``; os depósitos extras anexam o catálogo de ``database_uri``."""
+    from src.services.depositos import anexar_catalogo
+
+    catalogo = make_url(database_uri).database
+    return [
+        (nome, create_engine(uri) if uri == database_uri else anexar_catalogo(create_engine(uri), catalogo))
+        for nome, uri in depositos
+    ]
+
+
+def executar_relatorio(formato, database_uri, destino, caminho_estado, snapshot_id=None, depositos=None):
+    """Gera o relatório em um processo do pool.
+
+    Roda fora do contexto da aplicação Flask: abre um engine próprio para
+    ``database_uri`` e grava o artefato em ``destino``. Com ``snapshot_id`` o
+    relatório é do snapshot em vez do estoque atual. ``depositos`` é uma lista
+    de ``[nome, uri]``: com um só, o relatório é daquele depósito; com vários,
+    é o consolidado, lido de todos em paralelo.
+    """
+    from src.models.snapshot import Snapshot
+    from src.services.relatorio_dados import (
+        COLUNAS_CONSOLIDADO, agrupar_por_produto, formatar_linha_consolidada,
+        iter_linhas_consolidado, iter_linhas_relatorio, iter_produtos_estoque
+    )
+
+    estado = _ler_json(caminho_estado)
+    if estado is not None:
+        agora = time.time()
+        estado.update(status=EXECUTANDO, pid=os.getpid(), batimento=agora, atualizado_em=agora)
+        _gravar_json(caminho_estado, estado)
+    # O batimento mostra aos outros workers que o job segue vivo
+    parar = threading.Event()
+    batimento = threading.Thread(target=_bater, args=(caminho_estado, parar), daemon=True)
+    batimento.start()
+
+    engine = create_engine(database_uri)
+    particoes = _engines_depositos(database_uri, depositos or [])
+    temporario = f'{destino}.tmp'
+    try:
+        if len(particoes) > 1:
+            linhas = iter_linhas_consolidado(engine, particoes)
+            if formato == 'pdf':
+                from src.services.relatorio_pdf import escrever_pdf
+                escrever_pdf(agrupar_por_produto(linhas), temporario, consolidado=True)
+            else:
+                from src.services.relatorio_excel import escrever_excel
+                with open(temporario, 'wb') as arquivo:
+                    escrever_excel(map(formatar_linha_consolidada, linhas), arquivo, COLUNAS_CONSOLIDADO)
+        else:
+            with Session(particoes[0][1] if particoes else engine) as sessao:
+                snapshot = sessao.get(Snapshot, snapshot_id) if snapshot_id is not None else None
+                if formato == 'pdf':
+                    from src.services.relatorio_pdf import escrever_pdf
+                    escrever_pdf(iter_produtos_estoque(sessao, snapshot), temporario)
+                else:
+                    from src.services.relatorio_excel import escrever_excel
+                    with open(temporario, 'wb') as arquivo:
+                        escrever_excel(iter_linhas_relatorio(sessao, snapshot), arquivo)
+        os.replace(temporario, destino)
+    finally:
+        parar.set()
+        batimento.join()
+        engine.dispose()
+        for _, particao in particoes:
+            particao.dispose()
+        if os.path.exists(temporario):
+            os.remove(temporario)
+    return destino
+
+
+class FilaRelatorios:
+    """Fila de geração de relatórios em segundo plano.
+
+    Os jobs rodam em um pool de processos limitado. O estado de cada job fica
+    em um arquivo JSON em ``diretorio`` ao lado do artefato gerado, para que
+    qualquer worker do gunicorn consiga responder status e download. Jobs
+    idênticos ainda ativos são reaproveitados e artefatos com mais de ``ttl``
+    segundos são removidos.
+
+    O estado guarda o pid do dono: o worker que enfileirou o job enquanto ele
+    está pendente e o processo do pool, que renova um batimento, enquanto ele
+    executa. Um job ativo cujo dono morreu (ou parou de bater) é marcado como
+    erro, e não removido, para que não seja reaproveitado nem fique pendente.
+    """
+
+    def __init__(self, diretorio, max_workers=2, ttl=900):
+        self.diretorio = diretorio
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self._pool = None
+        self._futuros = {}
+        self._lock = threading.Lock()
+        self._ultima_limpeza = 0.0
+        os.makedirs(diretorio, exist_ok=True)
+
+    def _get_pool(self):
+        # Criado sob demanda: o processo mestre do gunicorn não deve herdar o pool
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._pool
+
+    def _caminho_estado(self, job_id):
+        return os.path.join(self.diretorio, f'{job_id}.json')
+
+    def _caminho_artefato(self, job_id, formato):
+        return os.path.join(self.diretorio, f"{job_id}.{FORMATOS[formato]['extensao']}")
+
+    def _estados(self):
+        for nome in os.listdir(self.diretorio):
+            if nome.endswith('.json'):
+                estado = _ler_json(os.path.join(self.diretorio, nome))
+                if estado is not None:
+                    yield estado
+
+    def _abandonado(self, estado):
+        if estado['status'] not in ATIVOS or estado['id'] in self._futuros:
+            return False
+        if estado['status'] == PENDENTE:
+            return not _processo_vivo(estado.get('pid'))
+        return time.time() - estado.get('batimento', estado['atualizado_em']) > LIMITE_BATIMENTO
+
+    def _verificar(self, estado):
+        """Marca como erro o job ativo cujo dono morreu e devolve o estado."""
+        if self._abandonado(estado):
+            estado.update(
+                status=ERRO, erro='O processo que gerava o relatório terminou antes de concluí-lo',
+                atualizado_em=time.time()
+            )
+            _gravar_json(self._caminho_estado(estado['id']), estado)
+        return estado
+
+    def submeter(self, formato, database_uri, parametros=None):
+        """Cria um job ou devolve um job idêntico em andamento ou já concluído.
+
+        Um job concluído só é reaproveitado com os mesmos ``parametros``, que
+        devem incluir a versão do estoque para que o artefato continue válido.
+        ``parametros['snapshot']`` gera o relatório do snapshot com esse id e
+        ``parametros['depositos']`` o de outro depósito ou o consolidado (ver
+        ``executar_relatorio``).
+        """
+        if formato not in FORMATOS:
+            raise ValueError(f'Formato inválido: {formato}')
+        chave = hashlib.sha1(
+            json.dumps([formato, database_uri, parametros or {}], sort_keys=True).encode()
+        ).hexdigest()
+
+        with self._lock:
+            self.limpar_expirados()
+            for estado in self._estados():
+                if estado['chave'] == chave and self._verificar(estado)['status'] != ERRO:
+                    return estado
+
+            job_id = uuid.uuid4().hex
+            agora = time.time()
+            timestamp = datetime.fromtimestamp(agora).strftime('%Y%m%d_%H%M%S')
+            estado = {
+                'id': job_id,
+                'formato': formato,
+                'chave': chave,
+                'status': PENDENTE,
+                'pid': os.getpid(),
+                'batimento': agora,
+                'criado_em': agora,
+                'atualizado_em': agora,
+                'arquivo': f"relatorio_estoque_{timestamp}.{FORMATOS[formato]['extensao']}",
+                'erro': None
+            }
+            caminho_estado = self._caminho_estado(job_id)
+            _gravar_json(caminho_estado, estado)
+
+            futuro = self._get_pool().submit(
+                executar_relatorio, formato, database_uri,
+                self._caminho_artefato(job_id, formato), caminho_estado,
+                (parametros or {}).get('snapshot'), (parametros or {}).get('depositos')
+            )
+            self._futuros[job_id] = futuro
+        futuro.add_done_callback(lambda f, job_id=job_id: self._finalizar(job_id, f))
+        return estado
+
+    def _finalizar(self, job_id, futuro):
+        caminho_estado = self._caminho_estado(job_id)
+        estado = _ler_json(caminho_estado)
+        if estado is not None:
+            erro = futuro.exception()
+            estado['status'] = ERRO if erro else CONCLUIDO
+            estado['erro'] = str(erro) if erro else None
+            estado['atualizado_em'] = time.time()
+            _gravar_json(caminho_estado, estado)
+        with self._lock:
+            self._futuros.pop(job_id, None)
+
+    def status(self, job_id):
+        """Estado atual do job ou ``None`` se não existe (ou já expirou)."""
+        if not job_id.isalnum():
+            return None
+        if time.monotonic() - self._ultima_limpeza >= INTERVALO_LIMPEZA:
+            with self._lock:
+                self.limpar_expirados()
+        estado = _ler_json(self._caminho_estado(job_id))
+        return self._verificar(estado) if estado is not None else None
+
+    def caminho_artefato(self, estado):
+        return self._caminho_artefato(estado['id'], estado['formato'])
+
+    def aguardar(self, job_id, timeout):
+        """Espera o job terminar por até ``timeout`` segundos e devolve o estado."""
+        limite = time.monotonic() + timeout
+        futuro = self._futuros.get(job_id)
+        if futuro is not None:
+            try:
+                futuro.exception(timeout=timeout)
+            except FuturoTimeout:
+                pass
+        while True:
+            estado = self.status(job_id)
+            if estado is None or estado['status'] not in ATIVOS or time.monotonic() >= limite:
+                return estado
+            time.sleep(0.1)
+
+    def limpar_expirados(self):
+        """Remove estado e artefato de jobs terminados há mais de ``ttl`` segundos."""
+        self._ultima_limpeza = time.monotonic()
+        limite = time.time() - self.ttl
+        for estado in list(self._estados()):
+            if self._verificar(estado)['status'] not in ATIVOS and estado['atualizado_em'] < limite:
+                for caminho in (self.caminho_artefato(estado), self._caminho_estado(estado['id'])):
+                    try:
+                        os.remove(caminho)
+                    except FileNotFoundError:
+                        pass
+
+
+_fila = None
+
+
+def get_fila(app):
+    """Fila de relatórios do processo atual, configurada a partir de ``app.config``."""
+    global _fila
+    if _fila is None:
+        _fila = FilaRelatorios(
+            app.config.get('RELATORIO_JOBS_DIR', DIRETORIO_PADRAO),
+            max_workers=app.config.get('RELATORIO_WORKERS', 2),
+            ttl=app.config.get('RELATORIO_JOB_TTL', 900)
+        )
+    return _fila
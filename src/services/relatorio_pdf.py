@@ -0,0 +1,486 @@
+import itertools
+import os
+import unicodedata
+import zlib
+from datetime import datetime
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.pdfbase.pdfmetrics import getFont
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from src.services.relatorio_dados import formatar_linha, formatar_linha_consolidada
+
+CABECALHO_PDF = ['Código', 'Nome do Produto', 'Lote', 'Validade', 'Qtd', 'Cadastro']
+CABECALHO_CONSOLIDADO_PDF = CABECALHO_PDF + ['Depósito']
+
+# Acima deste número de linhas o relatório deixa a tabela do reportlab, cujo
+# tempo cresce mais que linearmente (cerca de 1s com 2 mil lotes e 4,5s com
+# 5 mil), e passa ao escritor paginado
+LIMITE_TABELA_PDF = 2000
+
+# Página carta com margens de uma polegada (as do SimpleDocTemplate), em pontos
+LARGURA_PAGINA, ALTURA_PAGINA = 612, 792
+MARGEM = 72
+ALTURA_TITULO = 80
+ALTURA_LINHA = 14
+PREENCHIMENTO = 3
+TAMANHO_FONTE = 8
+
+# Cada linha de texto a mais em uma célula quebrada, e o máximo delas (o
+# que passar disso termina em reticências)
+ENTRELINHA = 9
+MAX_LINHAS_CELULA = 6
+
+# Colunas de largura fixa: a tabela não depende do conteúdo e cada página é
+# desenhada assim que enche, sem medir o relatório inteiro antes; o texto
+# que não cabe na coluna é quebrado em mais linhas
+LARGURAS_PDF = [64, 160, 72, 46, 46, 58]
+LARGURAS_CONSOLIDADO_PDF = [58, 132, 62, 42, 40, 52, 60]
+
+# Altura da tabela em cada página (cabeçalho e transporte incluídos)
+ALTURA_PRIMEIRA_PAGINA = ALTURA_PAGINA - 2 * MARGEM - ALTURA_TITULO
+ALTURA_POR_PAGINA = ALTURA_PAGINA - 2 * MARGEM
+
+# Helvetica e Helvetica-Bold são fontes padrão do PDF (não vão embutidas);
+# F1 e F2 nos conteúdos das páginas
+FONTES = {'F1': 'Helvetica', 'F2': 'Helvetica-Bold'}
+
+# Cores do relatório anterior (colors.grey, whitesmoke e beige do reportlab)
+CINZA = '0.502 0.502 0.502'
+BRANCO = '0.961 0.961 0.961'
+BEGE = '0.961 0.961 0.863'
+PRETO = '0 0 0'
+
+_larguras_fonte = {}
+
+
+def _caractere_winansi(caractere):
+    try:
+        caractere.encode('cp1252')
+        return caractere
+    except UnicodeEncodeError:
+        return unicodedata.normalize('NFKD', caractere).encode('cp1252', 'ignore').decode('cp1252') or '?'
+
+
+def _winansi(texto):
+    """``texto`` em WinAnsi: o que não existe nela perde o acento (``ő`` vira ``o``) ou vira ``?``."""
+    try:
+        return texto.encode('cp1252')
+    except UnicodeEncodeError:
+        return ''.join(map(_caractere_winansi, texto)).encode('cp1252', 'replace')
+
+
+def _largura(texto, fonte, tamanho):
+    """Largura de ``texto`` em pontos, pela tabela WinAnsi da fonte."""
+    larguras = _larguras_fonte.get(fonte)
+    if larguras is None:
+        larguras = _larguras_fonte[fonte] = getFont(FONTES[fonte]).widths
+    return sum(map(larguras.__getitem__, _winansi(texto))) * tamanho / 1000
+
+
+def _literal(texto):
+    """String do PDF em WinAnsi, com os caracteres especiais escapados."""
+    codificado = _winansi(texto)
+    return b'(' + codificado.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def _caber(texto, fonte, tamanho, largura):
+    """``texto`` cortado com reticências para caber em ``largura``; retorna ``(texto, largura)``."""
+    medida = _largura(texto, fonte, tamanho)
+    if medida <= largura:
+        return texto, medida
+    while texto and medida > largura:
+        texto = texto[:-1].rstrip()
+        medida = _largura(texto + '…', fonte, tamanho)
+    return texto + '…', medida
+
+
+def _partir(palavra, fonte, tamanho, largura):
+    """Quantos caracteres do início de ``palavra`` cabem em ``largura`` (pelo menos um)."""
+    corte = len(palavra)
+    while corte > 1 and _largura(palavra[:corte], fonte, tamanho) > largura:
+        corte -= 1
+    return corte
+
+
+def _quebrar(texto, fonte, tamanho, largura):
+    """``texto`` quebrado nos espaços para caber em ``largura``: lista de ``(linha, largura)``.
+
+    Palavras maiores que a coluna são partidas; além de ``MAX_LINHAS_CELULA``
+    linhas a última termina em reticências.
+    """
+    medida = _largura(texto, fonte, tamanho)
+    if medida <= largura:
+        return [(texto, medida)]
+    linhas = []
+    atual = ''
+    for palavra in texto.split():
+        candidata = f'{atual} {palavra}' if atual else palavra
+        if _largura(candidata, fonte, tamanho) <= largura:
+            atual = candidata
+            continue
+        if atual:
+            linhas.append(atual)
+        while _largura(palavra, fonte, tamanho) > largura:
+            corte = _partir(palavra, fonte, tamanho, largura)
+            linhas.append(palavra[:corte])
+            palavra = palavra[corte:]
+        atual = palavra
+    linhas.append(atual)
+    if len(linhas) > MAX_LINHAS_CELULA:
+        linhas = linhas[:MAX_LINHAS_CELULA - 1] + [' '.join(linhas[MAX_LINHAS_CELULA - 1:]) + '…']
+    return [_caber(linha, fonte, tamanho, largura) for linha in linhas]
+
+
+class EscritorPdf:
+    """Grava um PDF página a página direto em ``arquivo``.
+
+    Cada página vira um stream comprimido escrito assim que termina; só os
+    offsets dos objetos ficam em memória até o ``fechar``, que escreve a
+    árvore de páginas e a tabela xref no fim do arquivo.
+    """
+
+    CATALOGO, PAGINAS, INFO, PRIMEIRA_FONTE = 1, 2, 3, 4
+
+    def __init__(self, arquivo):
+        self._arquivo = arquivo
+        self._posicao = 0
+        self._offsets = {}
+        self._paginas = []
+        self._proximo = self.PRIMEIRA_FONTE + len(FONTES)
+        self._escrever(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        for numero, fonte in enumerate(FONTES.values(), self.PRIMEIRA_FONTE):
+            self._objeto(numero, b'<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>'
+                         % fonte.encode())
+
+    @property
+    def paginas(self):
+        return len(self._paginas)
+
+    def _escrever(self, dados):
+        self._arquivo.write(dados)
+        self._posicao += len(dados)
+
+    def _objeto(self, numero, corpo):
+        self._offsets[numero] = self._posicao
+        self._escrever(b'%d 0 obj\n%s\nendobj\n' % (numero, corpo))
+
+    def pagina(self, conteudo):
+        """Escreve uma página com o conteúdo (operadores do PDF) em ``conteudo``."""
+        stream = zlib.compress(conteudo.encode('latin-1') if isinstance(conteudo, str) else conteudo)
+        numero = self._proximo
+        self._proximo += 2
+        self._objeto(numero, b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream'
+                     % (len(stream), stream))
+        fontes = b' '.join(b'/%s %d 0 R' % (nome.encode(), n)
+                           for n, nome in enumerate(FONTES, self.PRIMEIRA_FONTE))
+        self._objeto(numero + 1, b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] '
+                                 b'/Resources << /Font << %s >> >> /Contents %d 0 R >>'
+                     % (self.PAGINAS, LARGURA_PAGINA, ALTURA_PAGINA, fontes, numero))
+        self._paginas.append(numero + 1)
+
+    def fechar(self, titulo, criado_em):
+        kids = b' '.join(b'%d 0 R' % numero for numero in self._paginas)
+        self._objeto(self.PAGINAS, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self._paginas)))
+        self._objeto(self.CATALOGO, b'<< /Type /Catalog /Pages %d 0 R >>' % self.PAGINAS)
+        self._objeto(self.INFO, b'<< /Title %s /Producer (estoque) /CreationDate (D:%s) >>'
+                     % (_literal(titulo), criado_em.strftime('%Y%m%d%H%M%S').encode()))
+
+        inicio_xref = self._posicao
+        total = self._proximo
+        linhas = [b'xref\n0 %d\n0000000000 65535 f \n' % total]
+        linhas.extend(b'%010d 00000 n \n' % self._offsets[numero] for numero in range(1, total))
+        linhas.append(b'trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                      % (total, self.CATALOGO, self.INFO, inicio_xref))
+        self._escrever(b''.join(linhas))
+
+
+class TabelaPaginada:
+    """Tabela do relatório desenhada em páginas de tamanho fixo.
+
+    O cabeçalho se repete em cada página. A última linha de uma página que
+    continua leva o subtotal parcial do produto em andamento e o total ``A
+    transportar``; a primeira da página seguinte repete o ``Transporte``.
+    As linhas crescem com o texto quebrado das células, e a página termina
+    quando a próxima não cabe mais. Só a página atual fica em memória.
+    """
+
+    def __init__(self, escritor, cabecalho, larguras, titulo, subtitulo):
+        self.escritor = escritor
+        self.cabecalho = cabecalho
+        self.larguras = larguras
+        self.titulo = titulo
+        self.subtitulo = subtitulo
+        # Bordas das colunas e o centro de cada uma
+        self.bordas = [MARGEM]
+        for largura in larguras:
+            self.bordas.append(self.bordas[-1] + largura)
+        self.centros = [(a + b) / 2 for a, b in zip(self.bordas, self.bordas[1:])]
+        self._cabecalho = self._celulas(cabecalho, 'F2')
+        self.total = 0
+        self.produto = None
+        self.subtotal = 0
+        self.numero = 0
+        self._abrir_pagina()
+
+    # Página
+
+    def _abrir_pagina(self):
+        self.numero += 1
+        self._ops = []
+        self._tipos = []
+        topo = ALTURA_PAGINA - MARGEM
+        if self.numero == 1:
+            self._texto_centralizado(self.titulo, 'F2', 16, topo - 16)
+            self._ops.append('BT /F1 10 Tf %.2f %.2f Td %s Tj ET' % (
+                MARGEM, topo - 62, _literal(self.subtitulo).decode('latin-1')))
+            topo -= ALTURA_TITULO
+            self._livre = ALTURA_PRIMEIRA_PAGINA
+        else:
+            self._livre = ALTURA_POR_PAGINA
+        self._topo = topo
+        self._y = topo
+        self._linha(self._cabecalho, 'F2', 'cabecalho')
+
+    def _fechar_pagina(self):
+        esquerda, direita = self.bordas[0], self.bordas[-1]
+        base = self._y
+        corpo = self._topo - self._tipos[0][1]
+        fundo = [
+            f'{CINZA} rg {esquerda} {corpo} {direita - esquerda} {self._topo - corpo} re f',
+            f'{BEGE} rg {esquerda} {base} {direita - esquerda} {corpo - base} re f',
+        ]
+
+        # Grade: uma linha horizontal por linha da tabela e as divisões das
+        # colunas só nos trechos de células (as faixas de totais não têm divisões)
+        grade = [f'{PRETO} RG 0.5 w']
+        y = self._topo
+        grade.append(f'{esquerda} {y} m {direita} {y} l')
+        trechos = []
+        for tipo, altura in self._tipos:
+            baixo = y - altura
+            grade.append(f'{esquerda} {baixo} m {direita} {baixo} l')
+            if tipo != 'faixa':
+                if trechos and trechos[-1][1] == y:
+                    trechos[-1][1] = baixo
+                else:
+                    trechos.append([y, baixo])
+            y = baixo
+        grade.append(f'{esquerda} {self._topo} m {esquerda} {base} l {direita} {self._topo} m {direita} {base} l')
+        for cima, baixo in trechos:
+            grade.extend(f'{x} {cima} m {x} {baixo} l' for x in self.bordas[1:-1])
+        grade.append('S')
+
+        self._texto_centralizado(f'Página {self.numero}', 'F1', TAMANHO_FONTE, MARGEM / 2)
+        self.escritor.pagina('\n'.join(fundo + grade + self._ops))
+
+    def _texto_centralizado(self, texto, fonte, tamanho, y):
+        x = (LARGURA_PAGINA - _largura(texto, fonte, tamanho)) / 2
+        self._ops.append('0 g BT /%s %d Tf %.2f %.2f Td %s Tj ET' % (
+            fonte, tamanho, x, y, _literal(texto).decode('latin-1')))
+
+    # Linhas
+
+    def _celulas(self, celulas, fonte):
+        """Texto de cada célula quebrado na largura da coluna e a altura da linha."""
+        quebradas = [
+            _quebrar(str(celula), fonte, TAMANHO_FONTE, largura - 2 * PREENCHIMENTO)
+            for celula, largura in zip(celulas, self.larguras)
+        ]
+        return quebradas, ALTURA_LINHA + (max(map(len, quebradas)) - 1) * ENTRELINHA
+
+    def _linha(self, celulas, fonte, tipo):
+        """Desenha uma linha preparada por ``_celulas``; as células mais baixas ficam centralizadas."""
+        quebradas, altura = celulas
+        partes = ['%s rg BT /%s %d Tf' % (BRANCO if tipo == 'cabecalho' else PRETO, fonte, TAMANHO_FONTE)]
+        for linhas, centro in zip(quebradas, self.centros):
+            base = self._y - (altura + ALTURA_LINHA - (len(linhas) - 1) * ENTRELINHA) / 2 + 4
+            for texto, medida in linhas:
+                partes.append('1 0 0 1 %.2f %.2f Tm %s Tj' % (
+                    centro - medida / 2, base, _literal(texto).decode('latin-1')))
+                base -= ENTRELINHA
+        partes.append('ET')
+        self._ops.append(' '.join(partes))
+        self._fechar_linha(tipo, altura)
+
+    def _faixa(self, texto):
+        """Linha de totais ocupando a largura da tabela, alinhada à direita."""
+        texto, medida = _caber(texto, 'F2', TAMANHO_FONTE, self.bordas[-1] - self.bordas[0] - 2 * PREENCHIMENTO)
+        self._ops.append('0 g BT /F2 %d Tf %.2f %.2f Td %s Tj ET' % (
+            TAMANHO_FONTE, self.bordas[-1] - PREENCHIMENTO - medida, self._y - ALTURA_LINHA + 4,
+            _literal(texto).decode('latin-1')))
+        self._fechar_linha('faixa', ALTURA_LINHA)
+
+    def _fechar_linha(self, tipo, altura):
+        self._tipos.append((tipo, altura))
+        self._y -= altura
+        self._livre -= altura
+
+    def _reservar(self, altura=ALTURA_LINHA):
+        """Antes de cada linha: se ela não cabe junto com a do transporte, passa para a próxima página."""
+        if self._livre >= altura + ALTURA_LINHA:
+            return
+        acumulado = self.total + self.subtotal
+        parcial = f'Subtotal parcial {self.produto}: {self.subtotal}  ·  ' if self.produto else ''
+        self._faixa(f'{parcial}A transportar: {acumulado}')
+        self._fechar_pagina()
+        self._abrir_pagina()
+        self._faixa(f'Transporte: {acumulado}' + (f'  ·  {self.produto} (continuação)' if self.produto else ''))
+
+    # Conteúdo do relatório
+
+    def lote(self, codigo, celulas, quantidade):
+        celulas = self._celulas(celulas, 'F1')
+        self._reservar(celulas[1])
+        self.produto = codigo
+        self._linha(celulas, 'F1', 'celulas')
+        self.subtotal += quantidade
+
+    def fim_produto(self):
+        """Fecha o produto em andamento com a linha de subtotal."""
+        self._reservar()
+        codigo, subtotal = self.produto, self.subtotal
+        self.total += subtotal
+        self.produto, self.subtotal = None, 0
+        self._faixa(f'Subtotal {codigo}: {subtotal}')
+
+    def sem_lotes(self, celulas):
+        celulas = self._celulas(celulas, 'F1')
+        self._reservar(celulas[1])
+        self._linha(celulas, 'F1', 'celulas')
+
+    def fechar(self):
+        self._reservar()
+        self._faixa(f'TOTAL GERAL: {self.total}')
+        self._fechar_pagina()
+
+
+def _escrever_tabela(produtos, destino, gerado_em, consolidado):
+    """Relatório em uma única tabela do reportlab, com as colunas ajustadas ao conteúdo."""
+    # Criar documento PDF
+    doc = SimpleDocTemplate(destino, pagesize=letter)
+    elements = []
+    
+    # Estilos
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=16,
+        spaceAfter=30,
+        alignment=1  # Center
+    )
+    
+    # Título
+    title = Paragraph("Relatório de Estoque", title_style)
+    elements.append(title)
+    
+    # Data de geração
+    data_geracao = Paragraph(f"Gerado em: {gerado_em.strftime('%d/%m/%Y %H:%M')}", styles['Normal'])
+    elements.append(data_geracao)
+    elements.append(Spacer(1, 20))
+    
+    # Dados da tabela
+    cabecalho = CABECALHO_CONSOLIDADO_PDF if consolidado else CABECALHO_PDF
+    formatar = formatar_linha_consolidada if consolidado else formatar_linha
+    extras = [''] * (len(cabecalho) - len(CABECALHO_PDF))
+    data = [list(cabecalho)]
+    total_geral = 0
+    
+    for codigo, nome, lotes in produtos:
+        if lotes:
+            subtotal = 0
+            for lote in lotes:
+                linha = formatar(lote)
+                linha[4] = str(linha[4])
+                data.append(linha)
+                subtotal += lote.quantidade
+            
+            # Adicionar subtotal
+            data.append(['', '', '', '', f'Subtotal {codigo}: {subtotal}', ''] + extras)
+            total_geral += subtotal
+        else:
+            # Produto sem lotes
+            data.append([codigo, nome, '-', '-', '0', '-'] + ['-'] * len(extras))
+    
+    # Total geral
+    data.append(['', '', '', '', f'TOTAL GERAL: {total_geral}', ''] + extras)
+    
+    # Criar tabela
+    table = Table(data)
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    
+    elements.append(table)
+    
+    # Construir PDF
+    doc.build(elements)
+    return doc.page
+
+
+def _escrever_paginado(produtos, destino, gerado_em, consolidado):
+    """Relatório gravado página a página pelo ``EscritorPdf`` (ver ``TabelaPaginada``)."""
+    cabecalho = CABECALHO_CONSOLIDADO_PDF if consolidado else CABECALHO_PDF
+    larguras = LARGURAS_CONSOLIDADO_PDF if consolidado else LARGURAS_PDF
+    formatar = formatar_linha_consolidada if consolidado else formatar_linha
+    extras = ['-'] * (len(cabecalho) - len(CABECALHO_PDF))
+
+    arquivo = open(destino, 'wb') if isinstance(destino, (str, os.PathLike)) else destino
+    try:
+        escritor = EscritorPdf(arquivo)
+        tabela = TabelaPaginada(escritor, cabecalho, larguras, 'Relatório de Estoque',
+                                f"Gerado em: {gerado_em.strftime('%d/%m/%Y %H:%M')}")
+        for codigo, nome, lotes in produtos:
+            if lotes:
+                for lote in lotes:
+                    tabela.lote(codigo, formatar(lote), lote.quantidade)
+                tabela.fim_produto()
+            else:
+                tabela.sem_lotes([codigo, nome, '-', '-', '0', '-'] + extras)
+        tabela.fechar()
+        escritor.fechar('Relatório de Estoque', gerado_em)
+        return escritor.paginas
+    finally:
+        if arquivo is not destino:
+            arquivo.close()
+
+
+def escrever_pdf(produtos, destino, gerado_em=None, consolidado=False, paginado=None):
+    """Monta o relatório de estoque em PDF.
+
+    ``produtos`` é um iterável de ``(codigo, nome, lotes)`` como o de
+    ``iter_produtos_estoque``; ``destino`` é um caminho ou arquivo binário.
+    Com ``consolidado`` a tabela ganha a coluna do depósito de cada lote.
+
+    Até ``LIMITE_TABELA_PDF`` linhas o relatório é uma tabela do reportlab
+    com as colunas no tamanho do conteúdo. Acima disso (ou com ``paginado``)
+    as páginas são gravadas à medida que os produtos são consumidos, com
+    colunas fixas e os nomes longos quebrados em mais linhas: a memória não
+    cresce com o estoque, o tempo é linear no número de lotes e subtotais e
+    o ``TOTAL GERAL`` são levados de uma página para a outra.
+    ``paginado=False`` força a tabela. Retorna o número de páginas.
+    """
+    gerado_em = gerado_em or datetime.now()
+    produtos = iter(produtos)
+    if paginado is None:
+        # Só o início do relatório é lido para decidir: no máximo o limite
+        inicio, linhas = [], 0
+        for produto in produtos:
+            inicio.append(produto)
+            linhas += len(produto[2]) or 1
+            if linhas > LIMITE_TABELA_PDF:
+                break
+        paginado = linhas > LIMITE_TABELA_PDF
+        produtos = itertools.chain(inicio, produtos)
+    escrever = _escrever_paginado if paginado else _escrever_tabela
+    return escrever(produtos, destino, gerado_em, consolidado)
@@ -0,0 +1,116 @@
+from sqlalchemy import func, select, text
+
+from src.models.user import db
+from src.models.produto import Produto
+from src.models.lote import Lote
+from src.models.estoque_resumo import EstoqueProduto, EstoqueTotais
+
+
+def ler_resumo(sessao=None):
+    """Resumo do estoque lido dos totais materializados (uma linha)."""
+    sessao = sessao or db.session
+    totais = sessao.get(EstoqueTotais, 1)
+    if totais is None:
+        return EstoqueTotais(
+            total_produtos=0, produtos_com_estoque=0, quantidade_total=0, total_lotes=0
+        ).to_dict()
+    return totais.to_dict()
+
+
+def totais_produto(produto_codigo, sessao=None):
+    """``(quantidade_total, total_lotes)`` de um produto pelos totais materializados."""
+    sessao = sessao or db.session
+    row = sessao.execute(
+        select(EstoqueProduto.quantidade_total, EstoqueProduto.total_lotes)
+        .where(EstoqueProduto.produto_codigo == produto_codigo)
+    ).first()
+    return tuple(row) if row else (0, 0)
+
+
+def _esperado_por_produto(conexao):
+    return {
+        codigo: (quantidade, lotes)
+        for codigo, quantidade, lotes in conexao.execute(
+            select(Lote.produto_codigo, func.sum(Lote.quantidade), func.count(Lote.id))
+            .group_by(Lote.produto_codigo)
+        )
+    }
+
+
+def _esperado_totais(conexao, por_produto):
+    return {
+        'total_produtos': conexao.execute(select(func.count()).select_from(Produto)).scalar(),
+        'produtos_com_estoque': sum(1 for quantidade, _ in por_produto.values() if quantidade > 0),
+        'quantidade_total': sum(quantidade for quantidade, _ in por_produto.values()),
+        'total_lotes': sum(lotes for _, lotes in por_produto.values()),
+    }
+
+
+def verificar_resumo(engine=None, catalogo=True):
+    """Recalcula os totais a partir de ``lotes`` e compara com os materializados.
+
+    Retorna ``{'produtos': [...], 'totais': {...}}`` apenas com as divergências;
+    os dois vazios significam que está tudo consistente. Com ``catalogo=False``
+    (banco de um depósito) ``total_produtos`` não é conferido: os triggers de
+    ``produtos`` ficam no banco principal e o total do depósito não o acompanha.
+    """
+    engine = engine or db.engine
+    with engine.connect() as conexao:
+        esperado = _esperado_por_produto(conexao)
+        atual = {
+            codigo: (quantidade, lotes)
+            for codigo, quantidade, lotes in conexao.execute(
+                select(EstoqueProduto.produto_codigo, EstoqueProduto.quantidade_total, EstoqueProduto.total_lotes)
+            )
+        }
+        esperado_totais = _esperado_totais(conexao, esperado)
+        if not catalogo:
+            del esperado_totais['total_produtos']
+        atual_totais = conexao.execute(
+            select(
+                EstoqueTotais.total_produtos, EstoqueTotais.produtos_com_estoque,
+                EstoqueTotais.quantidade_total, EstoqueTotais.total_lotes
+            ).where(EstoqueTotais.id == 1)
+        ).mappings().first() or {}
+
+    produtos = []
+    for codigo in sorted(esperado.keys() | atual.keys()):
+        # Produto sem lotes pode ter linha zerada nos totais materializados
+        e = esperado.get(codigo, (0, 0))
+        a = atual.get(codigo, (0, 0))
+        if e != a:
+            produtos.append({
+                'produto_codigo': codigo,
+                'esperado': {'quantidade_total': e[0], 'total_lotes': e[1]},
+                'atual': {'quantidade_total': a[0], 'total_lotes': a[1]}
+            })
+
+    totais = {
+        campo: {'esperado': valor, 'atual': atual_totais.get(campo)}
+        for campo, valor in esperado_totais.items()
+        if atual_totais.get(campo) != valor
+    }
+    return {'produtos': produtos, 'totais': totais}
+
+
+def reconstruir_resumo(engine=None):
+    """Recalcula todos os totais materializados a partir de ``lotes``."""
+    engine = engine or db.engine
+    with engine.begin() as conexao:
+        conexao.execute(EstoqueProduto.__table__.delete())
+        conexao.execute(
+            EstoqueProduto.__table__.insert().from_select(
+                ['produto_codigo', 'quantidade_total', 'total_lotes'],
+                select(Lote.produto_codigo, func.sum(Lote.quantidade), func.count(Lote.id))
+                .group_by(Lote.produto_codigo)
+            )
+        )
+        # Os triggers já ajustaram os totais; regrava para corrigir qualquer desvio
+        conexao.execute(text("""
+            UPDATE estoque_totais SET
+                total_produtos = (SELECT COUNT(*) FROM produtos),
+                produtos_com_estoque = (SELECT COUNT(*) FROM estoque_produtos WHERE quantidade_total > 0),
+                quantidade_total = (SELECT COALESCE(SUM(quantidade_total), 0) FROM estoque_produtos),
+                total_lotes = (SELECT COALESCE(SUM(total_lotes), 0) FROM estoque_produtos)
+            WHERE id = 1
+        """))
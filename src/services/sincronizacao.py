@@ -0,0 +1,82 @@
+from contextlib import contextmanager
+
+from sqlalchemy import select
+
+from src.models.user import db
+from src.models.produto import Produto
+from src.models.lote import Lote
+from src.models.sincronizacao import RemocaoSync
+from src.models.esquema import obter_versao
+from src.services.contagem import lote_dict
+
+LIMITE_PADRAO = 5000
+LIMITE_MAXIMO = 50000
+
+
+def alteracoes_desde(since=0, limite=LIMITE_PADRAO, sessao=None):
+    """Produtos, lotes e remoções com ``seq`` maior que ``since``.
+
+    Tudo é lido na mesma transação de leitura (o mesmo snapshot do SQLite,
+    ver ``_transacao_leitura``). Se alguma das listas passar de ``limite``
+    linhas, as três são cortadas no mesmo ``seq`` e ``mais`` vem verdadeiro:
+    o cliente repete a chamada com o ``seq`` devolvido até ``mais`` ser
+    falso. Os ``seq`` são únicos entre as tabelas, então o corte não perde
+    nem repete linhas.
+    """
+    sessao = sessao or db.session
+    with _transacao_leitura(sessao):
+        return _alteracoes(since, limite, sessao)
+
+
+@contextmanager
+def _transacao_leitura(sessao):
+    """Abre um BEGIN explícito se a conexão da sessão não está em transação.
+
+    O pysqlite só emite BEGIN antes de escritas: sem ele cada SELECT veria um
+    snapshot diferente, e uma escrita entre duas consultas poderia ficar
+    abaixo do ``seq`` de corte sem ter sido lida.
+    """
+    conexao = sessao.connection()
+    if conexao.connection.dbapi_connection.in_transaction:
+        yield
+        return
+    conexao.exec_driver_sql('BEGIN')
+    try:
+        yield
+    finally:
+        conexao.exec_driver_sql('ROLLBACK')
+
+
+def _alteracoes(since, limite, sessao):
+    atual = obter_versao(sessao)
+
+    consultas = {
+        'produtos': select(Produto.codigo, Produto.nome, Produto.seq).where(Produto.seq > since),
+        'lotes': select(
+            Lote.id, Lote.produto_codigo, Lote.lote, Lote.validade_mes, Lote.validade_ano,
+            Lote.quantidade, Lote.data_cadastro, Lote.seq
+        ).where(Lote.seq > since),
+        'remocoes': select(RemocaoSync.tabela, RemocaoSync.chave, RemocaoSync.seq).where(RemocaoSync.seq > since),
+    }
+    linhas = {
+        nome: sessao.execute(stmt.order_by(stmt.selected_columns.seq).limit(limite + 1)).all()
+        for nome, stmt in consultas.items()
+    }
+
+    cortes = [rows[limite - 1].seq for rows in linhas.values() if len(rows) > limite]
+    ate = min(cortes) if cortes else atual
+    if cortes:
+        linhas = {nome: [row for row in rows if row.seq <= ate] for nome, rows in linhas.items()}
+
+    remocoes = {tabela: [] for tabela in ('produtos', 'lotes')}
+    for row in linhas['remocoes']:
+        remocoes[row.tabela].append(int(row.chave) if row.tabela == 'lotes' else row.chave)
+
+    return {
+        'since': since,
+        'seq': ate,
+        'mais': bool(cortes),
+        'produtos': [{'codigo': row.codigo, 'nome': row.nome, 'seq': row.seq} for row in linhas['produtos']],
+        'lotes': [dict(lote_dict(row), seq=row.seq) for row in linhas['lotes']],
+        'remocoes': remocoes
+    }
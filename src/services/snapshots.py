@@ -0,0 +1,316 @@
+from sqlalchemy import and_, delete, exists, func, insert, literal, literal_column, or_, select, tuple_, union, union_all
+from sqlalchemy.orm import aliased
+from sqlalchemy.exc import IntegrityError
+
+from src.models.user import db
+from src.models.produto import Produto
+from src.models.lote import Lote
+from src.models.snapshot import Snapshot, SnapshotLote
+from src.models.esquema import obter_versao
+from src.services.resumo_estoque import ler_resumo
+
+# Depois de tantos deltas seguidos o próximo snapshot é gravado completo
+CHECKPOINT_PADRAO = 10
+
+# Nome aceito no lugar de um rótulo para comparar com o estoque atual
+ATUAL = 'atual'
+
+TAMANHO_ROTULO = 100
+
+COLUNAS = ['produto_codigo', 'lote', 'validade_mes', 'validade_ano', 'quantidade', 'data_cadastro']
+
+
+class ErroSnapshot(ValueError):
+    """Rótulo inválido ou já usado (vira HTTP 400/409)."""
+
+
+class RotuloDuplicado(ErroSnapshot):
+    pass
+
+
+def validar_rotulo(rotulo):
+    rotulo = (rotulo or '').strip() if isinstance(rotulo, str) else ''
+    if not rotulo or len(rotulo) > TAMANHO_ROTULO or '/' in rotulo or rotulo == ATUAL:
+        raise ErroSnapshot(f"Rótulo obrigatório, até {TAMANHO_ROTULO} caracteres, sem '/' e diferente de '{ATUAL}'")
+    return rotulo
+
+
+def buscar_snapshot(rotulo, sessao=None):
+    sessao = sessao or db.session
+    return sessao.scalars(select(Snapshot).where(Snapshot.rotulo == rotulo)).first()
+
+
+def consulta_estado(snapshot, chaves=None, produto_codigo=None):
+    """SELECT dos lotes (``COLUNAS``) como estavam em ``snapshot``.
+
+    O estado é o checkpoint completo com os deltas seguintes aplicados até
+    ``snapshot``: as linhas do checkpoint que nenhum delta da cadeia
+    sobrescreveu (busca no índice ``ix_snapshot_lotes_chave``) mais, para
+    cada lote tocado pelos deltas, a linha do delta mais recente, sem as
+    remoções. ``chaves`` (um SELECT de ``(produto_codigo, lote)``) e
+    ``produto_codigo`` restringem os lotes; ``snapshot`` None é o estoque atual.
+    """
+    def restringir(stmt, tabela):
+        if chaves is not None:
+            stmt = stmt.where(tuple_(tabela.c.produto_codigo, tabela.c.lote).in_(chaves))
+        if produto_codigo is not None:
+            stmt = stmt.where(tabela.c.produto_codigo == produto_codigo)
+        return stmt
+
+    if snapshot is None:
+        return restringir(select(*[Lote.__table__.c[coluna] for coluna in COLUNAS]), Lote.__table__)
+
+    tabela = SnapshotLote.__table__
+    checkpoint = restringir(
+        select(*[tabela.c[coluna] for coluna in COLUNAS]).where(tabela.c.snapshot_id == snapshot.checkpoint_id),
+        tabela
+    )
+    if snapshot.completo:
+        return checkpoint
+
+    deltas = aliased(SnapshotLote.__table__)
+    na_cadeia = and_(deltas.c.snapshot_id > snapshot.checkpoint_id, deltas.c.snapshot_id <= snapshot.id)
+    checkpoint = checkpoint.where(~exists().where(
+        deltas.c.produto_codigo == tabela.c.produto_codigo, deltas.c.lote == tabela.c.lote, na_cadeia
+    ))
+    ordem = func.row_number().over(
+        partition_by=(deltas.c.produto_codigo, deltas.c.lote), order_by=deltas.c.snapshot_id.desc()
+    ).label('ordem')
+    ultimas = restringir(
+        select(*[deltas.c[coluna] for coluna in COLUNAS], deltas.c.removido, ordem).where(na_cadeia), deltas
+    ).subquery()
+    return union_all(
+        checkpoint,
+        select(*[ultimas.c[coluna] for coluna in COLUNAS]).where(ultimas.c.ordem == 1, ultimas.c.removido.is_(False))
+    )
+
+
+def chaves_alteradas(snapshot, sessao=None):
+    """SELECT dos lotes ``(produto_codigo, lote)`` que podem diferir entre ``snapshot`` e o estoque atual.
+
+    Lotes escritos depois do snapshot têm ``seq`` acima da versão dele
+    (faixa do índice ``ix_lotes_seq``). Remoções não deixam linha em
+    ``lotes``: o estado inteiro do snapshot só é percorrido atrás delas quando
+    a conta ``lotes do snapshot + lotes novos`` não fecha com o total atual.
+    """
+    sessao = sessao or db.session
+    escritos = select(Lote.produto_codigo, Lote.lote).where(Lote.seq > snapshot.versao)
+    antes = consulta_estado(snapshot, escritos).subquery()
+    novos = sessao.scalar(
+        select(func.count()).select_from(Lote).where(Lote.seq > snapshot.versao).where(
+            ~exists().where(antes.c.produto_codigo == Lote.produto_codigo, antes.c.lote == Lote.lote)
+        )
+    )
+    if snapshot.total_lotes + novos == ler_resumo(sessao)['total_lotes']:
+        return escritos
+
+    estado = consulta_estado(snapshot).subquery()
+    removidos = select(estado.c.produto_codigo, estado.c.lote).where(
+        ~exists().where(Lote.produto_codigo == estado.c.produto_codigo, Lote.lote == estado.c.lote)
+    )
+    return union(escritos, removidos)
+
+
+def consulta_relatorio(snapshot):
+    """Linhas de ``snapshot`` no formato de ``LinhaEstoque``, com o nome atual do produto.
+
+    Mesma ordem dos relatórios do estoque atual (produtos por rowid, lotes
+    pelo nome); produtos excluídos depois do snapshot vão para o fim.
+    """
+    estado = consulta_estado(snapshot).subquery()
+    rowid = literal_column('produtos.rowid')
+    return (
+        select(
+            estado.c.produto_codigo, func.coalesce(Produto.nome, ''), estado.c.lote, estado.c.validade_mes,
+            estado.c.validade_ano, estado.c.quantidade, estado.c.data_cadastro
+        )
+        .select_from(estado)
+        .outerjoin(Produto, Produto.codigo == estado.c.produto_codigo)
+        .order_by(rowid.is_(None), rowid, estado.c.produto_codigo, estado.c.lote)
+    )
+
+
+def _gravar_completo(sessao, snapshot):
+    resultado = sessao.execute(insert(SnapshotLote).from_select(
+        ['snapshot_id'] + COLUNAS,
+        select(literal(snapshot.id), *[Lote.__table__.c[coluna] for coluna in COLUNAS])
+    ))
+    snapshot.completo = True
+    snapshot.checkpoint_id = snapshot.id
+    snapshot.linhas = resultado.rowcount
+
+
+def _gravar_delta(sessao, snapshot, anterior):
+    """Grava só o que difere do estado de ``anterior``: lotes novos/alterados e removidos."""
+    chaves = chaves_alteradas(anterior, sessao)
+    base = consulta_estado(anterior, chaves).subquery()
+    alterados = (
+        select(literal(snapshot.id), *[Lote.__table__.c[coluna] for coluna in COLUNAS])
+        .select_from(Lote)
+        .outerjoin(base, and_(base.c.produto_codigo == Lote.produto_codigo, base.c.lote == Lote.lote))
+        .where(tuple_(Lote.produto_codigo, Lote.lote).in_(chaves), or_(
+            base.c.lote.is_(None),
+            base.c.quantidade != Lote.quantidade,
+            base.c.validade_mes != Lote.validade_mes,
+            base.c.validade_ano != Lote.validade_ano
+        ))
+    )
+    removidos = select(literal(snapshot.id), base.c.produto_codigo, base.c.lote, literal(True)).where(
+        ~exists().where(Lote.produto_codigo == base.c.produto_codigo, Lote.lote == base.c.lote)
+    )
+    linhas = sessao.execute(insert(SnapshotLote).from_select(['snapshot_id'] + COLUNAS, alterados)).rowcount
+    linhas += sessao.execute(insert(SnapshotLote).from_select(
+        ['snapshot_id', 'produto_codigo', 'lote', 'removido'], removidos
+    )).rowcount
+    snapshot.completo = False
+    snapshot.checkpoint_id = anterior.checkpoint_id
+    snapshot.linhas = linhas
+
+
+def criar_snapshot(rotulo, checkpoint_a_cada=CHECKPOINT_PADRAO, sessao=None):
+    """Congela o estado atual de ``lotes`` sob ``rotulo``, sem fazer commit.
+
+    O primeiro snapshot é completo; os seguintes guardam só as diferenças
+    para o anterior, até ``checkpoint_a_cada`` deltas em sequência ou até o
+    delta passar da metade dos lotes, quando volta a ser gravado completo.
+    O INSERT do snapshot vem primeiro para a transação já começar com a
+    trava de escrita: dois snapshots simultâneos não calculam o delta sobre
+    o mesmo anterior.
+    """
+    sessao = sessao or db.session
+    rotulo = validar_rotulo(rotulo)
+    snapshot = Snapshot(rotulo=rotulo, versao=0, completo=True)
+    sessao.add(snapshot)
+    try:
+        sessao.flush()
+    except IntegrityError:
+        sessao.rollback()
+        raise RotuloDuplicado(f"Já existe um snapshot com o rótulo '{rotulo}'")
+
+    snapshot.versao = obter_versao(sessao)
+    resumo = ler_resumo(sessao)
+    for campo in ('total_produtos', 'produtos_com_estoque', 'quantidade_total', 'total_lotes'):
+        setattr(snapshot, campo, resumo[campo])
+
+    anterior = sessao.scalars(
+        select(Snapshot).where(Snapshot.id < snapshot.id).order_by(Snapshot.id.desc()).limit(1)
+    ).first()
+    deltas = sessao.scalar(
+        select(func.count()).select_from(Snapshot)
+        .where(Snapshot.checkpoint_id == anterior.checkpoint_id, Snapshot.completo.is_(False))
+    ) if anterior is not None else 0
+
+    if anterior is None or deltas >= checkpoint_a_cada:
+        _gravar_completo(sessao, snapshot)
+    else:
+        _gravar_delta(sessao, snapshot, anterior)
+        if snapshot.linhas > snapshot.total_lotes // 2:
+            sessao.execute(delete(SnapshotLote).where(SnapshotLote.snapshot_id == snapshot.id))
+            _gravar_completo(sessao, snapshot)
+    sessao.flush()
+    return snapshot
+
+
+def listar_snapshots(sessao=None):
+    sessao = sessao or db.session
+    return [snapshot.to_dict() for snapshot in sessao.scalars(select(Snapshot).order_by(Snapshot.id))]
+
+
+def _lote_dict(row):
+    return {
+        'produto_codigo': row.produto_codigo,
+        'lote': row.lote,
+        'validade_mes': row.validade_mes,
+        'validade_ano': row.validade_ano,
+        'quantidade': row.quantidade,
+        'data_cadastro': row.data_cadastro.strftime('%d/%m/%Y') if row.data_cadastro else None
+    }
+
+
+def estado_snapshot(snapshot, produto_codigo=None, sessao=None):
+    """Lotes de ``snapshot`` (ou só os de ``produto_codigo``) ordenados por produto e lote."""
+    sessao = sessao or db.session
+    estado = consulta_estado(snapshot, produto_codigo=produto_codigo).subquery()
+    return [
+        _lote_dict(row)
+        for row in sessao.execute(select(estado).order_by(estado.c.produto_codigo, estado.c.lote))
+    ]
+
+
+def _chaves_entre(de, para, sessao):
+    """Lotes que podem ter mudado entre dois snapshots, ou None se for preciso comparar tudo.
+
+    Na mesma cadeia de deltas só os lotes gravados nos snapshots depois do
+    mais antigo (até o mais novo) podem ter mudado: uma faixa da chave primária.
+    Contra o estoque atual valem as ``chaves_alteradas`` do snapshot.
+    """
+    if de is None and para is None:
+        return None
+    if de is None or para is None:
+        return chaves_alteradas(de or para, sessao)
+    antigo, novo = sorted((de, para), key=lambda snapshot: snapshot.id)
+    if novo.checkpoint_id > antigo.id:
+        return None
+    return select(SnapshotLote.produto_codigo, SnapshotLote.lote).where(
+        SnapshotLote.snapshot_id > antigo.id, SnapshotLote.snapshot_id <= novo.id
+    ).distinct()
+
+
+def comparar_snapshots(de, para, sessao=None):
+    """Diferença de quantidade por produto e lote entre ``de`` e ``para``.
+
+    ``None`` em qualquer dos lados é o estoque atual. Só os lotes que mudaram
+    aparecem; ``quantidade_de``/``quantidade_para`` é None quando o lote não
+    existia naquele lado.
+    """
+    sessao = sessao or db.session
+    chaves = _chaves_entre(de, para, sessao)
+    estados = []
+    for snapshot in (de, para):
+        estados.append({
+            (row.produto_codigo, row.lote): row
+            for row in sessao.execute(consulta_estado(snapshot, chaves))
+        })
+    antes, depois = estados
+
+    produtos = {}
+    totais = {'lotes_novos': 0, 'lotes_removidos': 0, 'lotes_alterados': 0, 'diferenca': 0}
+    for chave in sorted(antes.keys() | depois.keys()):
+        anterior, atual = antes.get(chave), depois.get(chave)
+        quantidade_de = anterior.quantidade if anterior is not None else None
+        quantidade_para = atual.quantidade if atual is not None else None
+        validade_de = (anterior.validade_mes, anterior.validade_ano) if anterior is not None else None
+        validade_para = (atual.validade_mes, atual.validade_ano) if atual is not None else None
+        if quantidade_de == quantidade_para and validade_de == validade_para:
+            continue
+
+        diferenca = (quantidade_para or 0) - (quantidade_de or 0)
+        if anterior is None:
+            totais['lotes_novos'] += 1
+        elif atual is None:
+            totais['lotes_removidos'] += 1
+        else:
+            totais['lotes_alterados'] += 1
+        totais['diferenca'] += diferenca
+
+        codigo, lote = chave
+        produto = produtos.get(codigo)
+        if produto is None:
+            produto = produtos[codigo] = {'codigo': codigo, 'diferenca': 0, 'lotes': []}
+        produto['diferenca'] += diferenca
+        produto['lotes'].append({
+            'lote': lote,
+            'quantidade_de': quantidade_de,
+            'quantidade_para': quantidade_para,
+            'diferenca': diferenca,
+            'validade_de': '%02d/%d' % validade_de if validade_de else None,
+            'validade_para': '%02d/%d' % validade_para if validade_para else None
+        })
+    totais['produtos'] = len(produtos)
+
+    return {
+        'de': de.rotulo if de is not None else ATUAL,
+        'para': para.rotulo if para is not None else ATUAL,
+        'totais': totais,
+        'produtos': list(produtos.values())
+    }
@@ -0,0 +1,82 @@
+from datetime import date
+
+from sqlalchemy import select
+
+from src.models.user import db
+from src.models.produto import Produto
+from src.models.lote import Lote
+
+MESES_PADRAO = 3
+MESES_MAXIMO = 120
+
+
+def chave_validade(mes, ano):
+    """Mesmo valor da coluna ``lotes.validade_chave`` (AAAAMM)."""
+    return ano * 100 + mes
+
+
+def somar_meses(mes, ano, meses):
+    total = ano * 12 + (mes - 1) + meses
+    return total % 12 + 1, total // 12
+
+
+def consultar_vencimento(meses=MESES_PADRAO, incluir_vencidos=True, hoje=None, sessao=None):
+    """Lotes com estoque que vencem nos próximos ``meses`` meses, agrupados por produto.
+
+    Um lote vale até o fim do mês da validade: vence no mês corrente se a
+    validade é o mês atual e está vencido se é anterior. Com
+    ``incluir_vencidos`` os vencidos também entram. A consulta é uma faixa no
+    índice ``ix_lotes_validade_chave``; os produtos saem na ordem do
+    vencimento mais próximo.
+    """
+    sessao = sessao or db.session
+    hoje = hoje or date.today()
+    atual = chave_validade(hoje.month, hoje.year)
+    mes_limite, ano_limite = somar_meses(hoje.month, hoje.year, meses)
+    limite = chave_validade(mes_limite, ano_limite)
+
+    faixa = Lote.validade_chave <= limite if incluir_vencidos else Lote.validade_chave.between(atual, limite)
+    stmt = (
+        select(Lote.produto_codigo, Produto.nome, Lote.lote, Lote.validade_mes, Lote.validade_ano,
+               Lote.validade_chave, Lote.quantidade)
+        .join(Produto, Produto.codigo == Lote.produto_codigo)
+        .where(faixa, Lote.quantidade > 0)
+        .order_by(Lote.validade_chave, Lote.produto_codigo, Lote.lote)
+    )
+
+    produtos = {}
+    totais = {'produtos': 0, 'lotes': 0, 'quantidade': 0, 'quantidade_vencida': 0}
+    for row in sessao.execute(stmt):
+        produto = produtos.get(row.produto_codigo)
+        if produto is None:
+            produto = produtos[row.produto_codigo] = {
+                'codigo': row.produto_codigo,
+                'nome': row.nome,
+                'quantidade': 0,
+                'quantidade_vencida': 0,
+                'lotes': []
+            }
+        vencido = row.validade_chave < atual
+        produto['lotes'].append({
+            'lote': row.lote,
+            'validade_mes': row.validade_mes,
+            'validade_ano': row.validade_ano,
+            'quantidade': row.quantidade,
+            'vencido': vencido
+        })
+        produto['quantidade'] += row.quantidade
+        totais['lotes'] += 1
+        totais['quantidade'] += row.quantidade
+        if vencido:
+            produto['quantidade_vencida'] += row.quantidade
+            totais['quantidade_vencida'] += row.quantidade
+    totais['produtos'] = len(produtos)
+
+    return {
+        'referencia': {'mes': hoje.month, 'ano': hoje.year},
+        'limite': {'mes': mes_limite, 'ano': ano_limite},
+        'meses': meses,
+        'incluir_vencidos': incluir_vencidos,
+        'totais': totais,
+        'produtos': list(produtos.values())
+    }
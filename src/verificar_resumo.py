@@ -0,0 +1,57 @@
+import argparse
+import sys
+import os
+
+# Adicionar o diretório pai ao path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from src.main import app
+from src.models.esquema import reconstruir_busca
+from src.services.depositos import engine_deposito, nomes_depositos
+from src.services.resumo_estoque import reconstruir_resumo, verificar_resumo
+
+def verificar_deposito(nome, catalogo, reconstruir):
+    """Confere os totais de um depósito; retorna se ficou consistente"""
+    engine = engine_deposito(nome)
+    divergencias = verificar_resumo(engine, catalogo)
+    
+    for item in divergencias['produtos']:
+        print(f"[{nome}] Produto {item['produto_codigo']}: esperado {item['esperado']}, registrado {item['atual']}")
+    for campo, valores in divergencias['totais'].items():
+        print(f"[{nome}] Total {campo}: esperado {valores['esperado']}, registrado {valores['atual']}")
+    
+    if not divergencias['produtos'] and not divergencias['totais']:
+        print(f"[{nome}] Totais de estoque consistentes.")
+        return True
+    
+    if reconstruir:
+        reconstruir_resumo(engine)
+        print(f"[{nome}] Totais reconstruídos a partir dos lotes.")
+        return True
+    
+    print(f"[{nome}] {len(divergencias['produtos'])} produto(s) com divergência. Use --reconstruir para corrigir.")
+    return False
+
+def main():
+    """Verifica (e opcionalmente reconstrói) os totais materializados de cada depósito e o índice de busca"""
+    parser = argparse.ArgumentParser(description='Verifica os totais de estoque contra a tabela de lotes')
+    parser.add_argument('--reconstruir', action='store_true', help='recalcula os totais a partir dos lotes')
+    parser.add_argument('--reindexar-busca', action='store_true', help='refaz o índice de busca de produtos')
+    args = parser.parse_args()
+    
+    with app.app_context():
+        if args.reindexar_busca:
+            if reconstruir_busca():
+                print("Índice de busca reconstruído.")
+            else:
+                print("Índice de busca indisponível (SQLite sem FTS5); a busca usa LIKE.")
+        
+        # O primeiro é o depósito padrão, no banco principal (o do catálogo)
+        nomes = nomes_depositos(app)
+        consistentes = [
+            verificar_deposito(nome, indice == 0, args.reconstruir) for indice, nome in enumerate(nomes)
+        ]
+        return 0 if all(consistentes) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
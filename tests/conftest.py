@@ -0,0 +1,25 @@
+"""Fixtures compartilhadas: banco SQLite temporário com o esquema e os triggers da aplicação."""
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from src.models.user import db
+from src.models import confirmacao, estoque_resumo, lote, produto, sincronizacao, snapshot, versao  # noqa: F401
+from src.models.esquema import preparar_esquema
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """Banco novo com as tabelas e os triggers da aplicação."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'estoque.db'}")
+    db.metadata.create_all(engine)
+    preparar_esquema(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def sessao(engine):
+    with Session(engine) as sessao:
+        yield sessao
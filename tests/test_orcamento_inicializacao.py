@@ -0,0 +1,65 @@
+"""Orçamento de inicialização de um worker da aplicação.
+
+Importa ``src.main`` em um processo novo (como faz cada worker do gunicorn sem
+``preload_app``), mede o tempo de importação e a memória residente máxima e
+confere que as bibliotecas pesadas de relatório e importação (pandas, numpy,
+openpyxl, reportlab) não foram carregadas. Falha se algum limite for
+ultrapassado.
+
+Uso:
+    python -m pytest tests/test_orcamento_inicializacao.py
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MAX_SEGUNDOS = 2.0
+MAX_RSS_MB = 100.0
+REPETICOES = 3
+
+MODULOS_PESADOS = ['pandas', 'numpy', 'openpyxl', 'reportlab']
+
+# Executado no processo filho: importa a aplicação e devolve as medidas em JSON
+SCRIPT_MEDICAO = """
+import json, resource, sys, time
+inicio = time.perf_counter()
+import src.main
+segundos = time.perf_counter() - inicio
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+pesados = [m for m in %r if m in sys.modules]
+print(json.dumps({'segundos': segundos, 'rss_mb': rss_kb / 1024, 'modulos_pesados': pesados}))
+"""
+
+
+@pytest.fixture(scope='module')
+def medida(tmp_path_factory):
+    """Importa ``src.main`` ``REPETICOES`` vezes; melhor tempo e maior RSS."""
+    diretorio = tmp_path_factory.mktemp('estoque_inicio')
+    ambiente = dict(os.environ, DATABASE_PATH=str(diretorio / 'app.db'))
+    medidas = []
+    for _ in range(REPETICOES):
+        saida = subprocess.run(
+            [sys.executable, '-c', SCRIPT_MEDICAO % (MODULOS_PESADOS,)],
+            cwd=RAIZ, env=ambiente, capture_output=True, text=True, check=True
+        )
+        medidas.append(json.loads(saida.stdout.strip().splitlines()[-1]))
+    melhor = min(medidas, key=lambda m: m['segundos'])
+    melhor['rss_mb'] = max(m['rss_mb'] for m in medidas)
+    return melhor
+
+
+def test_tempo_de_importacao(medida):
+    assert medida['segundos'] <= MAX_SEGUNDOS, f"importação de src.main levou {medida['segundos']:.3f}s"
+
+
+def test_memoria_residente(medida):
+    assert medida['rss_mb'] <= MAX_RSS_MB, f"RSS máximo de {medida['rss_mb']:.1f} MB"
+
+
+def test_sem_bibliotecas_pesadas(medida):
+    assert medida['modulos_pesados'] == [], f"carregados na inicialização: {', '.join(medida['modulos_pesados'])}"
@@ -0,0 +1,143 @@
+"""Totais materializados do estoque e versão mantidos pelos triggers.
+
+Cada teste escreve em ``produtos`` e ``lotes`` de um banco temporário e
+compara ``estoque_produtos`` e ``estoque_totais`` com os totais recalculados
+a partir dos lotes, e confere que cada escrita avança ``estoque_versao``.
+
+Uso:
+    python -m pytest tests/test_resumo_estoque.py
+"""
+import pytest
+from sqlalchemy import text
+
+from src.services.resumo_estoque import verificar_resumo
+
+
+def _executar(engine, *comandos):
+    """Executa os comandos SQL em uma única transação."""
+    with engine.begin() as conexao:
+        for comando, parametros in comandos:
+            conexao.execute(text(comando), parametros)
+
+
+def _produto(codigo, nome='Produto'):
+    return 'INSERT INTO produtos (codigo, nome) VALUES (:codigo, :nome)', {'codigo': codigo, 'nome': nome}
+
+
+def _lote(produto_codigo, nome, quantidade):
+    return (
+        'INSERT INTO lotes (produto_codigo, lote, validade_mes, validade_ano, quantidade, data_cadastro) '
+        'VALUES (:produto_codigo, :lote, 1, 2030, :quantidade, CURRENT_TIMESTAMP)',
+        {'produto_codigo': produto_codigo, 'lote': nome, 'quantidade': quantidade}
+    )
+
+
+def _versao(engine):
+    with engine.connect() as conexao:
+        return conexao.execute(text('SELECT versao FROM estoque_versao WHERE id = 1')).scalar()
+
+
+def _conferir(engine):
+    """Compara os totais materializados com os recalculados dos lotes."""
+    with engine.connect() as conexao:
+        esperado = {
+            codigo: (quantidade, lotes)
+            for codigo, quantidade, lotes in conexao.execute(text(
+                'SELECT produto_codigo, SUM(quantidade), COUNT(*) FROM lotes GROUP BY produto_codigo'
+            ))
+        }
+        materializado = {
+            codigo: (quantidade, lotes)
+            for codigo, quantidade, lotes in conexao.execute(text(
+                'SELECT produto_codigo, quantidade_total, total_lotes FROM estoque_produtos'
+            ))
+            if (quantidade, lotes) != (0, 0)
+        }
+        totais = conexao.execute(text(
+            'SELECT total_produtos, produtos_com_estoque, quantidade_total, total_lotes '
+            'FROM estoque_totais WHERE id = 1'
+        )).one()
+        total_produtos = conexao.execute(text('SELECT COUNT(*) FROM produtos')).scalar()
+
+    assert materializado == esperado
+    assert tuple(totais) == (
+        total_produtos,
+        sum(1 for quantidade, _ in esperado.values() if quantidade > 0),
+        sum(quantidade for quantidade, _ in esperado.values()),
+        sum(lotes for _, lotes in esperado.values()),
+    )
+    assert verificar_resumo(engine) == {'produtos': [], 'totais': {}}
+
+
+def test_insercao(engine):
+    versao = _versao(engine)
+    _executar(engine, _produto('A'), _produto('B'), _produto('C'), _lote('A', 'L1', 10), _lote('A', 'L2', 5),
+              _lote('B', 'L1', 0))
+    _conferir(engine)
+    assert _versao(engine) > versao
+
+
+def test_atualizacao_da_quantidade(engine):
+    _executar(engine, _produto('A'), _produto('B'), _lote('A', 'L1', 10), _lote('B', 'L1', 3))
+    versao = _versao(engine)
+
+    _executar(engine, ("UPDATE lotes SET quantidade = 0 WHERE produto_codigo = 'A'", {}))
+    _conferir(engine)
+    assert _versao(engine) > versao
+
+    versao = _versao(engine)
+    _executar(engine, ("UPDATE lotes SET quantidade = quantidade + 7", {}))
+    _conferir(engine)
+    assert _versao(engine) > versao
+
+
+def test_remocao(engine):
+    _executar(engine, _produto('A'), _produto('B'), _lote('A', 'L1', 10), _lote('A', 'L2', 4), _lote('B', 'L1', 3))
+    versao = _versao(engine)
+
+    _executar(engine, ("DELETE FROM lotes WHERE produto_codigo = 'A' AND lote = 'L1'", {}))
+    _conferir(engine)
+    assert _versao(engine) > versao
+
+    versao = _versao(engine)
+    _executar(
+        engine,
+        ("DELETE FROM lotes WHERE produto_codigo = 'B'", {}),
+        ("DELETE FROM produtos WHERE codigo = 'B'", {}),
+    )
+    _conferir(engine)
+    assert _versao(engine) > versao
+
+
+def test_renomear_produto(engine):
+    _executar(engine, _produto('A'), _produto('B'), _lote('A', 'L1', 10), _lote('A', 'L2', 4), _lote('B', 'L1', 3))
+    versao = _versao(engine)
+
+    # Como a rota de produtos: o código muda e os lotes acompanham na mesma transação
+    _executar(
+        engine,
+        ('PRAGMA defer_foreign_keys = ON', {}),
+        ("UPDATE produtos SET codigo = 'A2' WHERE codigo = 'A'", {}),
+        ("UPDATE lotes SET produto_codigo = 'A2' WHERE produto_codigo = 'A'", {}),
+    )
+    _conferir(engine)
+    assert _versao(engine) > versao
+
+
+def test_mover_lote_entre_produtos(engine):
+    _executar(engine, _produto('A'), _produto('B'), _lote('A', 'L1', 10), _lote('A', 'L2', 4))
+
+    _executar(engine, ("UPDATE lotes SET produto_codigo = 'B' WHERE lote = 'L2'", {}))
+    _conferir(engine)
+
+
+def test_transacao_desfeita_nao_altera_totais(engine):
+    _executar(engine, _produto('A'), _lote('A', 'L1', 10))
+    versao = _versao(engine)
+
+    with pytest.raises(RuntimeError):
+        with engine.begin() as conexao:
+            conexao.execute(text("UPDATE lotes SET quantidade = 99"))
+            raise RuntimeError('desfaz')
+    _conferir(engine)
+    assert _versao(engine) == versao
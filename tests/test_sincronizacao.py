@@ -0,0 +1,164 @@
+"""Sincronização incremental (``/sync``) por ``seq``.
+
+Escreve produtos e lotes em um banco temporário e confere que
+``alteracoes_desde`` devolve só o que mudou depois de ``since``, que as
+páginas cortadas por ``limite`` não perdem nem repetem linhas e que as
+remoções aparecem em ``remocoes``. Uma réplica montada só a partir das
+páginas deve terminar igual ao banco.
+
+Uso:
+    python -m pytest tests/test_sincronizacao.py
+"""
+from sqlalchemy import delete, select, update
+
+from src.models.esquema import obter_versao
+from src.models.lote import Lote
+from src.models.produto import Produto
+from src.services.sincronizacao import alteracoes_desde
+
+
+def _lote(produto_codigo, nome, quantidade):
+    return Lote(produto_codigo=produto_codigo, lote=nome, validade_mes=1, validade_ano=2030, quantidade=quantidade)
+
+
+def _popular(sessao, produtos=3, lotes_por_produto=3):
+    for i in range(produtos):
+        sessao.add(Produto(codigo=f'P{i}', nome=f'Produto {i}'))
+        sessao.add_all(_lote(f'P{i}', f'L{j}', j) for j in range(lotes_por_produto))
+    sessao.commit()
+
+
+def _estado(sessao):
+    """Produtos e lotes do banco no formato da réplica."""
+    produtos = dict(sessao.execute(select(Produto.codigo, Produto.nome)).tuples().all())
+    lotes = {
+        row.id: (row.produto_codigo, row.lote, row.quantidade)
+        for row in sessao.execute(select(Lote.id, Lote.produto_codigo, Lote.lote, Lote.quantidade))
+    }
+    return produtos, lotes
+
+
+def _aplicar(replica, pagina):
+    produtos, lotes = replica
+    for produto in pagina['produtos']:
+        produtos[produto['codigo']] = produto['nome']
+    for lote in pagina['lotes']:
+        lotes[lote['id']] = (lote['produto_codigo'], lote['lote'], lote['quantidade'])
+    for codigo in pagina['remocoes']['produtos']:
+        produtos.pop(codigo, None)
+    for lote_id in pagina['remocoes']['lotes']:
+        lotes.pop(lote_id, None)
+
+
+def _sincronizar(sessao, replica, since, limite):
+    """Pede páginas até ``mais`` ser falso; retorna o último ``seq`` e as páginas."""
+    paginas = []
+    while True:
+        pagina = alteracoes_desde(since, limite, sessao)
+        paginas.append(pagina)
+        _aplicar(replica, pagina)
+        since = pagina['seq']
+        if not pagina['mais']:
+            return since, paginas
+
+
+def _seqs(pagina):
+    return [row['seq'] for nome in ('produtos', 'lotes') for row in pagina[nome]]
+
+
+def test_primeira_sincronizacao_traz_tudo(sessao):
+    _popular(sessao)
+
+    pagina = alteracoes_desde(0, 1000, sessao)
+
+    assert pagina['mais'] is False
+    assert pagina['seq'] == obter_versao(sessao)
+    assert len(pagina['produtos']) == 3
+    assert len(pagina['lotes']) == 9
+    assert pagina['remocoes'] == {'produtos': [], 'lotes': []}
+
+
+def test_since_traz_so_o_que_mudou(sessao):
+    _popular(sessao)
+    since = alteracoes_desde(0, 1000, sessao)['seq']
+
+    sessao.execute(update(Lote).where(Lote.produto_codigo == 'P1', Lote.lote == 'L2').values(quantidade=50))
+    sessao.commit()
+    pagina = alteracoes_desde(since, 1000, sessao)
+
+    assert pagina['produtos'] == []
+    assert [(lote['produto_codigo'], lote['lote'], lote['quantidade']) for lote in pagina['lotes']] == [('P1', 'L2', 50)]
+    assert all(seq > since for seq in _seqs(pagina))
+    assert alteracoes_desde(pagina['seq'], 1000, sessao)['lotes'] == []
+
+
+def test_corte_por_limite_nao_perde_nem_repete(sessao):
+    _popular(sessao, produtos=5, lotes_por_produto=4)
+
+    replica = ({}, {})
+    seq, paginas = _sincronizar(sessao, replica, 0, 3)
+
+    assert len(paginas) > 1
+    assert all(pagina['mais'] for pagina in paginas[:-1])
+    vistos = [s for pagina in paginas for s in _seqs(pagina)]
+    assert len(vistos) == len(set(vistos)) == 25
+    for pagina in paginas:
+        assert all(pagina['since'] < s <= pagina['seq'] for s in _seqs(pagina))
+        assert len(pagina['produtos']) <= 3 and len(pagina['lotes']) <= 3
+    assert seq == obter_versao(sessao)
+    assert replica == _estado(sessao)
+
+
+def test_remocoes(sessao):
+    _popular(sessao)
+    since = alteracoes_desde(0, 1000, sessao)['seq']
+    removido = sessao.execute(select(Lote.id).where(Lote.produto_codigo == 'P0', Lote.lote == 'L1')).scalar()
+
+    sessao.execute(delete(Lote).where(Lote.id == removido))
+    sessao.execute(delete(Lote).where(Lote.produto_codigo == 'P2'))
+    sessao.execute(delete(Produto).where(Produto.codigo == 'P2'))
+    sessao.commit()
+    pagina = alteracoes_desde(since, 1000, sessao)
+
+    assert pagina['remocoes']['produtos'] == ['P2']
+    assert removido in pagina['remocoes']['lotes']
+    assert len(pagina['remocoes']['lotes']) == 4
+    assert pagina['produtos'] == [] and pagina['lotes'] == []
+
+
+def test_produto_recriado_sai_das_remocoes(sessao):
+    _popular(sessao, produtos=1, lotes_por_produto=0)
+    since = alteracoes_desde(0, 1000, sessao)['seq']
+
+    sessao.execute(delete(Produto).where(Produto.codigo == 'P0'))
+    sessao.commit()
+    sessao.add(Produto(codigo='P0', nome='De volta'))
+    sessao.commit()
+    pagina = alteracoes_desde(since, 1000, sessao)
+
+    assert pagina['remocoes']['produtos'] == []
+    assert [produto['nome'] for produto in pagina['produtos']] == ['De volta']
+
+
+def test_replica_acompanha_escritas_e_remocoes(sessao):
+    _popular(sessao, produtos=4, lotes_por_produto=3)
+    replica = ({}, {})
+    seq, _ = _sincronizar(sessao, replica, 0, 2)
+
+    # Escritas, remoções e a renomeação de um produto (com os lotes) depois do primeiro sync
+    sessao.execute(update(Lote).where(Lote.lote == 'L0').values(quantidade=Lote.quantidade + 10))
+    sessao.execute(delete(Lote).where(Lote.produto_codigo == 'P3'))
+    sessao.execute(delete(Produto).where(Produto.codigo == 'P3'))
+    sessao.add(Produto(codigo='P9', nome='Novo'))
+    sessao.add(_lote('P9', 'L0', 7))
+    sessao.commit()
+    sessao.execute(update(Produto).where(Produto.codigo == 'P1').values(codigo='P1B'))
+    sessao.execute(update(Lote).where(Lote.produto_codigo == 'P1').values(produto_codigo='P1B'))
+    sessao.commit()
+
+    seq, paginas = _sincronizar(sessao, replica, seq, 2)
+
+    assert len(paginas) > 1
+    assert 'P1' in [c for pagina in paginas for c in pagina['remocoes']['produtos']]
+    assert seq == obter_versao(sessao)
+    assert replica == _estado(sessao)
@@ -0,0 +1,119 @@
+"""Snapshots gravados como checkpoint completo mais deltas.
+
+Cria uma sequência de snapshots de um banco temporário, alterando, criando e
+removendo lotes entre eles, e guarda uma cópia completa dos lotes a cada
+snapshot. O estado reconstruído de cada snapshot (checkpoint com os deltas
+da cadeia aplicados) deve ser igual à cópia, inclusive depois de um novo
+checkpoint, e a comparação entre dois snapshots deve bater com a diferença
+entre as cópias.
+
+Uso:
+    python -m pytest tests/test_snapshots.py
+"""
+import random
+
+import pytest
+from sqlalchemy import delete, select
+
+from src.models.lote import Lote
+from src.models.produto import Produto
+from src.services.snapshots import comparar_snapshots, criar_snapshot, estado_snapshot
+
+PRODUTOS = 10
+LOTES_POR_PRODUTO = 6
+CHECKPOINT_A_CADA = 3
+SNAPSHOTS = 8
+
+
+def _copia(sessao):
+    """Cópia completa dos lotes: ``(produto, lote) -> (mes, ano, quantidade)``."""
+    return {
+        (lote.produto_codigo, lote.lote): (lote.validade_mes, lote.validade_ano, lote.quantidade)
+        for lote in sessao.scalars(select(Lote))
+    }
+
+
+def _reconstruido(snapshot, sessao, produto_codigo=None):
+    return {
+        (lote['produto_codigo'], lote['lote']): (lote['validade_mes'], lote['validade_ano'], lote['quantidade'])
+        for lote in estado_snapshot(snapshot, produto_codigo, sessao)
+    }
+
+
+def _alterar(sessao, rnd):
+    """Algumas escritas: quantidades, uma validade, um lote novo e uma remoção."""
+    lotes = sessao.scalars(select(Lote).order_by(Lote.id)).all()
+    for lote in rnd.sample(lotes, 3):
+        lote.quantidade = rnd.randint(0, 100)
+    rnd.choice(lotes).validade_ano += 1
+    removido = rnd.choice(lotes)
+    sessao.execute(delete(Lote).where(Lote.id == removido.id))
+    produto = f'P{rnd.randrange(PRODUTOS)}'
+    # Às vezes recria um lote removido antes (mesma chave)
+    nome = rnd.choice([removido.lote, f'N{rnd.randrange(1000)}'])
+    if sessao.scalar(select(Lote.id).where(Lote.produto_codigo == produto, Lote.lote == nome)) is None:
+        sessao.add(Lote(produto_codigo=produto, lote=nome, validade_mes=rnd.randint(1, 12),
+                        validade_ano=2030, quantidade=rnd.randint(1, 50)))
+    sessao.commit()
+
+
+@pytest.fixture
+def historico(sessao):
+    """``[(snapshot, cópia dos lotes)]`` de ``SNAPSHOTS`` snapshots com escritas entre eles."""
+    rnd = random.Random(0)
+    for i in range(PRODUTOS):
+        sessao.add(Produto(codigo=f'P{i}', nome=f'Produto {i}'))
+        sessao.add_all(
+            Lote(produto_codigo=f'P{i}', lote=f'L{j}', validade_mes=rnd.randint(1, 12), validade_ano=2030,
+                 quantidade=rnd.randint(0, 100))
+            for j in range(LOTES_POR_PRODUTO)
+        )
+    sessao.commit()
+
+    historico = []
+    for i in range(SNAPSHOTS):
+        snapshot = criar_snapshot(f's{i}', CHECKPOINT_A_CADA, sessao)
+        sessao.commit()
+        historico.append((snapshot, _copia(sessao)))
+        _alterar(sessao, rnd)
+    return historico
+
+
+def test_cadeia_de_deltas_e_checkpoints(historico):
+    tipos = [snapshot.completo for snapshot, _ in historico]
+    # Completo, três deltas e um novo checkpoint, e assim por diante
+    assert tipos == [True, False, False, False, True, False, False, False]
+    checkpoint = historico[0][0].id
+    assert all(snapshot.checkpoint_id == checkpoint for snapshot, _ in historico[1:4])
+
+
+def test_reconstrucao_igual_a_copia(sessao, historico):
+    for snapshot, copia in historico:
+        assert _reconstruido(snapshot, sessao) == copia, snapshot.rotulo
+        assert snapshot.total_lotes == len(copia)
+
+
+def test_reconstrucao_de_um_produto(sessao, historico):
+    snapshot, copia = historico[3]
+    esperado = {chave: valor for chave, valor in copia.items() if chave[0] == 'P2'}
+    assert _reconstruido(snapshot, sessao, 'P2') == esperado
+
+
+@pytest.mark.parametrize('de, para', [(0, 3), (1, 2), (2, 6), (5, 7), (7, None)])
+def test_comparacao_entre_snapshots(sessao, historico, de, para):
+    snapshot_de, antes = historico[de]
+    snapshot_para, depois = historico[para] if para is not None else (None, _copia(sessao))
+
+    diferenca = comparar_snapshots(snapshot_de, snapshot_para, sessao)
+
+    esperado = {
+        chave: (antes[chave][2] if chave in antes else None, depois[chave][2] if chave in depois else None)
+        for chave in antes.keys() | depois.keys()
+        if antes.get(chave) != depois.get(chave)
+    }
+    obtido = {
+        (produto['codigo'], lote['lote']): (lote['quantidade_de'], lote['quantidade_para'])
+        for produto in diferenca['produtos']
+        for lote in produto['lotes']
+    }
+    assert obtido == esperado